@@ -0,0 +1,69 @@
+"""Compare recall@k and queries per second of `HNSWVectorDB` against the exact `NumpyVectorDB`.
+
+Usage: python benchmarks/hnsw_recall.py --n 20000 --dim 128 --ef 16 32 64 128
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import HNSWVectorDB, NumpyVectorDB
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.normal(size=(args.n, args.dim)).astype(np.float32)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    exact = NumpyVectorDB(metric=args.metric)
+    hnsw = HNSWVectorDB(
+        metric=args.metric, M=args.M, ef_construction=args.ef_construction, seed=0
+    )
+
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        await exact.insert(
+            VectorDBInsert(id=str(i), text=str(i), embedding=vector.tolist())
+        )
+    print(f"exact build: {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    for i, vector in enumerate(vectors):
+        await hnsw.insert(
+            VectorDBInsert(id=str(i), text=str(i), embedding=vector.tolist())
+        )
+    print(f"hnsw build:  {time.perf_counter() - start:.1f}s")
+
+    requests = [
+        VectorDBGetSimilar(embedding=query.tolist(), n_results=args.k)
+        for query in queries
+    ]
+    start = time.perf_counter()
+    truth = [{doc.id for _, doc in await exact.get_similar(r)} for r in requests]
+    print(f"exact: {len(requests) / (time.perf_counter() - start):.0f} QPS")
+
+    print(f"{'ef_search':>10} {'recall@' + str(args.k):>10} {'QPS':>8}")
+    for ef in args.ef:
+        hnsw.ef_search = ef
+        found = 0
+        start = time.perf_counter()
+        for request, expected in zip(requests, truth):
+            results = await hnsw.get_similar(request)
+            found += len({doc.id for _, doc in results} & expected)
+        qps = len(requests) / (time.perf_counter() - start)
+        print(f"{ef:>10} {found / (args.k * len(requests)):>10.3f} {qps:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--M", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument(
+        "--metric", choices=[m.value for m in DistanceMetric], default="cosine"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
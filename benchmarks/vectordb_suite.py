@@ -0,0 +1,313 @@
+"""Benchmark `VectorDB` implementations: build throughput, recall@k, query latency, QPS and peak memory.
+
+Every database runs in a fresh process, so that its peak RSS is measured on its own.
+Results are written as JSON for regression tracking.
+
+Usage:
+    python benchmarks/vectordb_suite.py --dataset clustered --n 50000 --dim 128 \\
+        --db flat "hnsw:M=16,ef_search=64" "ivfpq:n_lists=256,n_subvectors=16,rerank=100" \\
+        --out results.json
+
+Databases are given as `name` or `name:param=value,...` with names: flat, hnsw, ivfpq, mmap, sharded.
+The shards of `sharded` are flat databases, or another one given as eg: `sharded:n_shards=4,shard_factory=hnsw`.
+`serial_qps` is measured one query at a time. `concurrent_qps` (per `--concurrency` level) is only measured
+for sharded databases, the others search synchronously in-process and would only be serialized by the event loop.
+Datasets are `random`, `clustered` or `file` (`--path` to a .npy, .npz with `vectors`/`queries` arrays, or .fvecs file).
+"""
+import argparse
+import ast
+import asyncio
+import concurrent.futures
+import functools
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.vectors import normalize, score_matrix, top_k_rows
+from embedia.vectordbs import (
+    HNSWVectorDB,
+    IVFPQVectorDB,
+    MmapVectorDB,
+    NumpyVectorDB,
+    ShardedVectorDB,
+)
+
+DATABASES = {
+    "flat": NumpyVectorDB,
+    "hnsw": HNSWVectorDB,
+    "ivfpq": IVFPQVectorDB,
+    "mmap": MmapVectorDB,
+    "sharded": ShardedVectorDB,
+}
+
+
+def random_dataset(
+    n: int, dim: int, n_queries: int, seed: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    queries = rng.normal(size=(n_queries, dim)).astype(np.float32)
+    return vectors, queries
+
+
+def clustered_dataset(
+    n: int, dim: int, n_queries: int, seed: int, n_clusters: int, spread: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Closer to real embeddings than random data, where every point is about equally far from every other
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = rng.integers(n_clusters, size=n + n_queries)
+    points = centers[labels] + spread * rng.normal(size=(n + n_queries, dim))
+    points = points.astype(np.float32)
+    return points[:n], points[n:]
+
+
+def file_dataset(path: str, n_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Without stored queries, the last `n_queries` vectors are held out as queries
+    if path.endswith(".fvecs"):
+        raw = np.fromfile(path, dtype=np.int32)
+        dim = raw[0]
+        vectors = raw.reshape(-1, dim + 1)[:, 1:].view(np.float32)
+    else:
+        data = np.load(path)
+        if isinstance(data, np.ndarray):
+            vectors = data
+        else:
+            with data:
+                if "queries" in data:
+                    return (
+                        data["vectors"].astype(np.float32),
+                        data["queries"][:n_queries].astype(np.float32),
+                    )
+                vectors = data["vectors"]
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return vectors[:-n_queries], vectors[-n_queries:]
+
+
+def ground_truth(
+    vectors: np.ndarray, queries: np.ndarray, k: int, metric: DistanceMetric
+) -> np.ndarray:
+    """Return the rows of the exact `k` nearest vectors of every query."""
+    if metric == DistanceMetric.cosine:
+        vectors, queries = normalize(vectors), normalize(queries)
+    sq_norms = (vectors**2).sum(axis=1)
+    chunk_size = max(1, (1 << 24) // len(vectors))
+    return np.concatenate(
+        [
+            top_k_rows(
+                score_matrix(vectors, queries[i : i + chunk_size], metric, sq_norms), k
+            )
+            for i in range(0, len(queries), chunk_size)
+        ]
+    )
+
+
+def parse_spec(spec: str) -> Tuple[str, Dict[str, Any]]:
+    name, _, params = spec.partition(":")
+    if name not in DATABASES:
+        raise ValueError(f"Unknown database: {name}, expected one of {list(DATABASES)}")
+    kwargs = {}
+    for param in filter(None, params.split(",")):
+        key, _, value = param.partition("=")
+        try:
+            kwargs[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            kwargs[key] = value
+    return name, kwargs
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+async def run_one(spec: str, data_path: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    with np.load(data_path) as data:
+        vectors, queries, truth = data["vectors"], data["queries"], data["truth"]
+    baseline_rss = rss_mb()
+    name, kwargs = parse_spec(spec)
+    if name == "sharded":
+        # The shards are compared with the same metric as the ground truth.
+        # `shard_factory` names one of the other databases, flat by default
+        shard_name = kwargs.pop("shard_factory", "flat")
+        if shard_name not in DATABASES or shard_name in ("sharded", "mmap"):
+            raise ValueError(f"Unknown shard database: {shard_name}")
+        kwargs["shard_factory"] = functools.partial(
+            DATABASES[shard_name], metric=args["metric"]
+        )
+    else:
+        kwargs.setdefault("metric", args["metric"])
+    with tempfile.TemporaryDirectory() as directory:
+        if name == "mmap":
+            kwargs.setdefault("path", os.path.join(directory, "db"))
+        db = DATABASES[name](**kwargs)
+        try:
+            result = await measure(db, vectors, queries, truth, args)
+            # Sharded databases hold their data in worker processes, which are not counted
+            return {
+                "db": spec,
+                **result,
+                "peak_rss_mb": round(rss_mb(), 1),
+                "rss_growth_mb": round(rss_mb() - baseline_rss, 1),
+            }
+        finally:
+            if hasattr(db, "close"):
+                db.close()
+
+
+async def search(db, request: VectorDBGetSimilar, semaphore: asyncio.Semaphore) -> None:
+    async with semaphore:
+        await db.get_similar(request)
+
+
+async def measure(
+    db, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, args: Dict
+) -> Dict[str, Any]:
+    k, batch_size = args["k"], args["batch_size"]
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch_size):
+        await db.insert_many(
+            [
+                VectorDBInsert(id=str(row), text="", embedding=vector)
+                for row, vector in enumerate(vectors[i : i + batch_size].tolist(), i)
+            ]
+        )
+    build_seconds = time.perf_counter() - start
+
+    requests = [
+        VectorDBGetSimilar(embedding=query, n_results=k) for query in queries.tolist()
+    ]
+    latencies, found = [], 0
+    for request, expected in zip(requests, truth):
+        start = time.perf_counter()
+        results = await db.get_similar(request)
+        latencies.append(time.perf_counter() - start)
+        found += len({int(doc.id) for _, doc in results} & set(expected.tolist()))
+
+    # The other databases search synchronously in this process, so concurrent searches would only
+    # be serialized by the event loop. Only sharded searches run in parallel, in the workers
+    concurrent_qps = None
+    if isinstance(db, ShardedVectorDB):
+        concurrent_qps = {}
+        for concurrency in args["concurrency"]:
+            semaphore = asyncio.Semaphore(concurrency)
+            start = time.perf_counter()
+            await asyncio.gather(
+                *[search(db, request, semaphore) for request in requests]
+            )
+            concurrent_qps[str(concurrency)] = round(
+                len(requests) / (time.perf_counter() - start), 1
+            )
+    start = time.perf_counter()
+    await db.get_similar_many(requests)
+    batch_qps = len(requests) / (time.perf_counter() - start)
+
+    return {
+        "build_seconds": round(build_seconds, 3),
+        "inserts_per_second": round(len(vectors) / build_seconds, 1),
+        f"recall@{k}": round(found / (k * len(requests)), 4),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p99": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        },
+        "serial_qps": round(len(latencies) / sum(latencies), 1),
+        "concurrent_qps": concurrent_qps,
+        "batch_qps": round(batch_qps, 1),
+    }
+
+
+def run_in_process(spec: str, data_path: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    return asyncio.run(run_one(spec, data_path, args))
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.dataset == "random":
+        vectors, queries = random_dataset(args.n, args.dim, args.queries, args.seed)
+    elif args.dataset == "clustered":
+        vectors, queries = clustered_dataset(
+            args.n, args.dim, args.queries, args.seed, args.clusters, args.spread
+        )
+    else:
+        if not args.path:
+            raise ValueError("--path is required for --dataset file")
+        vectors, queries = file_dataset(args.path, args.queries)
+    metric = DistanceMetric(args.metric)
+    start = time.perf_counter()
+    truth = ground_truth(vectors, queries, args.k, metric)
+    print(f"ground truth: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    settings = {
+        "k": args.k,
+        "metric": metric.value,
+        "batch_size": args.batch_size,
+        "concurrency": args.concurrency,
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, "data.npz")
+        np.savez(data_path, vectors=vectors, queries=queries, truth=truth)
+        for spec in args.db:
+            with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=mp.get_context("spawn")
+            ) as pool:
+                result = pool.submit(run_in_process, spec, data_path, settings).result()
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "dataset": {
+            "kind": args.dataset,
+            "path": args.path,
+            "n": len(vectors),
+            "dim": vectors.shape[1],
+            "queries": len(queries),
+            "seed": args.seed,
+        },
+        "settings": settings,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", nargs="+", default=["flat", "hnsw"])
+    parser.add_argument(
+        "--dataset", choices=["random", "clustered", "file"], default="clustered"
+    )
+    parser.add_argument("--path", default=None)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--metric", choices=[m.value for m in DistanceMetric], default="cosine"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None)
+    main(parser.parse_args())
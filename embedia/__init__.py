@@ -1,5 +1,6 @@
 __version__ = "0.0.3"
 
+from .core.cache import EmbeddingCache, LLMCache
 from .core.chatllm import ChatLLM
 from .core.embedding import EmbeddingModel
 from .core.llm import LLM
@@ -7,12 +8,15 @@ from .core.tokenizer import Tokenizer
 from .core.tool import Tool
 from .core.vectordb import VectorDB
 from .schema.agent import Action, Step
+from .schema.context import ContextPolicy
 from .schema.message import Message, MessageRole
 from .schema.persona import Persona
 from .schema.pubsub import Event
+from .schema.retriever import FusionMethod
+from .schema.scheduler import Priority
 from .schema.textdoc import TextDoc
 from .schema.tool import ParamDocumentation, ToolDocumentation, ToolReturn
-from .schema.vectordb import VectorDBGetSimilar, VectorDBInsert
+from .schema.vectordb import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
 from .utils.file_callback import setup_file_callback
 from .utils.print_callback import setup_print_callback
 from .utils.pubsub import subscribe_event
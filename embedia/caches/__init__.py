@@ -0,0 +1,3 @@
+from .embedding import SQLiteEmbeddingCache
+from .lru import LRUCache
+from .semantic import SemanticCache
@@ -0,0 +1,178 @@
+import sqlite3
+import time
+from typing import Any, Callable, List, Optional, Union
+
+import numpy as np
+from embedia.core.cache import EmbeddingCache
+from embedia.utils.hashing import content_hash
+from embedia.utils.typechecking import check_min_val
+
+# SQLite limits the no. of parameters in one statement
+_MAX_PARAMS = 500
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """A persistent embedding cache that stores the vectors as float32 blobs in SQLite.
+    Entries are keyed on a hash of the model identity and the input, so unchanged texts are never embedded twice.
+    Embeddings come back from the cache rounded to float32.
+
+    Attributes
+    ----------
+    - `db_path` (str): The path to the SQLite file. ":memory:" keeps the cache in memory.
+    - `max_size` (int): The max no. of entries. The least recently used entries are evicted first. None means there is no limit.
+    - `ttl` (float): The no. of seconds after which an entry expires. None means entries never expire.
+    - `hits` (int): The no. of inputs found in the cache.
+    - `misses` (int): The no. of inputs not found in the cache.
+    """
+
+    def __init__(
+        self,
+        db_path: str = ":memory:",
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Constructor for the `SQLiteEmbeddingCache` class.
+
+        Parameters
+        ----------
+        - `db_path` (str, optional): The path to the SQLite file. Defaults to ":memory:".
+        - `max_size` (int, optional): The max no. of entries. Defaults to None (no limit).
+        - `ttl` (float, optional): The no. of seconds after which an entry expires. Defaults to None (never).
+        - `clock` (Callable, optional): Returns the current time in seconds. Defaults to `time.time`.
+        """
+        super().__init__()
+        if max_size is not None:
+            check_min_val(max_size, 1, "max_size")
+        self.db_path = db_path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embedding_cache (
+                KEY TEXT PRIMARY KEY, VECTOR BLOB,
+                CREATED_AT REAL, ACCESSED_AT REAL)"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embedding_cache_accessed ON embedding_cache (ACCESSED_AT)"
+        )
+        self._conn.commit()
+        self._rows = self._conn.execute(
+            "SELECT COUNT(*) FROM embedding_cache"
+        ).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @staticmethod
+    def _key(model_id: str, input: Union[List[Any], str]) -> str:
+        if isinstance(input, str):
+            return content_hash(model_id, "text", input)
+        return content_hash(model_id, "tokens", repr(list(input)))
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and self.clock() - created_at > self.ttl
+
+    async def _get_many(
+        self, model_id: str, inputs: List[Union[List[Any], str]]
+    ) -> List[Optional[List[float]]]:
+        keys = [self._key(model_id, input) for input in inputs]
+        rows = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), _MAX_PARAMS):
+            chunk = unique_keys[i : i + _MAX_PARAMS]
+            rows.update(
+                (row[0], row[1:])
+                for row in self._conn.execute(
+                    f"""SELECT KEY, VECTOR, CREATED_AT FROM embedding_cache
+                    WHERE KEY IN ({",".join("?" * len(chunk))})""",
+                    chunk,
+                )
+            )
+
+        expired = [
+            key for key, (_, created_at) in rows.items() if self._expired(created_at)
+        ]
+        for key in expired:
+            del rows[key]
+        if expired:
+            self._conn.executemany(
+                "DELETE FROM embedding_cache WHERE KEY = ?", [(key,) for key in expired]
+            )
+            self._rows -= len(expired)
+        if rows:
+            now = self.clock()
+            self._conn.executemany(
+                "UPDATE embedding_cache SET ACCESSED_AT = ? WHERE KEY = ?",
+                [(now, key) for key in rows],
+            )
+        self._conn.commit()
+
+        embeddings = []
+        for key in keys:
+            row = rows.get(key)
+            if row is None:
+                self.misses += 1
+                embeddings.append(None)
+            else:
+                self.hits += 1
+                embeddings.append(np.frombuffer(row[0], dtype=np.float32).tolist())
+        return embeddings
+
+    async def _set_many(
+        self,
+        model_id: str,
+        inputs: List[Union[List[Any], str]],
+        embeddings: List[List[float]],
+    ) -> None:
+        now = self.clock()
+        entries = {
+            self._key(model_id, input): np.asarray(
+                embedding, dtype=np.float32
+            ).tobytes()
+            for input, embedding in zip(inputs, embeddings)
+        }
+        before = self._conn.total_changes
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO embedding_cache VALUES (?, ?, ?, ?)",
+            [(key, vector, now, now) for key, vector in entries.items()],
+        )
+        self._rows += self._conn.total_changes - before
+        self._conn.executemany(
+            "UPDATE embedding_cache SET VECTOR = ?, CREATED_AT = ?, ACCESSED_AT = ? WHERE KEY = ?",
+            [(vector, now, now, key) for key, vector in entries.items()],
+        )
+        if self.max_size is not None and self._rows > self.max_size:
+            self._conn.execute(
+                """DELETE FROM embedding_cache WHERE KEY IN (
+                    SELECT KEY FROM embedding_cache ORDER BY ACCESSED_AT LIMIT ?)""",
+                (self._rows - self.max_size,),
+            )
+            self._rows = self.max_size
+        self._conn.commit()
+
+    async def evict_expired(self) -> int:
+        """Remove all the entries older than `ttl`.
+
+        Returns
+        -------
+        - `num_evicted` (int): The no. of entries removed.
+        """
+        if self.ttl is None:
+            return 0
+        cur = self._conn.execute(
+            "DELETE FROM embedding_cache WHERE CREATED_AT < ?",
+            (self.clock() - self.ttl,),
+        )
+        self._conn.commit()
+        self._rows -= cur.rowcount
+        return cur.rowcount
+
+    async def clear(self) -> None:
+        """Remove all the entries."""
+        self._conn.execute("DELETE FROM embedding_cache")
+        self._conn.commit()
+        self._rows = 0
@@ -0,0 +1,148 @@
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from embedia.core.cache import LLMCache
+from embedia.utils.hashing import content_hash
+from embedia.utils.typechecking import check_min_val
+
+
+class LRUCache(LLMCache):
+    """An in-memory LRU cache for LLM completions with an optional on-disk SQLite tier.
+    Entries are keyed on a hash of the model identity and the prompt.
+
+    Attributes
+    ----------
+    - `max_size` (int): The max no. of entries kept in memory.
+    - `ttl` (float): The no. of seconds after which an entry expires. None means entries never expire.
+    - `db_path` (str): The path to the SQLite file. None means there is no on-disk tier.
+    - `max_db_size` (int): The max no. of entries kept on disk. None means there is no limit.
+    - `hits` (int): The no. of lookups that found a completion.
+    - `misses` (int): The no. of lookups that did not find a completion.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+        db_path: Optional[str] = None,
+        max_db_size: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Constructor for the `LRUCache` class.
+
+        Parameters
+        ----------
+        - `max_size` (int, optional): The max no. of entries kept in memory. Defaults to 1024.
+        - `ttl` (float, optional): The no. of seconds after which an entry expires. Defaults to None (never).
+        - `db_path` (str, optional): The path to the SQLite file for the on-disk tier. Defaults to None (memory only).
+        - `max_db_size` (int, optional): The max no. of entries kept on disk. Defaults to None (no limit).
+        - `clock` (Callable, optional): Returns the current time in seconds. Defaults to `time.time`.
+        """
+        super().__init__()
+        check_min_val(max_size, 1, "max_size")
+        if max_db_size is not None:
+            check_min_val(max_db_size, 1, "max_db_size")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_db_size = max_db_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._conn = None
+        self._db_rows = 0
+        if db_path:
+            self._conn = sqlite3.connect(db_path)
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS llm_cache (
+                    KEY TEXT PRIMARY KEY, COMPLETION TEXT,
+                    CREATED_AT REAL, ACCESSED_AT REAL)"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (ACCESSED_AT)"
+            )
+            self._conn.commit()
+            self._db_rows = self._conn.execute(
+                "SELECT COUNT(*) FROM llm_cache"
+            ).fetchone()[0]
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and self.clock() - created_at > self.ttl
+
+    def _remember(self, key: str, completion: str, created_at: float) -> None:
+        self._memory[key] = (completion, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self._conn.execute(
+            "SELECT COMPLETION, CREATED_AT FROM llm_cache WHERE KEY = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1]):
+            self._conn.execute("DELETE FROM llm_cache WHERE KEY = ?", (key,))
+            self._conn.commit()
+            self._db_rows -= 1
+            return None
+        self._conn.execute(
+            "UPDATE llm_cache SET ACCESSED_AT = ? WHERE KEY = ?", (self.clock(), key)
+        )
+        self._conn.commit()
+        return row
+
+    def _db_set(self, key: str, completion: str, created_at: float) -> None:
+        cur = self._conn.execute(
+            "UPDATE llm_cache SET COMPLETION = ?, CREATED_AT = ?, ACCESSED_AT = ? WHERE KEY = ?",
+            (completion, created_at, created_at, key),
+        )
+        if cur.rowcount == 0:
+            self._conn.execute(
+                "INSERT INTO llm_cache VALUES (?, ?, ?, ?)",
+                (key, completion, created_at, created_at),
+            )
+            self._db_rows += 1
+        if self.max_db_size is not None and self._db_rows > self.max_db_size:
+            self._conn.execute(
+                """DELETE FROM llm_cache WHERE KEY IN (
+                    SELECT KEY FROM llm_cache ORDER BY ACCESSED_AT LIMIT ?)""",
+                (self._db_rows - self.max_db_size,),
+            )
+            self._db_rows = self.max_db_size
+        self._conn.commit()
+
+    async def _get(self, model_id: str, prompt: str) -> Optional[str]:
+        key = content_hash(model_id, prompt)
+        entry = self._memory.get(key)
+        if entry is not None and self._expired(entry[1]):
+            del self._memory[key]
+            entry = None
+        if entry is None and self._conn is not None:
+            entry = self._db_get(key)
+            if entry is not None:
+                self._remember(key, *entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._memory.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def _set(self, model_id: str, prompt: str, completion: str) -> None:
+        key = content_hash(model_id, prompt)
+        created_at = self.clock()
+        self._remember(key, completion, created_at)
+        if self._conn is not None:
+            self._db_set(key, completion, created_at)
+
+    async def clear(self) -> None:
+        """Remove all the entries from memory and disk."""
+        self._memory.clear()
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self._db_rows = 0
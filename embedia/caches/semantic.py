@@ -0,0 +1,185 @@
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.cache import LLMCache
+from embedia.core.embedding import EmbeddingModel
+from embedia.schema.pubsub import Event
+from embedia.utils.pubsub import publish_event
+from embedia.utils.typechecking import check_min_val
+
+
+class _Namespace:
+    def __init__(self, dim: int, capacity: int) -> None:
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.prompts: List[str] = []
+        self.completions: List[str] = []
+        self.created_at = np.zeros(capacity, dtype=np.float64)
+        self.used_at = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.prompts)
+
+    def remove(self, idx: int) -> None:
+        # Move the last row into the hole so that the rows stay contiguous
+        last = len(self) - 1
+        if idx != last:
+            self.vectors[idx] = self.vectors[last]
+            self.prompts[idx] = self.prompts[last]
+            self.completions[idx] = self.completions[last]
+            self.created_at[idx] = self.created_at[last]
+            self.used_at[idx] = self.used_at[last]
+        self.prompts.pop()
+        self.completions.pop()
+
+
+class SemanticCache(LLMCache):
+    """A cache that returns the completion of an earlier prompt that means nearly the same as the new prompt.
+    Prompts are embedded with an `EmbeddingModel` and compared with cosine similarity in an in-process index.
+    Entries are kept in separate namespaces for every model (and `namespace`, if one is given).
+    Publishes a `SemanticCacheHit` or `SemanticCacheMiss` event for every lookup.
+
+    Attributes
+    ----------
+    - `embedding_model` (`EmbeddingModel`): Used for embedding the prompts.
+    - `threshold` (float): The min cosine similarity for a cached prompt to count as a hit.
+    - `max_size` (int): The max no. of entries over all namespaces. Namespaces that were not used recently are evicted whole,
+    otherwise the least recently used entry of the namespace is evicted.
+    - `ttl` (float): The no. of seconds after which an entry expires. None means entries never expire.
+    - `namespace` (str): Keeps these entries apart from other caches that use the same models (eg: one per tenant).
+    - `hits` (int): The no. of lookups that found a completion.
+    - `misses` (int): The no. of lookups that did not find a completion.
+    """
+
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel,
+        threshold: float = 0.95,
+        max_size: int = 1024,
+        ttl: Optional[float] = None,
+        namespace: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Constructor for the `SemanticCache` class.
+
+        Parameters
+        ----------
+        - `embedding_model` (`EmbeddingModel`): Used for embedding the prompts.
+        - `threshold` (float, optional): The min cosine similarity for a cached prompt to count as a hit. Defaults to 0.95.
+        - `max_size` (int, optional): The max no. of entries over all namespaces. Defaults to 1024.
+        - `ttl` (float, optional): The no. of seconds after which an entry expires. Defaults to None (never).
+        - `namespace` (str, optional): Keeps these entries apart from other caches that use the same models. Defaults to None.
+        - `clock` (Callable, optional): Returns the current time in seconds. Defaults to `time.time`.
+        """
+        super().__init__()
+        check_min_val(max_size, 1, "max_size")
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.namespace = namespace
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # In least recently used order
+        self._namespaces: "OrderedDict[str, _Namespace]" = OrderedDict()
+        self._size = 0
+        # Embeddings of missed prompts, kept until the completion is stored
+        self._pending: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+    def _namespace_key(self, model_id: str) -> str:
+        return f"{self.namespace}:{model_id}" if self.namespace else model_id
+
+    async def _embed(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(await self.embedding_model(prompt), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    async def _get(self, model_id: str, prompt: str) -> Optional[str]:
+        key = self._namespace_key(model_id)
+        vector = await self._embed(prompt)
+        entries = self._namespaces.get(key)
+        completion, similarity, matched = None, None, None
+        if entries is not None and len(entries):
+            self._namespaces.move_to_end(key)
+            n = len(entries)
+            scores = entries.vectors[:n] @ vector
+            if self.ttl is not None:
+                scores[self.clock() - entries.created_at[:n] > self.ttl] = -np.inf
+            idx = int(np.argmax(scores))
+            similarity = float(scores[idx])
+            if similarity >= self.threshold:
+                entries.used_at[idx] = self.clock()
+                completion, matched = entries.completions[idx], entries.prompts[idx]
+
+        if completion is None:
+            self.misses += 1
+            self._pending[(key, prompt)] = vector
+            while len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+            publish_event(
+                Event.SemanticCacheMiss,
+                id(self),
+                {"namespace": key, "prompt": prompt, "similarity": similarity},
+            )
+        else:
+            self.hits += 1
+            publish_event(
+                Event.SemanticCacheHit,
+                id(self),
+                {
+                    "namespace": key,
+                    "prompt": prompt,
+                    "matched_prompt": matched,
+                    "similarity": similarity,
+                },
+            )
+        return completion
+
+    async def _set(self, model_id: str, prompt: str, completion: str) -> None:
+        key = self._namespace_key(model_id)
+        vector = self._pending.pop((key, prompt), None)
+        if vector is None:
+            vector = await self._embed(prompt)
+        entries = self._namespaces.get(key)
+        if entries is None:
+            # Many namespaces only ever hold one entry (eg: one per chat history), so they start small
+            entries = _Namespace(len(vector), 1)
+            self._namespaces[key] = entries
+        self._namespaces.move_to_end(key)
+
+        n = len(entries)
+        if self.ttl is not None:
+            expired = np.nonzero(self.clock() - entries.created_at[:n] > self.ttl)[0]
+            for idx in sorted(expired, reverse=True):
+                entries.remove(int(idx))
+            self._size -= len(expired)
+        while self._size >= self.max_size:
+            lru_key, lru = next(iter(self._namespaces.items()))
+            if lru_key == key:
+                entries.remove(int(np.argmin(entries.used_at[: len(entries)])))
+                self._size -= 1
+            else:
+                del self._namespaces[lru_key]
+                self._size -= len(lru)
+        n = len(entries)
+        if n == len(entries.vectors):
+            capacity = min(self.max_size, 2 * n)
+            entries.vectors = np.resize(entries.vectors, (capacity, len(vector)))
+            entries.created_at = np.resize(entries.created_at, capacity)
+            entries.used_at = np.resize(entries.used_at, capacity)
+
+        now = self.clock()
+        entries.vectors[n] = vector
+        entries.created_at[n] = now
+        entries.used_at[n] = now
+        entries.prompts.append(prompt)
+        entries.completions.append(completion)
+        self._size += 1
+
+    async def clear(self) -> None:
+        """Remove all the entries."""
+        self._namespaces.clear()
+        self._size = 0
+        self._pending.clear()
@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Union
+
+
+class LLMCache(ABC):
+    """Abstract class for caches that store LLM completions.
+
+    Methods
+    -------
+    - `_get` (abstract): Implement this method to look up a completion.
+    - `_set` (abstract): Implement this method to store a completion.
+    - `get` : Internally calls the `_get` method.
+    - `set` : Internally calls the `_set` method.
+    """
+
+    def __init__(self) -> None:
+        """Constructor for the `LLMCache` class."""
+        pass
+
+    @abstractmethod
+    async def _get(self, model_id: str, prompt: str) -> Optional[str]:
+        """Look up the completion of a prompt.
+        Do not use this method directly. Use `get` instead.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the completion.
+        - `prompt` (str): The prompt.
+
+        Returns
+        -------
+        - `completion` (str, optional): The cached completion, None if it was not found.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _set(self, model_id: str, prompt: str, completion: str) -> None:
+        """Store the completion of a prompt.
+        Do not use this method directly. Use `set` instead.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the completion.
+        - `prompt` (str): The prompt.
+        - `completion` (str): The completion.
+        """
+        raise NotImplementedError
+
+    async def get(self, model_id: str, prompt: str) -> Optional[str]:
+        """Look up the completion of a prompt.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the completion.
+        - `prompt` (str): The prompt.
+
+        Returns
+        -------
+        - `completion` (str, optional): The cached completion, None if it was not found.
+        """
+        return await self._get(model_id, prompt)
+
+    async def set(self, model_id: str, prompt: str, completion: str) -> None:
+        """Store the completion of a prompt.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the completion.
+        - `prompt` (str): The prompt.
+        - `completion` (str): The completion.
+        """
+        await self._set(model_id, prompt, completion)
+
+    def __deepcopy__(self, memo: dict) -> "LLMCache":
+        # Caches are shared between copies of a model (eg: `ToolUserAgent` deepcopies its `ChatLLM`)
+        return self
+
+
+class EmbeddingCache(ABC):
+    """Abstract class for caches that store embeddings.
+
+    Methods
+    -------
+    - `_get_many` (abstract): Implement this method to look up the embeddings of many inputs.
+    - `_set_many` (abstract): Implement this method to store the embeddings of many inputs.
+    - `get_many` : Internally calls the `_get_many` method.
+    - `set_many` : Internally calls the `_set_many` method.
+    """
+
+    def __init__(self) -> None:
+        """Constructor for the `EmbeddingCache` class."""
+        pass
+
+    @abstractmethod
+    async def _get_many(
+        self, model_id: str, inputs: List[Union[List[Any], str]]
+    ) -> List[Optional[List[float]]]:
+        """Look up the embeddings of many texts/token_lists.
+        Do not use this method directly. Use `get_many` instead.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the embeddings.
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists.
+
+        Returns
+        -------
+        - `embeddings` (List[Optional[List[float]]]): The cached embedding of every input (None if it was not found), in the same order.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _set_many(
+        self,
+        model_id: str,
+        inputs: List[Union[List[Any], str]],
+        embeddings: List[List[float]],
+    ) -> None:
+        """Store the embeddings of many texts/token_lists.
+        Do not use this method directly. Use `set_many` instead.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the embeddings.
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists.
+        - `embeddings` (List[List[float]]): The embedding of every input, in the same order.
+        """
+        raise NotImplementedError
+
+    async def get_many(
+        self, model_id: str, inputs: List[Union[List[Any], str]]
+    ) -> List[Optional[List[float]]]:
+        """Look up the embeddings of many texts/token_lists.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the embeddings.
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists.
+
+        Returns
+        -------
+        - `embeddings` (List[Optional[List[float]]]): The cached embedding of every input (None if it was not found), in the same order.
+        """
+        if not inputs:
+            return []
+        return await self._get_many(model_id, inputs)
+
+    async def set_many(
+        self,
+        model_id: str,
+        inputs: List[Union[List[Any], str]],
+        embeddings: List[List[float]],
+    ) -> None:
+        """Store the embeddings of many texts/token_lists.
+
+        Parameters
+        ----------
+        - `model_id` (str): The identity of the model that generated the embeddings.
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists.
+        - `embeddings` (List[List[float]]): The embedding of every input, in the same order.
+        """
+        if inputs:
+            await self._set_many(model_id, inputs, embeddings)
+
+    def __deepcopy__(self, memo: dict) -> "EmbeddingCache":
+        return self
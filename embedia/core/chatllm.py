@@ -1,14 +1,25 @@
+import asyncio
+import copy
+import functools
 import pickle
+import time
 from abc import ABC
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
+from embedia.core.cache import LLMCache
 from embedia.core.llm import LLM
 from embedia.core.tokenizer import Tokenizer
+from embedia.schema.context import ContextPolicy
 from embedia.schema.message import Message, MessageRole
+from embedia.schema.persona import Persona
 from embedia.schema.pubsub import Event
+from embedia.schema.scheduler import Priority
+from embedia.utils.concurrency import AdaptiveLimiter, limiter_slot
+from embedia.utils.hashing import content_hash, get_model_id
 from embedia.utils.pubsub import publish_event
+from embedia.utils.scheduler import RateLimitScheduler
 from embedia.utils.tokens import check_token_length
-from embedia.utils.typechecking import get_num_params
+from embedia.utils.typechecking import check_min_val, get_num_params
 
 
 class ChatLLM(ABC):
@@ -19,6 +30,9 @@ class ChatLLM(ABC):
     -------
     - `_reply` (abstract): Implement this method to generate the reply given a prompt.
     - `__call__` : Internally calls the `_reply` method.
+    - `_reply_stream` : Implement this method if the backend can stream the reply in chunks.
+    - `stream` : Internally calls the `_reply_stream` method and yields the chunks as they arrive.
+    - `batch` : Generate replies for many prompts concurrently without changing the `chat_history`.
     - `from_llm` (classmethod): Create a `ChatLLM` instance from an `LLM` instance.
     - `set_system_prompt` : Clears the `chat_history` and sets the system prompt as the first message.
     - `save_chat` : Save the chat history to a file.
@@ -30,12 +44,23 @@ class ChatLLM(ABC):
     - `llm` (`LLM`): The LLM instance (only exists if an instance is created using `from_llm` classmethod)
     - `tokenizer` (`Tokenizer`): Used for counting no. of tokens in the prompt and response.
     - `max_input_tokens` (int): Used for checking if the prompt is too long.
+    - `context_policy` (`ContextPolicy`): What to do when the `chat_history` is longer than `max_input_tokens`.
+    - `scheduler` (`RateLimitScheduler`): Used for keeping the calls within the backend's rate limits.
+    - `priority` (`Priority`): The priority of this instance's calls on the `scheduler`.
+    - `limiter` (`AdaptiveLimiter`): Used for adapting the no. of concurrent calls to the backend's latency (and hedging slow calls).
+    - `cache` (`LLMCache`): Used for returning the reply to a repeated message (after the same `chat_history`) without calling `_reply`.
+    - `model_id` (str): Set this attribute to identify the model in cache keys. Defaults to the class name.
     """
 
     def __init__(
         self,
         tokenizer: Optional[Tokenizer] = None,
         max_input_tokens: Optional[int] = None,
+        context_policy: ContextPolicy = ContextPolicy.error,
+        scheduler: Optional[RateLimitScheduler] = None,
+        priority: Priority = Priority.normal,
+        limiter: Optional[AdaptiveLimiter] = None,
+        cache: Optional[LLMCache] = None,
     ) -> None:
         """Constructor for the `ChatLLM` class.
 
@@ -43,34 +68,136 @@ class ChatLLM(ABC):
         ----------
         - `tokenizer` (`Tokenizer`, optional): Used for counting no. of tokens in the prompt and response.
         - `max_input_tokens` (int, optional): Used for checking if the prompt is too long.
+        - `context_policy` (`ContextPolicy`, optional): What to do when the `chat_history` is longer than `max_input_tokens`.
+            Only used if both `tokenizer` and `max_input_tokens` exist. Defaults to `ContextPolicy.error`.
+        - `scheduler` (`RateLimitScheduler`, optional): Used for keeping the calls within the backend's rate limits.
+            The tokens of the whole `chat_history` are reserved before each call and the reply tokens are charged after it.
+        - `priority` (`Priority`, optional): The priority of this instance's calls on the `scheduler`. Defaults to `Priority.normal`.
+        - `limiter` (`AdaptiveLimiter`, optional): Used for adapting the no. of concurrent calls to the backend's latency (and hedging slow calls).
+        - `cache` (`LLMCache`, optional): Used for returning the reply to a repeated message (after the same `chat_history`) without calling `_reply`.
+            The cache is looked up with the message as the prompt and the model identity plus the earlier `chat_history` as the model id.
+            Instances created with `from_llm` use the cache of the `LLM` instead.
         """
         self.chat_history: List[Message] = []
         self.llm: LLM = None
         self.tokenizer = tokenizer
         self.max_input_tokens = max_input_tokens
+        self.context_policy = context_policy
+        self.scheduler = scheduler
+        self.priority = priority
+        self.limiter = limiter
+        self.cache = cache
 
-    async def _call_llm(self, message: Message) -> Message:
+    def _llm_prompt(self) -> str:
         prompt = ""
         for message in self.chat_history:
             prompt += "{}: {}\n".format(message.role, message.content)
         prompt += f"{MessageRole.assistant}: "
-        reply = await self.llm(prompt)
+        return prompt
+
+    async def _call_llm(self, message: Message) -> Message:
+        reply = await self.llm(self._llm_prompt())
         return Message(role=MessageRole.assistant, content=reply)
 
+    def _tokens_key(self, content: str) -> str:
+        return content_hash(get_model_id(self.tokenizer), content)
+
+    async def _count_message_tokens(self, message: Message) -> int:
+        # The count is stored on the message so every message is tokenized only once,
+        # unless its content or the tokenizer changed since
+        key = self._tokens_key(message.content)
+        if message.tokens is None or message.tokens_key != key:
+            message.tokens = await self.tokenizer.count(message.content)
+            message.tokens_key = key
+        return message.tokens
+
     async def _calculate_chat_history_tokens(self) -> int:
         total_tokens = 0
         for message in self.chat_history:
-            total_tokens += len(await self.tokenizer(message.content))
+            total_tokens += await self._count_message_tokens(message)
         return total_tokens
 
-    async def _call_chatllm(self, message: Message) -> Message:
+    async def _summarize(self, messages: List[Message]) -> Optional[str]:
+        instance = copy.copy(self)
+        instance.context_policy = ContextPolicy.error
+        instance.chat_history = []
+        await instance.set_system_prompt(Persona.Summary)
+        # Keep the newest messages that fit next to the summarizer's system prompt
+        budget = self.max_input_tokens - instance.chat_history[0].tokens
+        lines = []
+        for msg in reversed(messages):
+            line = f"{msg.role.value}: {msg.content}"
+            budget -= await self.tokenizer.count(line)
+            if budget < 0:
+                break
+            lines.insert(0, line)
+        if not lines:
+            return None
+        try:
+            return await instance("\n".join(lines))
+        except ValueError:
+            return None
+
+    async def _fit_context(self) -> None:
+        if (
+            not self.tokenizer
+            or not self.max_input_tokens
+            or self.context_policy == ContextPolicy.error
+        ):
+            return
+        total_tokens = await self._calculate_chat_history_tokens()
+        if total_tokens <= self.max_input_tokens:
+            return
+
+        history = self.chat_history
+        pinned = 1 if history[0].role == MessageRole.system else 0
+        # The latest message is never dropped
+        end = pinned
+        while total_tokens > self.max_input_tokens and end < len(history) - 1:
+            total_tokens -= history[end].tokens
+            end += 1
+        summary = []
+        if self.context_policy == ContextPolicy.summarize:
+            content = await self._summarize(history[pinned:end])
+            if content:
+                message = Message(
+                    role=MessageRole.system,
+                    content=f"Summary of the earlier conversation:\n{content}",
+                )
+                summary_tokens = await self._count_message_tokens(message)
+                while (
+                    total_tokens + summary_tokens > self.max_input_tokens
+                    and end < len(history) - 1
+                ):
+                    total_tokens -= history[end].tokens
+                    end += 1
+                if total_tokens + summary_tokens <= self.max_input_tokens:
+                    summary = [message]
+        self.chat_history = history[:pinned] + summary + history[end:]
+
+    def _cache_key(self) -> Tuple[str, str]:
+        context = [f"{msg.role.value}: {msg.content}" for msg in self.chat_history[:-1]]
+        return content_hash(get_model_id(self), *context), self.chat_history[-1].content
+
+    async def _chat_start(
+        self, message: Message
+    ) -> Tuple[Optional[int], Optional[str]]:
+        # The length is checked before the cache, so that a prompt that is too long always fails
         if self.tokenizer:
             total_tokens = await self._calculate_chat_history_tokens()
             if self.max_input_tokens:
                 check_token_length(total_tokens, self.max_input_tokens)
-            msg_tokens = len(await self.tokenizer(message.content))
+            msg_tokens = await self._count_message_tokens(message)
         else:
+            total_tokens = 0
             msg_tokens = None
+
+        reply = None
+        if self.cache:
+            reply = await self.cache.get(*self._cache_key())
+        cache_hit = reply is not None
+        if self.scheduler and not cache_hit:
+            await self.scheduler.acquire(total_tokens, self.priority)
         publish_event(
             Event.ChatLLMStart,
             id(self),
@@ -78,30 +205,58 @@ class ChatLLM(ABC):
                 "msg_role": message.role,
                 "msg_content": message.content,
                 "msg_tokens": msg_tokens,
+                "cache_hit": cache_hit,
             },
         )
+        return msg_tokens, reply
 
-        if not get_num_params(self._reply):
-            reply = await self._reply()
-        else:
-            reply = await self._reply(message.content)
-        reply = Message(role=MessageRole.assistant, content=reply)
+    async def _chat_end(
+        self,
+        message: Message,
+        msg_tokens: Optional[int],
+        reply: Message,
+        timings: Optional[dict] = None,
+        cache_hit: bool = False,
+    ) -> None:
         if self.tokenizer:
-            reply_tokens = len(await self.tokenizer(reply.content))
+            reply_tokens = await self._count_message_tokens(reply)
+            if self.scheduler and not cache_hit:
+                self.scheduler.charge(reply_tokens)
         else:
             reply_tokens = None
-        publish_event(
-            Event.ChatLLMEnd,
-            id(self),
-            {
-                "msg_role": message.role,
-                "msg_content": message.content,
-                "msg_tokens": msg_tokens,
-                "reply_role": reply.role,
-                "reply_content": reply.content,
-                "reply_tokens": reply_tokens,
-            },
-        )
+        data = {
+            "msg_role": message.role,
+            "msg_content": message.content,
+            "msg_tokens": msg_tokens,
+            "reply_role": reply.role,
+            "reply_content": reply.content,
+            "reply_tokens": reply_tokens,
+            "cache_hit": cache_hit,
+        }
+        if timings:
+            data.update(timings)
+            if reply_tokens is not None and timings["duration"] > 0:
+                data["tokens_per_sec"] = reply_tokens / timings["duration"]
+            else:
+                data["tokens_per_sec"] = None
+        publish_event(Event.ChatLLMEnd, id(self), data)
+
+    async def _call_chatllm(self, message: Message) -> Message:
+        msg_tokens, reply = await self._chat_start(message)
+        cache_hit = reply is not None
+        if not cache_hit:
+            if not get_num_params(self._reply):
+                reply_func = self._reply
+            else:
+                reply_func = functools.partial(self._reply, message.content)
+            if self.limiter:
+                reply = await self.limiter.run(reply_func)
+            else:
+                reply = await reply_func()
+            if self.cache:
+                await self.cache.set(*self._cache_key(), reply)
+        reply = Message(role=MessageRole.assistant, content=reply)
+        await self._chat_end(message, msg_tokens, reply, cache_hit=cache_hit)
         return reply
 
     async def _reply(self, prompt: Optional[str] = None) -> str:
@@ -118,6 +273,24 @@ class ChatLLM(ABC):
         """
         raise NotImplementedError
 
+    async def _reply_stream(self, prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """Generate the reply given a prompt and yield it in chunks as they arrive.
+        By default, the whole reply from `_reply` is yielded as a single chunk.
+        Do not use this method directly. Use `stream` instead.
+
+        Parameters
+        ----------
+        - `prompt` (str, optional): The prompt to generate the reply.
+
+        Yields
+        ------
+        - `chunk` (str): The next chunk of the reply.
+        """
+        if not get_num_params(self._reply):
+            yield await self._reply()
+        else:
+            yield await self._reply(prompt)
+
     async def __call__(self, prompt: str) -> str:
         """Generate the reply given a prompt.
 
@@ -131,7 +304,7 @@ class ChatLLM(ABC):
 
         Raises
         ------
-        - `ValueError`: If the length of the prompt is greater than `max_input_tokens`.
+        - `ValueError`: If the length of the prompt is greater than `max_input_tokens` and the `context_policy` could not make it fit.
         """
         try:
             _ = self.chat_history
@@ -141,6 +314,7 @@ class ChatLLM(ABC):
             ) from e
         message = Message(role=MessageRole.user, content=prompt)
         self.chat_history.append(message)
+        await self._fit_context()
         if self.llm:
             reply = await self._call_llm(message)
         else:
@@ -148,6 +322,122 @@ class ChatLLM(ABC):
         self.chat_history.append(reply)
         return reply.content
 
+    async def batch(
+        self, prompts: List[str], max_concurrency: int = 5
+    ) -> List[Union[str, Exception]]:
+        """Generate the replies for many independent prompts concurrently.
+        Each prompt is replied to as the next message after the current `chat_history` (eg: the system prompt).
+        The `chat_history` is not changed. An error raised for a prompt does not stop the other prompts.
+
+        Parameters
+        ----------
+        - `prompts` (List[str]): The prompts to generate the replies.
+        - `max_concurrency` (int, optional): The max no. of concurrent requests. Defaults to 5.
+
+        Returns
+        -------
+        - `results` (List[Union[str, Exception]]): The reply (or the raised exception) for each prompt in the same order.
+        """
+        check_min_val(max_concurrency, 1, "max_concurrency")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(prompt: str) -> Union[str, Exception]:
+            async with semaphore:
+                instance = copy.copy(self)
+                instance.chat_history = list(self.chat_history)
+                try:
+                    return await instance(prompt)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*[run_one(prompt) for prompt in prompts]))
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Generate the reply given a prompt and yield it in chunks as they arrive.
+        Publishes a `ChatLLMChunk` event for every chunk.
+        The `ChatLLMEnd` event also contains the `time_to_first_token`, `duration` (in seconds), `tokens_per_sec`
+        and whether the stream `completed`. It is published even if the stream fails or is not read to the end.
+        The assembled reply is added to the `chat_history` once the stream ends, and to the `cache` if it completed.
+        A reply found in the `cache` is yielded as a single chunk.
+        The stream holds a place on the `limiter` until it ends. With an `llm`, its `stream` is used instead.
+
+        Parameters
+        ----------
+        - `prompt` (str): The prompt to generate the reply.
+
+        Yields
+        ------
+        - `chunk` (str): The next chunk of the reply.
+
+        Raises
+        ------
+        - `ValueError`: If the length of the prompt is greater than `max_input_tokens` and the `context_policy` could not make it fit.
+        """
+        try:
+            _ = self.chat_history
+        except AttributeError as e:
+            raise NotImplementedError(
+                "Please call `ChatLLM` init method from your subclass init method to initialize the chat history"
+            ) from e
+        message = Message(role=MessageRole.user, content=prompt)
+        self.chat_history.append(message)
+        await self._fit_context()
+        if self.llm:
+            chunks = []
+            async for chunk in self.llm.stream(self._llm_prompt()):
+                chunks.append(chunk)
+                yield chunk
+            reply = Message(role=MessageRole.assistant, content="".join(chunks))
+            self.chat_history.append(reply)
+            return
+
+        msg_tokens, cached = await self._chat_start(message)
+        cache_hit = cached is not None
+        key = self._cache_key() if self.cache else None
+        start = time.perf_counter()
+        time_to_first_token = None
+        chunks = []
+        completed = False
+        try:
+            if cache_hit:
+                time_to_first_token = time.perf_counter() - start
+                chunks.append(cached)
+                yield cached
+            else:
+                if get_num_params(self._reply_stream):
+                    reply_stream = self._reply_stream(message.content)
+                else:
+                    reply_stream = self._reply_stream()
+                async with limiter_slot(self.limiter):
+                    async for chunk in reply_stream:
+                        if time_to_first_token is None:
+                            time_to_first_token = time.perf_counter() - start
+                        publish_event(
+                            Event.ChatLLMChunk,
+                            id(self),
+                            {
+                                "msg_content": message.content,
+                                "chunk": chunk,
+                                "chunk_index": len(chunks),
+                            },
+                        )
+                        chunks.append(chunk)
+                        yield chunk
+            completed = True
+        finally:
+            # Also runs when the stream fails or the consumer stops early, with the part streamed so far
+            timings = {
+                "time_to_first_token": time_to_first_token,
+                "duration": time.perf_counter() - start,
+                "completed": completed,
+            }
+            reply = Message(role=MessageRole.assistant, content="".join(chunks))
+            await self._chat_end(message, msg_tokens, reply, timings, cache_hit)
+        # Only completed streams are cached
+        if self.cache and not cache_hit:
+            await self.cache.set(*key, reply.content)
+        self.chat_history.append(reply)
+
     @classmethod
     def from_llm(cls, llm: LLM) -> "ChatLLM":
         """Create a `ChatLLM` instance from an `LLM` instance.
@@ -172,10 +462,10 @@ class ChatLLM(ABC):
         - `system_prompt` (str): The `system_prompt`.
         """
         if self.tokenizer:
-            tokens = await self.tokenizer(system_prompt)
-            num_tokens = len(tokens)
+            num_tokens = await self.tokenizer.count(system_prompt)
+            tokens_key = self._tokens_key(system_prompt)
         else:
-            num_tokens = None
+            num_tokens = tokens_key = None
         publish_event(
             Event.ChatLLMInit,
             id(self),
@@ -185,7 +475,14 @@ class ChatLLM(ABC):
                 "system_tokens": num_tokens,
             },
         )
-        self.chat_history = [Message(role=MessageRole.system, content=system_prompt)]
+        self.chat_history = [
+            Message(
+                role=MessageRole.system,
+                content=system_prompt,
+                tokens=num_tokens,
+                tokens_key=tokens_key,
+            )
+        ]
 
     async def save_chat(self, filepath: str) -> None:
         """Save the `chat_history` to a file.
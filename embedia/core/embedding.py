@@ -1,8 +1,17 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, List, Union
+from typing import Any, List, Optional, Union
 
+from embedia.core.cache import EmbeddingCache
+from embedia.core.tokenizer import Tokenizer
 from embedia.schema.pubsub import Event
+from embedia.schema.scheduler import Priority
+from embedia.utils.batching import MicroBatcher
+from embedia.utils.hashing import content_hash, get_model_id
 from embedia.utils.pubsub import publish_event
+from embedia.utils.scheduler import RateLimitScheduler
+from embedia.utils.singleflight import SingleFlight
+from embedia.utils.typechecking import check_min_val
 
 
 class EmbeddingModel(ABC):
@@ -11,12 +20,108 @@ class EmbeddingModel(ABC):
     Methods
     -------
     - `_embed` (abstract): Implement this method to embed a text into a vector.
-    - `__call__` : Internally calls the `_embed` method.
+    - `_embed_batch`: Override this method if the backend can embed many inputs in one request.
+    - `__call__` : Internally calls the `_embed` method (or `_embed_batch` if there is a `batcher`).
+    - `batch` : Embeds a list of inputs. Internally calls the `_embed_batch` method.
+
+    Attributes
+    ----------
+    - `tokenizer` (`Tokenizer`): Used for counting no. of tokens in a text input.
+    - `singleflight` (`SingleFlight`): Used for sharing one `_embed` call between concurrent identical inputs.
+    - `scheduler` (`RateLimitScheduler`): Used for keeping the calls within the backend's rate limits.
+    - `priority` (`Priority`): The priority of this instance's calls on the `scheduler`.
+    - `batcher` (`MicroBatcher`): Used for merging concurrent `__call__`s into one `_embed_batch` call.
+    - `cache` (`EmbeddingCache`): Used for reusing the embeddings of inputs that were embedded before.
     """
 
-    def __init__(self) -> None:
-        """Constructor for the `EmbeddingModel` class."""
-        pass
+    # Defaults for subclasses that do not call `EmbeddingModel.__init__`, which used to take no arguments
+    tokenizer: Optional[Tokenizer] = None
+    singleflight: Optional[SingleFlight] = None
+    scheduler: Optional[RateLimitScheduler] = None
+    priority: Priority = Priority.normal
+    batcher: Optional[MicroBatcher] = None
+    cache: Optional[EmbeddingCache] = None
+
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        singleflight: Optional[SingleFlight] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+        priority: Priority = Priority.normal,
+        batcher: Optional[MicroBatcher] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        """Constructor for the `EmbeddingModel` class.
+
+        Parameters
+        ----------
+        - `tokenizer` (`Tokenizer`, optional): Used for counting no. of tokens in a text input.
+        - `singleflight` (`SingleFlight`, optional): Used for sharing one `_embed` call between concurrent identical inputs.
+        - `scheduler` (`RateLimitScheduler`, optional): Used for keeping the calls within the backend's rate limits.
+            The input tokens are reserved before each call (the length of a token_list, or the `tokenizer` count of a text).
+        - `priority` (`Priority`, optional): The priority of this instance's calls on the `scheduler`. Defaults to `Priority.normal`.
+        - `batcher` (`MicroBatcher`, optional): Used for merging concurrent `__call__`s into one `_embed_batch` call.
+        - `cache` (`EmbeddingCache`, optional): Used for reusing the embeddings of inputs that were embedded before.
+            Only the inputs missing from the cache are sent to the backend.
+        """
+        self.tokenizer = tokenizer
+        self.singleflight = singleflight
+        self.scheduler = scheduler
+        self.priority = priority
+        self.batcher = batcher
+        self.cache = cache
+
+    async def _count_tokens(self, input: Union[List[Any], str]) -> int:
+        if not isinstance(input, str):
+            return len(input)
+        if self.tokenizer:
+            return await self.tokenizer.count(input)
+        return 0
+
+    async def _embed_many(self, inputs: List[Union[List[Any], str]]) -> List[List[Any]]:
+        if self.scheduler:
+            tokens = 0
+            for input in inputs:
+                tokens += await self._count_tokens(input)
+            await self.scheduler.acquire(tokens, self.priority)
+        embeddings = await self._embed_batch(inputs)
+        if len(embeddings) != len(inputs):
+            raise ValueError(
+                f"_embed_batch returned {len(embeddings)} embeddings for {len(inputs)} inputs"
+            )
+        return embeddings
+
+    async def _embed_many_cached(
+        self, inputs: List[Union[List[Any], str]]
+    ) -> List[List[Any]]:
+        if self.cache is None:
+            return await self._embed_many(inputs)
+        model_id = get_model_id(self)
+        embeddings = await self.cache.get_many(model_id, inputs)
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if misses:
+            missed_inputs = [inputs[i] for i in misses]
+            new_embeddings = await self._embed_many(missed_inputs)
+            await self.cache.set_many(model_id, missed_inputs, new_embeddings)
+            for i, embedding in zip(misses, new_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+    async def _run_embed(self, input: Union[List[Any], str]) -> List[Any]:
+        async def embed() -> List[Any]:
+            if self.batcher:
+                return await self.batcher.run(input, self._embed_many)
+            if self.scheduler:
+                await self.scheduler.acquire(
+                    await self._count_tokens(input), self.priority
+                )
+            return await self._embed(input)
+
+        if self.singleflight:
+            return await self.singleflight.run(
+                content_hash(get_model_id(self), repr(input)), embed
+            )
+        return await embed()
 
     @abstractmethod
     async def _embed(self, input: Union[List[Any], str]) -> List[Any]:
@@ -33,6 +138,22 @@ class EmbeddingModel(ABC):
         """
         raise NotImplementedError
 
+    async def _embed_batch(
+        self, inputs: List[Union[List[Any], str]]
+    ) -> List[List[Any]]:
+        """Embed a list of texts/token_lists. Defaults to calling `_embed` concurrently for every input.
+        Do not use this method directly. Use `batch` instead.
+
+        Parameters
+        ----------
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists to embed.
+
+        Returns
+        -------
+        - `embeddings` (List[List[Any]]): The embedding of every input, in the same order.
+        """
+        return list(await asyncio.gather(*(self._embed(input) for input in inputs)))
+
     async def __call__(self, input: Union[List[Any], str]) -> List[Any]:
         """Embed a text/token_list into a vector.
 
@@ -45,8 +166,45 @@ class EmbeddingModel(ABC):
         - `embedding` (List[Any]): The embedding of the input.
         """
         publish_event(Event.EmbeddingStart, id(self), {"input": input})
-        embedding = await self._embed(input)
+        embedding = None
+        if self.cache is not None:
+            embedding = (await self.cache.get_many(get_model_id(self), [input]))[0]
+        if embedding is None:
+            embedding = await self._run_embed(input)
+            if self.cache is not None:
+                await self.cache.set_many(get_model_id(self), [input], [embedding])
         publish_event(
             Event.EmbeddingEnd, id(self), {"input": input, "embedding": embedding}
         )
         return embedding
+
+    async def batch(
+        self, inputs: List[Union[List[Any], str]], batch_size: int = 100
+    ) -> List[List[Any]]:
+        """Embed many texts/token_lists, sending them to the backend in chunks of `batch_size`.
+        If there is a `cache`, only the inputs missing from it are sent.
+
+        Parameters
+        ----------
+        - `inputs` (List[Union[List[Any], str]]): The texts/token_lists to embed.
+        - `batch_size` (int, optional): The no. of inputs sent per `_embed_batch` call. Defaults to 100.
+
+        Returns
+        -------
+        - `embeddings` (List[List[Any]]): The embedding of every input, in the same order.
+        """
+        check_min_val(batch_size, 1, "batch_size")
+        embeddings = []
+        for i in range(0, len(inputs), batch_size):
+            chunk = inputs[i : i + batch_size]
+            for input in chunk:
+                publish_event(Event.EmbeddingStart, id(self), {"input": input})
+            chunk_embeddings = await self._embed_many_cached(chunk)
+            for input, embedding in zip(chunk, chunk_embeddings):
+                publish_event(
+                    Event.EmbeddingEnd,
+                    id(self),
+                    {"input": input, "embedding": embedding},
+                )
+            embeddings.extend(chunk_embeddings)
+        return embeddings
@@ -1,10 +1,19 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
+from embedia.core.cache import LLMCache
 from embedia.core.tokenizer import Tokenizer
 from embedia.schema.pubsub import Event
+from embedia.schema.scheduler import Priority
+from embedia.utils.concurrency import AdaptiveLimiter, limiter_slot
+from embedia.utils.hashing import content_hash, get_model_id
 from embedia.utils.pubsub import publish_event
+from embedia.utils.scheduler import RateLimitScheduler
+from embedia.utils.singleflight import SingleFlight
 from embedia.utils.tokens import check_token_length
+from embedia.utils.typechecking import check_min_val
 
 
 class LLM(ABC):
@@ -14,18 +23,33 @@ class LLM(ABC):
     Methods
     -------
     - `_complete` (abstract): Implement this method to generate the next token(s) given a prompt.
+    - `_complete_batch` : Implement this method if the backend accepts many prompts in one request.
+    - `_complete_stream` : Implement this method if the backend can stream the completion in chunks.
     - `__call__` : Internally calls the `_complete` method.
+    - `batch` : Calls `__call__` (or `_complete_batch`) for many prompts with bounded concurrency.
+    - `stream` : Internally calls the `_complete_stream` method and yields the chunks as they arrive.
 
     Attributes
     ----------
     - `tokenizer` (`Tokenizer`): Used for counting no. of tokens in the prompt and response.
     - `max_input_tokens` (int): Used for checking if the prompt is too long.
+    - `cache` (`LLMCache`): Used for returning the completion of a repeated prompt without calling `_complete`.
+    - `singleflight` (`SingleFlight`): Used for sharing one `_complete` call between concurrent identical prompts.
+    - `scheduler` (`RateLimitScheduler`): Used for keeping the calls within the backend's rate limits.
+    - `priority` (`Priority`): The priority of this instance's calls on the `scheduler`.
+    - `limiter` (`AdaptiveLimiter`): Used for adapting the no. of concurrent calls to the backend's latency (and hedging slow calls).
+    - `model_id` (str): Set this attribute to identify the model in cache keys. Defaults to the class name.
     """
 
     def __init__(
         self,
         tokenizer: Optional[Tokenizer] = None,
         max_input_tokens: Optional[int] = None,
+        cache: Optional[LLMCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        scheduler: Optional[RateLimitScheduler] = None,
+        priority: Priority = Priority.normal,
+        limiter: Optional[AdaptiveLimiter] = None,
     ) -> None:
         """Constructor for the `LLM` class.
 
@@ -33,9 +57,21 @@ class LLM(ABC):
         ----------
         - `tokenizer` (Tokenizer, optional): Used for counting no. of tokens in the prompt and response.
         - `max_input_tokens` (int, optional): Used for checking if the prompt is too long.
+        - `cache` (`LLMCache`, optional): Used for returning the completion of a repeated prompt without calling `_complete`.
+        - `singleflight` (`SingleFlight`, optional): Used for sharing one `_complete` call between concurrent identical prompts.
+            Share one instance between `LLM` instances to coalesce their calls too.
+        - `scheduler` (`RateLimitScheduler`, optional): Used for keeping the calls within the backend's rate limits.
+            The prompt tokens are reserved before each call and the completion tokens are charged after it.
+        - `priority` (`Priority`, optional): The priority of this instance's calls on the `scheduler`. Defaults to `Priority.normal`.
+        - `limiter` (`AdaptiveLimiter`, optional): Used for adapting the no. of concurrent calls to the backend's latency (and hedging slow calls).
         """
         self.tokenizer = tokenizer
         self.max_input_tokens = max_input_tokens
+        self.cache = cache
+        self.singleflight = singleflight
+        self.scheduler = scheduler
+        self.priority = priority
+        self.limiter = limiter
 
     @abstractmethod
     async def _complete(self, prompt: str) -> str:
@@ -52,48 +88,276 @@ class LLM(ABC):
         """
         raise NotImplementedError
 
-    async def __call__(self, prompt: str) -> str:
-        """Generate the next token(s) given a prompt.
+    async def _complete_batch(self, prompts: List[str]) -> List[str]:
+        """Generate the next token(s) for many prompts in a single request.
+        Override this method for backends that accept many prompts at once.
+        Do not use this method directly. Use `batch` instead.
 
         Parameters
         ----------
-        - `prompt` (str): The prompt to generate the next token(s).
+        - `prompts` (List[str]): The prompts to generate the next token(s).
 
         Returns
         -------
-        - `completion` (str): The next token(s).
+        - `completions` (List[str]): The next token(s) for each prompt in the same order.
+        """
+        raise NotImplementedError
 
-        Raises
+    async def _complete_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Generate the next token(s) given a prompt and yield them in chunks as they arrive.
+        By default, the whole completion from `_complete` is yielded as a single chunk.
+        Do not use this method directly. Use `stream` instead.
+
+        Parameters
+        ----------
+        - `prompt` (str): The prompt to generate the next token(s).
+
+        Yields
         ------
-        - `ValueError`: If `tokenizer` and `max_input_tokens` exist and length of prompt is greater than `max_input_tokens`.
+        - `chunk` (str): The next chunk of the completion.
         """
+        yield await self._complete(prompt)
+
+    async def _acquire(self, prompt_tokens: Optional[int]) -> None:
+        if self.scheduler:
+            await self.scheduler.acquire(prompt_tokens or 0, self.priority)
+
+    async def _charge(self, completion: str) -> None:
+        if self.scheduler and self.tokenizer:
+            self.scheduler.charge(await self.tokenizer.count(completion))
+
+    async def _run_complete(self, prompt: str, prompt_tokens: Optional[int]) -> str:
+        async def complete() -> str:
+            await self._acquire(prompt_tokens)
+            if self.limiter:
+                completion = await self.limiter.run(lambda: self._complete(prompt))
+            else:
+                completion = await self._complete(prompt)
+            await self._charge(completion)
+            return completion
+
+        if self.singleflight:
+            return await self.singleflight.run(
+                content_hash(get_model_id(self), prompt), complete
+            )
+        return await complete()
+
+    async def _start(self, prompt: str) -> Tuple[Optional[int], Optional[str]]:
         if self.tokenizer:
-            tokens = await self.tokenizer(prompt)
+            prompt_tokens = await self.tokenizer.count(prompt)
             if self.max_input_tokens:
-                check_token_length(len(tokens), self.max_input_tokens)
-            prompt_tokens = len(tokens)
+                check_token_length(prompt_tokens, self.max_input_tokens)
         else:
             prompt_tokens = None
-        publish_event(
-            Event.LLMStart, id(self), {"prompt": prompt, "prompt_tokens": prompt_tokens}
-        )
-
-        completion = await self._complete(prompt)
 
-        if self.tokenizer:
-            tokens = await self.tokenizer(completion)
-            comp_tokens = len(tokens)
-        else:
-            comp_tokens = None
+        completion = None
+        if self.cache:
+            completion = await self.cache.get(get_model_id(self), prompt)
         publish_event(
-            Event.LLMEnd,
+            Event.LLMStart,
             id(self),
             {
                 "prompt": prompt,
                 "prompt_tokens": prompt_tokens,
-                "completion": completion,
-                "completion_tokens": comp_tokens,
+                "cache_hit": completion is not None,
             },
         )
+        return prompt_tokens, completion
+
+    async def _end(
+        self,
+        prompt: str,
+        prompt_tokens: Optional[int],
+        completion: str,
+        cache_hit: bool,
+        timings: Optional[dict] = None,
+        cache: bool = True,
+    ) -> None:
+        if self.cache and cache and not cache_hit:
+            await self.cache.set(get_model_id(self), prompt, completion)
+
+        if self.tokenizer:
+            comp_tokens = await self.tokenizer.count(completion)
+        else:
+            comp_tokens = None
+        data = {
+            "prompt": prompt,
+            "prompt_tokens": prompt_tokens,
+            "completion": completion,
+            "completion_tokens": comp_tokens,
+            "cache_hit": cache_hit,
+        }
+        if timings:
+            data.update(timings)
+            if comp_tokens is not None and timings["duration"] > 0:
+                data["tokens_per_sec"] = comp_tokens / timings["duration"]
+            else:
+                data["tokens_per_sec"] = None
+        publish_event(Event.LLMEnd, id(self), data)
+
+    async def __call__(self, prompt: str) -> str:
+        """Generate the next token(s) given a prompt.
+
+        Parameters
+        ----------
+        - `prompt` (str): The prompt to generate the next token(s).
 
+        Returns
+        -------
+        - `completion` (str): The next token(s).
+
+        Raises
+        ------
+        - `ValueError`: If `tokenizer` and `max_input_tokens` exist and length of prompt is greater than `max_input_tokens`.
+        """
+        prompt_tokens, completion = await self._start(prompt)
+        cache_hit = completion is not None
+        if not cache_hit:
+            completion = await self._run_complete(prompt, prompt_tokens)
+        await self._end(prompt, prompt_tokens, completion, cache_hit)
         return completion
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Generate the next token(s) given a prompt and yield them in chunks as they arrive.
+        Publishes an `LLMChunk` event for every chunk.
+        The `LLMEnd` event also contains the `time_to_first_token`, `duration` (in seconds), `tokens_per_sec`
+        and whether the stream `completed`. It is published even if the stream fails or is not read to the end,
+        but only completed streams are cached.
+        The stream holds a place on the `limiter` until it ends. It is not shared through `singleflight`,
+        since its chunks go to a single consumer.
+
+        Parameters
+        ----------
+        - `prompt` (str): The prompt to generate the next token(s).
+
+        Yields
+        ------
+        - `chunk` (str): The next chunk of the completion.
+
+        Raises
+        ------
+        - `ValueError`: If `tokenizer` and `max_input_tokens` exist and length of prompt is greater than `max_input_tokens`.
+        """
+        prompt_tokens, completion = await self._start(prompt)
+        cache_hit = completion is not None
+        start = time.perf_counter()
+        time_to_first_token = None
+        chunks = []
+        completed = False
+        if not cache_hit:
+            await self._acquire(prompt_tokens)
+        try:
+            if cache_hit:
+                time_to_first_token = time.perf_counter() - start
+                chunks.append(completion)
+                yield completion
+            else:
+                async with limiter_slot(self.limiter):
+                    async for chunk in self._complete_stream(prompt):
+                        if time_to_first_token is None:
+                            time_to_first_token = time.perf_counter() - start
+                        publish_event(
+                            Event.LLMChunk,
+                            id(self),
+                            {
+                                "prompt": prompt,
+                                "chunk": chunk,
+                                "chunk_index": len(chunks),
+                            },
+                        )
+                        chunks.append(chunk)
+                        yield chunk
+            completed = True
+        finally:
+            # Also runs when the stream fails or the consumer stops early, with the part streamed so far
+            completion = "".join(chunks)
+            if not cache_hit:
+                await self._charge(completion)
+            timings = {
+                "time_to_first_token": time_to_first_token,
+                "duration": time.perf_counter() - start,
+                "completed": completed,
+            }
+            await self._end(
+                prompt, prompt_tokens, completion, cache_hit, timings, cache=completed
+            )
+
+    async def _call_batch(self, prompts: List[str]) -> List[Union[str, Exception]]:
+        results: List[Union[str, Exception]] = [None] * len(prompts)
+        started = {}
+        for idx, prompt in enumerate(prompts):
+            try:
+                started[idx] = await self._start(prompt)
+            except Exception as e:
+                results[idx] = e
+        misses = [idx for idx, (_, cached) in started.items() if cached is None]
+        hits = set(started.keys()) - set(misses)
+        if misses:
+            try:
+                await self._acquire(sum(started[i][0] or 0 for i in misses))
+                batch_prompts = [prompts[i] for i in misses]
+                if self.limiter:
+                    completions = await self.limiter.run(
+                        lambda: self._complete_batch(batch_prompts)
+                    )
+                else:
+                    completions = await self._complete_batch(batch_prompts)
+                if len(completions) != len(misses):
+                    raise ValueError(
+                        f"_complete_batch returned {len(completions)} completion(s) for {len(misses)} prompt(s)"
+                    )
+            except Exception as e:
+                for idx in misses:
+                    results[idx] = e
+                    del started[idx]
+            else:
+                for idx, completion in zip(misses, completions):
+                    started[idx] = (started[idx][0], completion)
+                    await self._charge(completion)
+        for idx, (prompt_tokens, completion) in started.items():
+            await self._end(prompts[idx], prompt_tokens, completion, idx in hits)
+            results[idx] = completion
+        return results
+
+    async def batch(
+        self, prompts: List[str], max_concurrency: int = 5, batch_size: int = 20
+    ) -> List[Union[str, Exception]]:
+        """Generate the next token(s) for many prompts concurrently.
+        At most `max_concurrency` requests are sent to the backend at a time.
+        If `_complete_batch` is implemented, the prompts are sent in chunks of `batch_size`.
+        An error raised for a prompt does not stop the other prompts.
+
+        Parameters
+        ----------
+        - `prompts` (List[str]): The prompts to generate the next token(s).
+        - `max_concurrency` (int, optional): The max no. of concurrent requests. Defaults to 5.
+        - `batch_size` (int, optional): The no. of prompts sent per `_complete_batch` request. Defaults to 20.
+
+        Returns
+        -------
+        - `results` (List[Union[str, Exception]]): The completion (or the raised exception) for each prompt in the same order.
+        """
+        check_min_val(max_concurrency, 1, "max_concurrency")
+        check_min_val(batch_size, 1, "batch_size")
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        if type(self)._complete_batch is not LLM._complete_batch:
+
+            async def run_chunk(chunk: List[str]) -> List[Union[str, Exception]]:
+                async with semaphore:
+                    return await self._call_batch(chunk)
+
+            chunks = [
+                prompts[i : i + batch_size] for i in range(0, len(prompts), batch_size)
+            ]
+            results = await asyncio.gather(*[run_chunk(chunk) for chunk in chunks])
+            return [result for chunk in results for result in chunk]
+
+        async def run_one(prompt: str) -> Union[str, Exception]:
+            async with semaphore:
+                try:
+                    return await self(prompt)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*[run_one(prompt) for prompt in prompts]))
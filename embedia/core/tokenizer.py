@@ -1,5 +1,17 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Any, List
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, List, Optional, Union
+
+from embedia.utils.hashing import content_hash, get_model_id
+from embedia.utils.singleflight import SingleFlight
+from embedia.utils.typechecking import check_min_val
+
+
+def _run_in_worker(tokenizer: "Tokenizer", method: str, arg: Any) -> Any:
+    # Runs inside the executor, where there is no event loop of our own
+    return asyncio.run(getattr(tokenizer, method)(arg))
 
 
 class Tokenizer(ABC):
@@ -8,12 +20,59 @@ class Tokenizer(ABC):
     Methods
     -------
     - `_tokenize` (abstract): Implement this method with the tokenization logic. Do not call this method directly. Instead, call the `__call__` method.
+    - `_count`: Override this method if the backend can count tokens without building the token list.
+    - `_tokenize_batch`: Override this method if the backend is faster at tokenizing many texts at once.
     - `__call__` : Internally calls the `_tokenize` method.
+    - `count` : Returns the no. of tokens in a text. Internally calls the `_count` method.
+    - `batch` : Tokenizes a list of texts. Internally calls the `_tokenize_batch` method.
+    - `shutdown` : Shuts down the pool created for the `executor`.
+
+    Attributes
+    ----------
+    - `singleflight` (`SingleFlight`): Used for sharing one `_tokenize` call between concurrent identical texts.
+    - `memo_size` (int): The max no. of token counts remembered by `count`. 0 means nothing is remembered.
+    - `executor` (str or `Executor`): Where long texts are tokenized: "thread", "process" or an `Executor`. None means on the event loop.
+    - `inline_threshold` (int): Texts shorter than this many characters are tokenized on the event loop even if there is an `executor`.
     """
 
-    def __init__(self) -> None:
-        """Constructor for the `Tokenizer` class."""
-        pass
+    # Defaults for subclasses that do not call `Tokenizer.__init__`, which used to take no arguments.
+    # Nothing is remembered for them, so the shared `_memo` stays empty
+    singleflight: Optional[SingleFlight] = None
+    memo_size: int = 0
+    executor: Optional[Union[str, Executor]] = None
+    inline_threshold: int = 4096
+    _memo: "OrderedDict[str, int]" = OrderedDict()
+    _pool: Optional[Executor] = None
+
+    def __init__(
+        self,
+        singleflight: Optional[SingleFlight] = None,
+        memo_size: int = 1024,
+        executor: Optional[Union[str, Executor]] = None,
+        inline_threshold: int = 4096,
+    ) -> None:
+        """Constructor for the `Tokenizer` class.
+
+        Parameters
+        ----------
+        - `singleflight` (`SingleFlight`, optional): Used for sharing one `_tokenize` call between concurrent identical texts.
+        - `memo_size` (int, optional): The max no. of token counts remembered by `count` (least recently used are dropped first). Defaults to 1024.
+        - `executor` (str or `Executor`, optional): Runs `_tokenize`, `_count` and `_tokenize_batch` for long texts so that they do not block the event loop.
+            "thread" and "process" create a pool on first use. Defaults to None (always on the event loop).
+        - `inline_threshold` (int, optional): Texts (or batches) shorter than this many characters stay on the event loop. Defaults to 4096.
+        """
+        check_min_val(memo_size, 0, "memo_size")
+        check_min_val(inline_threshold, 0, "inline_threshold")
+        if isinstance(executor, str) and executor not in ("thread", "process"):
+            raise ValueError(
+                f"executor should be 'thread', 'process' or an Executor, got: {executor}"
+            )
+        self.singleflight = singleflight
+        self.memo_size = memo_size
+        self.executor = executor
+        self.inline_threshold = inline_threshold
+        self._memo: "OrderedDict[str, int]" = OrderedDict()
+        self._pool: Optional[Executor] = None
 
     @abstractmethod
     async def _tokenize(self, text: str) -> List[Any]:
@@ -30,6 +89,52 @@ class Tokenizer(ABC):
         """
         raise NotImplementedError
 
+    async def _count(self, text: str) -> int:
+        """Count the no. of tokens in a text. Defaults to the length of `_tokenize`.
+        Do not use this method directly. Use `count` instead.
+
+        Parameters
+        ----------
+        - `text` (str): The text to count the tokens of.
+
+        Returns
+        -------
+        - `num_tokens` (int): The no. of tokens.
+        """
+        return len(await self._tokenize(text))
+
+    async def _tokenize_batch(self, texts: List[str]) -> List[List[Any]]:
+        """Tokenize a list of texts. Defaults to calling `_tokenize` concurrently for every text.
+        Do not use this method directly. Use `batch` instead.
+
+        Parameters
+        ----------
+        - `texts` (List[str]): The texts to tokenize.
+
+        Returns
+        -------
+        - `tokens` (List[List[Any]]): The list of tokens for every text, in the same order.
+        """
+        return list(await asyncio.gather(*(self._tokenize(text) for text in texts)))
+
+    def _get_pool(self) -> Executor:
+        if not isinstance(self.executor, str):
+            return self.executor
+        if self._pool is None:
+            if self.executor == "thread":
+                self._pool = ThreadPoolExecutor(thread_name_prefix="tokenizer")
+            else:
+                self._pool = ProcessPoolExecutor()
+        return self._pool
+
+    async def _run(self, method: str, arg: Any, size: int) -> Any:
+        if self.executor is None or size < self.inline_threshold:
+            return await getattr(self, method)(arg)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_pool(), _run_in_worker, self, method, arg
+        )
+
     async def __call__(self, text: str) -> List[Any]:
         """Tokenize a text into a list of tokens.
 
@@ -41,5 +146,82 @@ class Tokenizer(ABC):
         -------
         - `tokens` (List[Any]): The list of tokens.
         """
-        tokens = await self._tokenize(text)
+        if self.singleflight:
+            return await self.singleflight.run(
+                content_hash(get_model_id(self), text),
+                lambda: self._run("_tokenize", text, len(text)),
+            )
+        tokens = await self._run("_tokenize", text, len(text))
         return tokens
+
+    async def count(self, text: str) -> int:
+        """Return the no. of tokens in a text without keeping the token list around.
+        Counts are remembered (keyed on a hash of the text) for the `memo_size` most recently used texts.
+
+        Parameters
+        ----------
+        - `text` (str): The text to count the tokens of.
+
+        Returns
+        -------
+        - `num_tokens` (int): The no. of tokens.
+        """
+        key = content_hash(text)
+        num_tokens = self._memo.get(key)
+        if num_tokens is not None:
+            self._memo.move_to_end(key)
+            return num_tokens
+
+        if self.singleflight:
+            num_tokens = await self.singleflight.run(
+                content_hash(get_model_id(self), "count", text),
+                lambda: self._run("_count", text, len(text)),
+            )
+        else:
+            num_tokens = await self._run("_count", text, len(text))
+
+        if self.memo_size:
+            self._memo[key] = num_tokens
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return num_tokens
+
+    async def batch(self, texts: List[str]) -> List[List[Any]]:
+        """Tokenize a list of texts.
+
+        Parameters
+        ----------
+        - `texts` (List[str]): The texts to tokenize.
+
+        Returns
+        -------
+        - `tokens` (List[List[Any]]): The list of tokens for every text, in the same order.
+        """
+        if not texts:
+            return []
+        texts = list(texts)
+        tokens = await self._run(
+            "_tokenize_batch", texts, sum(len(text) for text in texts)
+        )
+        if len(tokens) != len(texts):
+            raise ValueError(
+                f"_tokenize_batch returned {len(tokens)} results for {len(texts)} texts"
+            )
+        return tokens
+
+    def shutdown(self) -> None:
+        """Shut down the pool created for `executor="thread"` or `executor="process"`.
+        An `Executor` passed in by the caller is left running.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __getstate__(self) -> dict:
+        # Sent to process pool workers, which tokenize inline
+        state = self.__dict__.copy()
+        state.update(executor=None, singleflight=None, _pool=None, _memo=OrderedDict())
+        return state
+
+    def __deepcopy__(self, memo: dict) -> "Tokenizer":
+        return self
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, List
+from typing import Any, List, Optional
 
 from embedia.schema.vectordb import VectorDBGetSimilar, VectorDBInsert
 
@@ -11,8 +11,17 @@ class VectorDB(ABC):
     -------
     - `_insert` (abstract): Implement this method to insert a vector into the database.
     - `_get_similar` (abstract): Implement this method to get similar vectors from the database.
+    - `_insert_many`: Override this method to insert many vectors at once. Defaults to calling `_insert` for each one.
+    - `_get_similar_many`: Override this method to run many searches at once. Defaults to calling `_get_similar` for each one.
+    - `_delete`: Override this method to support deleting vectors. Raises `NotImplementedError` by default.
+    - `_upsert_many`: Override this method to replace vectors more efficiently. Defaults to `_delete` followed by `_insert_many`.
     - `insert` : Internally calls the `_insert` method.
     - `get_similar` : Internally calls the `_get_similar` method.
+    - `insert_many` : Internally calls the `_insert_many` method.
+    - `get_similar_many` : Internally calls the `_get_similar_many` method.
+    - `delete` : Internally calls the `_delete` method.
+    - `upsert` : Internally calls the `_upsert_many` method.
+    - `upsert_many` : Internally calls the `_upsert_many` method.
     """
 
     def __init__(self) -> None:
@@ -41,6 +50,72 @@ class VectorDB(ABC):
         """
         return await self._get_similar(data)
 
+    async def insert_many(self, data: List[VectorDBInsert]) -> None:
+        """Insert many vectors/texts into the database.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBInsert`]): The vectors/texts to insert.
+        """
+        if data:
+            await self._insert_many(data)
+
+    async def get_similar_many(self, data: List[VectorDBGetSimilar]) -> List[List[Any]]:
+        """Get similar objects for many queries.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBGetSimilar`]): The vectors/texts to get similar objects for.
+
+        Returns
+        -------
+        - `similar_objects` (List[List[Any]]): The list of similar objects for every query, in the same order.
+        """
+        if not data:
+            return []
+        return await self._get_similar_many(data)
+
+    async def delete(
+        self, ids: Optional[List[str]] = None, filter: Optional[dict] = None
+    ) -> int:
+        """Delete vectors by id, by metadata filter, or the vectors that match both.
+
+        Parameters
+        ----------
+        - `ids` (List[str], optional): The ids to delete. Missing ids are ignored. Defaults to None.
+        - `filter` (dict, optional): Delete the vectors whose `meta` matches this filter. Same syntax as `VectorDBGetSimilar.filter`. Defaults to None.
+
+        Returns
+        -------
+        - `n_deleted` (int): The no. of vectors deleted.
+        """
+        if ids is None and not filter:
+            raise ValueError("Either ids or filter should be given")
+        if ids is not None and not ids:
+            return 0
+        return await self._delete(ids, filter)
+
+    async def upsert(self, data: VectorDBInsert) -> None:
+        """Insert a vector/text into the database, replacing any vector with the same id.
+
+        Parameters
+        ----------
+        - `data` (`VectorDBInsert`): The vector/text to insert.
+        """
+        await self._upsert_many([data])
+
+    async def upsert_many(self, data: List[VectorDBInsert]) -> None:
+        """Insert many vectors/texts into the database, replacing any vectors with the same ids.
+        If an id appears more than once, the last one is kept.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBInsert`]): The vectors/texts to insert.
+        """
+        latest = {item.id: item for item in data}
+        if latest:
+            await self._upsert_many(list(latest.values()))
+
     @abstractmethod
     async def _insert(self, data: VectorDBInsert) -> None:
         """Insert a vector/text into the database.
@@ -66,3 +141,57 @@ class VectorDB(ABC):
         - `similar_objects` (List[Any]): The list of similar objects.
         """
         raise NotImplementedError
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        """Insert many vectors/texts into the database. Defaults to calling `_insert` for each one.
+        Do not use this method directly. Use `insert_many` instead.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBInsert`]): The vectors/texts to insert.
+        """
+        for item in data:
+            await self._insert(item)
+
+    async def _get_similar_many(
+        self, data: List[VectorDBGetSimilar]
+    ) -> List[List[Any]]:
+        """Get similar objects for many queries. Defaults to calling `_get_similar` for each one.
+        Do not use this method directly. Use `get_similar_many` instead.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBGetSimilar`]): The vectors/texts to get similar objects for.
+
+        Returns
+        -------
+        - `similar_objects` (List[List[Any]]): The list of similar objects for every query, in the same order.
+        """
+        return [await self._get_similar(item) for item in data]
+
+    async def _delete(self, ids: Optional[List[str]], filter: Optional[dict]) -> int:
+        """Delete vectors by id, by metadata filter, or the vectors that match both.
+        Do not use this method directly. Use `delete` instead.
+
+        Parameters
+        ----------
+        - `ids` (List[str], optional): The ids to delete.
+        - `filter` (dict, optional): Delete the vectors whose `meta` matches this filter.
+
+        Returns
+        -------
+        - `n_deleted` (int): The no. of vectors deleted.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support deletes")
+
+    async def _upsert_many(self, data: List[VectorDBInsert]) -> None:
+        """Insert vectors/texts with unique ids, replacing any vectors with the same ids.
+        Defaults to deleting the ids, then calling `_insert_many`.
+        Do not use this method directly. Use `upsert` or `upsert_many` instead.
+
+        Parameters
+        ----------
+        - `data` (List[`VectorDBInsert`]): The vectors/texts to insert.
+        """
+        await self._delete([item.id for item in data], None)
+        await self._insert_many(data)
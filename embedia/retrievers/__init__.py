@@ -0,0 +1,3 @@
+from .bm25 import BM25Retriever, default_analyzer
+from .hybrid import HybridRetriever, reciprocal_rank_fusion, weighted_fusion
+from .mmr import MMRRetriever, maximal_marginal_relevance
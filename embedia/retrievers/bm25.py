@@ -0,0 +1,203 @@
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.schema.textdoc import TextDoc
+from embedia.utils.filters import MetadataIndex
+from embedia.utils.typechecking import check_min_val
+from embedia.utils.vectors import GrowableArray, top_k
+
+_WORD = re.compile(r"\w+")
+
+
+def default_analyzer(text: str) -> List[str]:
+    """Split a text into lowercase terms. Runs of letters, digits and underscores are kept whole,
+    so that identifiers like `ERR_CONN_RESET`, `get_similar` or `0x80070005` stay one term.
+
+    Parameters
+    ----------
+    - `text` (str): The text to split.
+
+    Returns
+    -------
+    - `terms` (List[str]): The terms in the order they appear.
+    """
+    return _WORD.findall(text.lower())
+
+
+class BM25Retriever:
+    """A lexical retriever that ranks `TextDoc` instances by their Okapi BM25 score for a query.
+    Finds exact identifiers, error codes and function names that embedding search tends to miss.
+
+    The postings are stored compactly: one int32 array of rows and one of term frequencies for all terms,
+    with the offset of every term's run in a third array. New documents go to a small in-memory buffer
+    that is merged into the arrays once it holds more than `buffer_size` postings.
+
+    Attributes
+    ----------
+    - `k1` (float): How quickly the score saturates with the term frequency.
+    - `b` (float): How much the score is normalized by the document length.
+    - `analyzer` (Callable[[str], List[str]]): Splits texts into terms.
+    - `buffer_size` (int): The no. of postings buffered before they are merged into the arrays.
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        analyzer: Optional[Callable[[str], List[str]]] = None,
+        buffer_size: int = 100000,
+    ) -> None:
+        """Constructor for the `BM25Retriever` class.
+
+        Parameters
+        ----------
+        - `k1` (float, optional): How quickly the score saturates with the term frequency. Defaults to 1.2.
+        - `b` (float, optional): How much the score is normalized by the document length, between 0 and 1. Defaults to 0.75.
+        - `analyzer` (Callable[[str], List[str]], optional): Splits texts into terms. Defaults to `default_analyzer`.
+        - `buffer_size` (int, optional): The no. of postings buffered before they are merged into the arrays. Defaults to 100000.
+        """
+        check_min_val(k1, 0, "k1")
+        check_min_val(b, 0, "b")
+        check_min_val(buffer_size, 1, "buffer_size")
+        if b > 1:
+            raise ValueError(f"b should be between 0 and 1, got: {b}")
+        self.k1 = k1
+        self.b = b
+        self.analyzer = analyzer or default_analyzer
+        self.buffer_size = buffer_size
+        self._vocab: Dict[str, int] = {}
+        # Postings of term t are rows/tfs[offsets[t] : offsets[t + 1]], sorted by row
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._post_rows = np.empty(0, dtype=np.int32)
+        self._post_tfs = np.empty(0, dtype=np.int32)
+        self._buffered: Dict[int, List[Tuple[int, int]]] = {}
+        self._n_buffered = 0
+        self._lengths = GrowableArray((), np.float32)
+        self._total_length = 0
+        self._docs: List[TextDoc] = []
+        self._rows: Dict[str, int] = {}
+        self._index = MetadataIndex()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, docs: List[TextDoc]) -> None:
+        """Index documents. They can be searched right away.
+
+        Parameters
+        ----------
+        - `docs` (List[`TextDoc`]): The documents to index.
+        """
+        seen = set()
+        for doc in docs:
+            if doc.id in self._rows or doc.id in seen:
+                raise ValueError(f"Id: {doc.id} already exists in the retriever")
+            seen.add(doc.id)
+        lengths = []
+        for doc in docs:
+            row = len(self._docs)
+            terms = self.analyzer(doc.contents)
+            for term, tf in Counter(terms).items():
+                term_id = self._vocab.setdefault(term, len(self._vocab))
+                self._buffered.setdefault(term_id, []).append((row, tf))
+                self._n_buffered += 1
+            lengths.append(len(terms))
+            self._total_length += len(terms)
+            self._rows[doc.id] = row
+            self._docs.append(doc)
+            self._index.add(row, doc.meta)
+        self._lengths.extend(np.asarray(lengths, dtype=np.float32))
+        if self._n_buffered > max(self.buffer_size, len(self._post_rows) // 4):
+            self._merge()
+
+    def _merge(self) -> None:
+        # Rebuild the arrays with the buffered postings appended to every term's run
+        if not self._buffered:
+            return
+        n_terms = len(self._vocab)
+        old_terms = np.repeat(
+            np.arange(len(self._offsets) - 1, dtype=np.int64), np.diff(self._offsets)
+        )
+        new_terms, new_rows, new_tfs = [], [], []
+        for term_id, postings in self._buffered.items():
+            new_terms.extend([term_id] * len(postings))
+            for row, tf in postings:
+                new_rows.append(row)
+                new_tfs.append(tf)
+        terms = np.concatenate([old_terms, np.asarray(new_terms, dtype=np.int64)])
+        # Buffered rows are newer than all merged ones, so a stable sort keeps every run sorted by row
+        order = np.argsort(terms, kind="stable")
+        self._post_rows = np.concatenate(
+            [self._post_rows, np.asarray(new_rows, dtype=np.int32)]
+        )[order]
+        self._post_tfs = np.concatenate(
+            [self._post_tfs, np.asarray(new_tfs, dtype=np.int32)]
+        )[order]
+        self._offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        self._offsets[1:] = np.cumsum(np.bincount(terms, minlength=n_terms))
+        self._buffered, self._n_buffered = {}, 0
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows, tfs = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        if term_id < len(self._offsets) - 1:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            rows, tfs = self._post_rows[start:end], self._post_tfs[start:end]
+        buffered = self._buffered.get(term_id)
+        if buffered:
+            extra = np.asarray(buffered, dtype=np.int32)
+            rows = np.concatenate([rows, extra[:, 0]])
+            tfs = np.concatenate([tfs, extra[:, 1]])
+        return rows, tfs
+
+    def scores(self, query: str) -> np.ndarray:
+        """Return the BM25 score of every document for a query, in insertion order.
+
+        Parameters
+        ----------
+        - `query` (str): The query.
+
+        Returns
+        -------
+        - `scores` (np.ndarray): The float32 scores. 0 for documents that share no term with the query.
+        """
+        n = len(self)
+        doc_scores = np.zeros(n, dtype=np.float32)
+        if not n:
+            return doc_scores
+        avg_length = max(self._total_length / n, 1e-9)
+        for term, query_tf in Counter(self.analyzer(query)).items():
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                continue
+            rows, tfs = self._postings(term_id)
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (
+                1 - self.b + self.b * self._lengths.data[rows] / avg_length
+            )
+            doc_scores[rows] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return doc_scores
+
+    def get_similar(
+        self, query: str, n_results: int = 5, filter: Optional[dict] = None
+    ) -> List[Tuple[float, TextDoc]]:
+        """Get the documents with the highest BM25 scores for a query.
+
+        Parameters
+        ----------
+        - `query` (str): The query.
+        - `n_results` (int, optional): The no. of results to return. Defaults to 5.
+        - `filter` (dict, optional): Only return documents whose `meta` matches this filter. Same syntax as `VectorDBGetSimilar.filter`. Defaults to None.
+
+        Returns
+        -------
+        - `results` (List[Tuple[float, `TextDoc`]]): The scores and documents, best first. Documents that share no term with the query are left out.
+        """
+        doc_scores = self.scores(query)
+        if filter:
+            doc_scores[~self._index.evaluate(filter, len(self))] = 0
+        matched = np.flatnonzero(doc_scores > 0)
+        best = matched[top_k(doc_scores[matched], n_results)]
+        return [(float(doc_scores[row]), self._docs[row]) for row in best]
@@ -0,0 +1,189 @@
+from typing import Dict, List, Optional, Tuple
+
+from embedia.core.embedding import EmbeddingModel
+from embedia.core.vectordb import VectorDB
+from embedia.retrievers.bm25 import BM25Retriever
+from embedia.schema.retriever import FusionMethod
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.typechecking import check_min_val
+
+
+def _fused(
+    doc_scores: Dict[str, float], docs: Dict[str, TextDoc]
+) -> List[Tuple[float, TextDoc]]:
+    ranked = sorted(doc_scores.items(), key=lambda item: -item[1])
+    return [(score, docs[doc_id]) for doc_id, score in ranked]
+
+
+def reciprocal_rank_fusion(
+    results: List[List[Tuple[float, TextDoc]]],
+    k: int = 60,
+    weights: Optional[List[float]] = None,
+) -> List[Tuple[float, TextDoc]]:
+    """Combine ranked result lists by summing `weight / (k + rank)` for every document, with ranks starting at 1.
+
+    Parameters
+    ----------
+    - `results` (List[List[Tuple[float, `TextDoc`]]]): The result lists, each sorted best first.
+    - `k` (int, optional): Damps the advantage of the top ranks. Defaults to 60.
+    - `weights` (List[float], optional): The weight of every result list. Defaults to 1 for each.
+
+    Returns
+    -------
+    - `fused` (List[Tuple[float, `TextDoc`]]): The fused scores and the documents, best first. Documents are matched by id.
+    """
+    check_min_val(k, 0, "k")
+    weights = weights or [1.0] * len(results)
+    doc_scores: Dict[str, float] = {}
+    docs: Dict[str, TextDoc] = {}
+    for result, weight in zip(results, weights):
+        for rank, (_, doc) in enumerate(result, 1):
+            doc_scores[doc.id] = doc_scores.get(doc.id, 0.0) + weight / (k + rank)
+            docs.setdefault(doc.id, doc)
+    return _fused(doc_scores, docs)
+
+
+def weighted_fusion(
+    results: List[List[Tuple[float, TextDoc]]], weights: Optional[List[float]] = None
+) -> List[Tuple[float, TextDoc]]:
+    """Combine result lists by a weighted sum of their scores, after min-max scaling each list to [0, 1].
+    A document missing from a list gets 0 from it.
+
+    Parameters
+    ----------
+    - `results` (List[List[Tuple[float, `TextDoc`]]]): The result lists.
+    - `weights` (List[float], optional): The weight of every result list. Defaults to 1 for each.
+
+    Returns
+    -------
+    - `fused` (List[Tuple[float, `TextDoc`]]): The fused scores and the documents, best first. Documents are matched by id.
+    """
+    weights = weights or [1.0] * len(results)
+    doc_scores: Dict[str, float] = {}
+    docs: Dict[str, TextDoc] = {}
+    for result, weight in zip(results, weights):
+        if not result:
+            continue
+        low = min(score for score, _ in result)
+        high = max(score for score, _ in result)
+        for score, doc in result:
+            scaled = (score - low) / (high - low) if high > low else 1.0
+            doc_scores[doc.id] = doc_scores.get(doc.id, 0.0) + weight * scaled
+            docs.setdefault(doc.id, doc)
+    return _fused(doc_scores, docs)
+
+
+class HybridRetriever:
+    """Combines a `BM25Retriever` with any `VectorDB` whose `get_similar` returns (score, `TextDoc`) tuples.
+    The lexical results catch exact identifiers and error codes, the vector results catch paraphrases.
+    Lexical search is cheap, so the vector database can be asked for fewer results than a pure vector search would need.
+
+    Attributes
+    ----------
+    - `vectordb` (`VectorDB`): The vector database.
+    - `bm25` (`BM25Retriever`): The lexical retriever.
+    - `fusion` (`FusionMethod`): How the two result lists are combined.
+    - `vector_weight` (float): The weight of the vector results, between 0 and 1. The lexical results get `1 - vector_weight`.
+    - `rrf_k` (int): The `k` of `reciprocal_rank_fusion`.
+    - `embedding_model` (`EmbeddingModel`): Embeds the documents and queries, for vector databases that do not embed texts themselves.
+    """
+
+    def __init__(
+        self,
+        vectordb: VectorDB,
+        bm25: Optional[BM25Retriever] = None,
+        fusion: FusionMethod = FusionMethod.rrf,
+        vector_weight: float = 0.5,
+        rrf_k: int = 60,
+        embedding_model: Optional[EmbeddingModel] = None,
+    ) -> None:
+        """Constructor for the `HybridRetriever` class.
+
+        Parameters
+        ----------
+        - `vectordb` (`VectorDB`): The vector database.
+        - `bm25` (`BM25Retriever`, optional): The lexical retriever. Defaults to a new `BM25Retriever`.
+        - `fusion` (`FusionMethod`, optional): How the two result lists are combined. Defaults to `FusionMethod.rrf`.
+        - `vector_weight` (float, optional): The weight of the vector results, between 0 and 1. Defaults to 0.5.
+        - `rrf_k` (int, optional): The `k` of `reciprocal_rank_fusion`. Defaults to 60.
+        - `embedding_model` (`EmbeddingModel`, optional): Embeds the documents and queries. Defaults to None (texts are passed to the vector database).
+        """
+        check_min_val(vector_weight, 0, "vector_weight")
+        if vector_weight > 1:
+            raise ValueError(
+                f"vector_weight should be between 0 and 1, got: {vector_weight}"
+            )
+        check_min_val(rrf_k, 0, "rrf_k")
+        self.vectordb = vectordb
+        self.bm25 = bm25 if bm25 is not None else BM25Retriever()
+        self.fusion = FusionMethod(fusion)
+        self.vector_weight = vector_weight
+        self.rrf_k = rrf_k
+        self.embedding_model = embedding_model
+
+    async def add(self, docs: List[TextDoc]) -> None:
+        """Add documents to both the lexical retriever and the vector database.
+
+        Parameters
+        ----------
+        - `docs` (List[`TextDoc`]): The documents to add.
+        """
+        if not docs:
+            return
+        embeddings = [None] * len(docs)
+        if self.embedding_model is not None:
+            embeddings = await self.embedding_model.batch(
+                [doc.contents for doc in docs]
+            )
+        await self.vectordb.insert_many(
+            [
+                VectorDBInsert(
+                    id=doc.id, text=doc.contents, meta=doc.meta, embedding=embedding
+                )
+                for doc, embedding in zip(docs, embeddings)
+            ]
+        )
+        self.bm25.add(docs)
+
+    async def get_similar(
+        self,
+        query: str,
+        n_results: int = 5,
+        n_lexical: Optional[int] = None,
+        n_vector: Optional[int] = None,
+        filter: Optional[dict] = None,
+    ) -> List[Tuple[float, TextDoc]]:
+        """Run a lexical and a vector search and fuse their results.
+
+        Parameters
+        ----------
+        - `query` (str): The query.
+        - `n_results` (int, optional): The no. of results to return. Defaults to 5.
+        - `n_lexical` (int, optional): The no. of lexical results to fuse. Defaults to `2 * n_results`.
+        - `n_vector` (int, optional): The no. of vector results to fuse. 0 skips the vector search. Defaults to `n_results`.
+        - `filter` (dict, optional): Only return documents whose `meta` matches this filter. Defaults to None.
+
+        Returns
+        -------
+        - `results` (List[Tuple[float, `TextDoc`]]): The fused scores and the documents, best first.
+        """
+        n_lexical = 2 * n_results if n_lexical is None else n_lexical
+        n_vector = n_results if n_vector is None else n_vector
+        lexical = self.bm25.get_similar(query, n_lexical, filter) if n_lexical else []
+        vector = []
+        if n_vector:
+            embedding = None
+            if self.embedding_model is not None:
+                embedding = await self.embedding_model(query)
+            vector = await self.vectordb.get_similar(
+                VectorDBGetSimilar(
+                    text=query, embedding=embedding, n_results=n_vector, filter=filter
+                )
+            )
+        weights = [1 - self.vector_weight, self.vector_weight]
+        if self.fusion == FusionMethod.rrf:
+            fused = reciprocal_rank_fusion([lexical, vector], self.rrf_k, weights)
+        else:
+            fused = weighted_fusion([lexical, vector], weights)
+        return fused[:n_results]
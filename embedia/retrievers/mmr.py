@@ -0,0 +1,176 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.core.vectordb import VectorDB
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import VectorDBGetSimilar
+from embedia.utils.typechecking import check_min_val
+from embedia.utils.vectors import as_vector, normalize
+from embedia.vectordbs.base import LocalVectorDB
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    n_results: int,
+    lambda_mult: float = 0.5,
+    groups: Optional[List[Any]] = None,
+    max_per_group: Optional[int] = None,
+) -> List[int]:
+    """Greedily pick candidates that are relevant to the query but not similar to the ones already picked.
+    Each step picks the candidate with the highest `lambda_mult * relevance - (1 - lambda_mult) * redundancy`,
+    where both are cosine similarities and the redundancy is the highest similarity to a picked candidate.
+    The candidate-candidate similarities are computed in one matrix product.
+
+    Parameters
+    ----------
+    - `query` (np.ndarray): The query vector.
+    - `vectors` (np.ndarray): The candidate vectors, one per row.
+    - `n_results` (int): The no. of candidates to pick.
+    - `lambda_mult` (float, optional): 1 ranks by relevance only, 0 by diversity only. Defaults to 0.5.
+    - `groups` (List[Any], optional): The group of every candidate, eg: the id of its parent document. Defaults to None.
+    - `max_per_group` (int, optional): The max no. of candidates picked from one group. Defaults to None (no limit).
+
+    Returns
+    -------
+    - `picked` (List[int]): The indices of the picked candidates, in the order they were picked.
+    """
+    if not 0 <= lambda_mult <= 1:
+        raise ValueError(f"lambda_mult should be between 0 and 1, got: {lambda_mult}")
+    if not len(vectors):
+        return []
+    vectors = normalize(np.asarray(vectors, dtype=np.float32))
+    relevance = vectors @ normalize(np.asarray(query, dtype=np.float32))
+    similarity = vectors @ vectors.T
+
+    available = np.ones(len(vectors), dtype=bool)
+    group_ids = None
+    if groups is not None and max_per_group is not None:
+        check_min_val(max_per_group, 1, "max_per_group")
+        group_index: Dict[Any, int] = {}
+        group_ids = np.array(
+            [group_index.setdefault(g, len(group_index)) for g in groups]
+        )
+        group_counts = np.zeros(len(group_index), dtype=np.int64)
+
+    picked: List[int] = []
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    while len(picked) < n_results and available.any():
+        if picked:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+        if group_ids is not None:
+            group_counts[group_ids[best]] += 1
+            if group_counts[group_ids[best]] >= max_per_group:
+                available[group_ids == group_ids[best]] = False
+    return picked
+
+
+class MMRRetriever:
+    """Re-ranks the results of a `VectorDB` with maximal marginal relevance, so that near-duplicate chunks
+    do not fill up a prompt. It over-fetches `fetch_k` candidates, then picks a diverse `n_results` of them.
+
+    The candidate vectors are read back from `LocalVectorDB` databases that keep them,
+    and embedded with `embedding_model` otherwise.
+
+    Attributes
+    ----------
+    - `vectordb` (`VectorDB`): The vector database. Its `get_similar` should return (score, `TextDoc`) tuples.
+    - `embedding_model` (`EmbeddingModel`): Embeds the query and the candidates when their vectors are not available.
+    - `fetch_k` (int): The no. of candidates fetched per search.
+    - `lambda_mult` (float): 1 ranks by relevance only, 0 by diversity only.
+    - `max_per_parent` (int): The max no. of results with the same `parent_id` in their `meta`.
+    """
+
+    def __init__(
+        self,
+        vectordb: VectorDB,
+        embedding_model: Optional[EmbeddingModel] = None,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        max_per_parent: Optional[int] = None,
+    ) -> None:
+        """Constructor for the `MMRRetriever` class.
+
+        Parameters
+        ----------
+        - `vectordb` (`VectorDB`): The vector database.
+        - `embedding_model` (`EmbeddingModel`, optional): Embeds the query and the candidates when their vectors are not available. Defaults to the `embedding_model` of the database, if any.
+        - `fetch_k` (int, optional): The no. of candidates fetched per search, at least `n_results` are fetched. Defaults to 20.
+        - `lambda_mult` (float, optional): 1 ranks by relevance only, 0 by diversity only. Defaults to 0.5.
+        - `max_per_parent` (int, optional): The max no. of results with the same `parent_id` in their `meta`. Documents without one are their own parent. Defaults to None (no limit).
+        """
+        check_min_val(fetch_k, 1, "fetch_k")
+        if not 0 <= lambda_mult <= 1:
+            raise ValueError(
+                f"lambda_mult should be between 0 and 1, got: {lambda_mult}"
+            )
+        if max_per_parent is not None:
+            check_min_val(max_per_parent, 1, "max_per_parent")
+        self.vectordb = vectordb
+        self.embedding_model = embedding_model or getattr(
+            vectordb, "embedding_model", None
+        )
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+        self.max_per_parent = max_per_parent
+
+    async def _candidate_vectors(self, docs: List[TextDoc]) -> np.ndarray:
+        if isinstance(self.vectordb, LocalVectorDB):
+            try:
+                return self.vectordb.get_vectors([doc.id for doc in docs])
+            except (ValueError, NotImplementedError):
+                pass
+        if self.embedding_model is None:
+            raise ValueError(
+                "The database does not keep full vectors, provide an embedding_model"
+            )
+        embeddings = await self.embedding_model.batch([doc.contents for doc in docs])
+        return np.asarray(embeddings, dtype=np.float32)
+
+    async def get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        """Get relevant and diverse results for a search.
+
+        Parameters
+        ----------
+        - `data` (`VectorDBGetSimilar`): The search. `n_results` results are returned out of `fetch_k` candidates.
+
+        Returns
+        -------
+        - `results` (List[Tuple[float, `TextDoc`]]): The database's scores and the documents, in the order they were picked.
+        """
+        embedding = data.embedding
+        if embedding is None:
+            if self.embedding_model is None or data.text is None:
+                raise ValueError(
+                    "Provide an embedding, or a text and an embedding_model to embed it with"
+                )
+            embedding = await self.embedding_model(data.text)
+        candidates = await self.vectordb.get_similar(
+            VectorDBGetSimilar(
+                embedding=embedding,
+                n_results=max(self.fetch_k, data.n_results),
+                filter=data.filter,
+            )
+        )
+        if not candidates:
+            return []
+        docs = [doc for _, doc in candidates]
+        picked = maximal_marginal_relevance(
+            as_vector(embedding),
+            await self._candidate_vectors(docs),
+            data.n_results,
+            self.lambda_mult,
+            [(doc.meta or {}).get("parent_id", doc.id) for doc in docs],
+            self.max_per_parent,
+        )
+        return [candidates[i] for i in picked]
@@ -0,0 +1,14 @@
+from enum import Enum
+
+
+class ContextPolicy(str, Enum):
+    """What a `ChatLLM` does when the `chat_history` grows past `max_input_tokens`.
+
+    - `error`: Raise a `ValueError`.
+    - `sliding_window`: Drop the oldest messages. The system prompt is kept.
+    - `summarize`: Replace the oldest messages with a summary written by the same model. The system prompt is kept.
+    """
+
+    error = "error"
+    sliding_window = "sliding_window"
+    summarize = "summarize"
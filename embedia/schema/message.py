@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 from enum import Enum
+from typing import Optional
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
@@ -22,6 +23,9 @@ class Message(BaseModel):
     - `content` (str): The content of the message.
     - `id` (str, optional): The id of the message. Defaults to a random uuid.
     - `created_at` (str, optional): The timestamp of the message. Defaults to the current time with system's timezone.
+    - `tokens` (int, optional): The no. of tokens in the content. Filled in by `ChatLLM` once it has been counted. Defaults to None.
+    - `tokens_key` (str, optional): A hash of the tokenizer identity and the content that `tokens` was counted for.
+        `ChatLLM` counts again if either changed. Defaults to None.
     """
 
     role: MessageRole
@@ -30,3 +34,5 @@ class Message(BaseModel):
     created_at: str = Field(
         default_factory=lambda: str(datetime.now(timezone.utc).astimezone())
     )
+    tokens: Optional[int] = None
+    tokens_key: Optional[str] = None
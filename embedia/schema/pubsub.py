@@ -5,9 +5,11 @@ class Event(str, Enum):
     """The available events in the pubsub pipeline."""
 
     LLMStart = "LLM Start"
+    LLMChunk = "LLM Chunk"
     LLMEnd = "LLM End"
     ChatLLMInit = "ChatLLM Init"
     ChatLLMStart = "ChatLLM Start"
+    ChatLLMChunk = "ChatLLM Chunk"
     ChatLLMEnd = "ChatLLM End"
     ToolStart = "Tool Start"
     ToolEnd = "Tool End"
@@ -17,3 +19,7 @@ class Event(str, Enum):
     AgentStep = "Agent Step"
     AgentEnd = "Agent End"
     AgentTimeout = "Agent Timeout"
+    LimiterUpdate = "Limiter Update"
+    LimiterHedge = "Limiter Hedge"
+    SemanticCacheHit = "Semantic Cache Hit"
+    SemanticCacheMiss = "Semantic Cache Miss"
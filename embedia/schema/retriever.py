@@ -0,0 +1,12 @@
+from enum import Enum
+
+
+class FusionMethod(str, Enum):
+    """How a `HybridRetriever` combines the lexical and vector results.
+
+    - `rrf`: Reciprocal-rank fusion. Only the ranks are used, so the scores do not need to be comparable.
+    - `weighted`: A weighted sum of the scores, after min-max scaling each result list to [0, 1].
+    """
+
+    rrf = "rrf"
+    weighted = "weighted"
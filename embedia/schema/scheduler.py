@@ -0,0 +1,9 @@
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    """The priority classes of requests waiting on a `RateLimitScheduler`. Lower values are served first."""
+
+    interactive = 0
+    normal = 1
+    batch = 2
@@ -1,7 +1,7 @@
 import copy
 import re
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 from uuid import uuid4
 
 from pydantic import BaseModel, Field
@@ -21,6 +21,7 @@ class TextDoc(BaseModel):
     Methods
     -------
     - `from_file` (classmethod): Create a `TextDoc` instance from a file.
+    - `iter_file` (classmethod): Lazily split a file into `TextDoc` instances, without reading it whole.
     - `split_on_separator`: Split the contents on a separator and return a list of `TextDoc` instances.
     - `extract_regex`: Extract `TextDoc` instances from the content using a regex pattern.
     """
@@ -48,6 +49,68 @@ class TextDoc(BaseModel):
             instance = cls(meta=meta, contents=f.read())
         return instance
 
+    @classmethod
+    def iter_file(
+        cls,
+        path: str,
+        separator: str = "\n",
+        pattern: Optional[str] = None,
+        meta: Optional[dict] = None,
+        encoding: str = "utf-8",
+        strip_after_split: bool = False,
+        block_size: int = 1 << 20,
+    ) -> Iterator["TextDoc"]:
+        """Lazily split a file on a separator (or regex) and yield a `TextDoc` instance per chunk.
+        The file is read in blocks, so memory use depends on the chunk size rather than on the file size.
+        Separators that cross a block boundary are still found.
+        The chunks are what `from_file(...).split_on_separator(...)` returns, except that line endings are not translated.
+        The metadata is copied to every chunk, with a `segment_number`, a `parent_id` shared by all chunks of the file,
+        and the `start_byte` and `end_byte` (exclusive) of the chunk's contents in the file.
+
+        Parameters
+        ----------
+        - `path` (str): The path to the file.
+        - `separator` (str, optional): The separator to split on. Defaults to '\n'.
+        - `pattern` (str, optional): A regex to split on instead of `separator`. It is matched against the encoded bytes, so classes like `\\w` only match ASCII. Defaults to None.
+        - `meta` (dict, optional): Any metadata related to the text document. Defaults to None.
+        - `encoding` (str, optional): The encoding of the file. Should be one where the encoded separator cannot appear inside another character, like 'utf-8'. Defaults to 'utf-8'.
+        - `strip_after_split` (bool, optional): Whether to strip spaces from the contents after splitting. Defaults to False.
+        - `block_size` (int, optional): The no. of bytes read at a time. Defaults to 1 MiB.
+
+        Returns
+        -------
+        - `result` (Iterator[TextDoc]): The `TextDoc` instances, in file order.
+        """
+        if block_size < 1:
+            raise ValueError(f"block_size should be at least 1, got: {block_size}")
+        if pattern is not None:
+            regex = re.compile(pattern.encode(encoding))
+        elif separator:
+            regex = re.compile(re.escape(separator.encode(encoding)))
+        else:
+            raise ValueError("separator should not be empty")
+        parent_id = str(uuid4())
+        base_meta = copy.deepcopy(meta) or {}
+        with open(path, "rb") as f:
+            for idx, (start, raw) in enumerate(_split_blocks(f, regex, block_size)):
+                content = raw.decode(encoding)
+                if content.strip() == "":
+                    continue
+                end = start + len(raw)
+                if strip_after_split:
+                    stripped = content.strip()
+                    lead = content[: len(content) - len(content.lstrip())]
+                    trail = content[len(lead) + len(stripped) :]
+                    start += len(lead.encode(encoding))
+                    end -= len(trail.encode(encoding))
+                    content = stripped
+                new_meta = copy.deepcopy(base_meta)
+                new_meta["segment_number"] = idx + 1
+                new_meta["parent_id"] = parent_id
+                new_meta["start_byte"] = start
+                new_meta["end_byte"] = end
+                yield cls(contents=content, meta=new_meta)
+
     def split_on_separator(
         self, separator: str = "\n", strip_after_split: bool = False
     ) -> List["TextDoc"]:
@@ -95,3 +158,27 @@ class TextDoc(BaseModel):
             TextDoc(contents=content, meta=new_meta)
             for content in re.findall(pattern, self.contents, re.DOTALL)
         ]
+
+
+def _split_blocks(
+    f: BinaryIO, regex: "re.Pattern[bytes]", block_size: int
+) -> Iterator[Tuple[int, bytes]]:
+    # Yields (offset, piece) for the pieces between matches. Only the unfinished piece is kept across blocks.
+    # A match touching the end of the data read so far may continue in the next block, so it waits for more data
+    buffer, offset, eof = b"", 0, False
+    while not eof:
+        block = f.read(block_size)
+        eof = not block
+        buffer += block
+        pos = 0
+        for match in regex.finditer(buffer):
+            if match.end() == match.start():
+                continue
+            if not eof and match.end() == len(buffer):
+                break
+            yield offset + pos, buffer[pos : match.start()]
+            pos = match.end()
+        if eof:
+            yield offset + pos, buffer[pos:]
+        buffer = buffer[pos:]
+        offset += pos
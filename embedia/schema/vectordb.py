@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Any, List, Optional
 
 from pydantic import BaseModel
@@ -30,8 +31,24 @@ class VectorDBGetSimilar(BaseModel):
     - `text` (str, optional): The text you want to vector search for. Defaults to None.
     - `embedding` (List[Any], optional): The embedding you want to vector search for. Defaults to None.
     - `n_results` (int, optional): The number of results to return. Defaults to 5.
+    - `filter` (dict, optional): Only return results whose `meta` matches this filter, eg: `{"tenant": "acme", "year": {"$gte": 2020}}`.
+        See `embedia.utils.filters.MetadataIndex` for the supported operators. Defaults to None.
     """
 
     text: Optional[str] = None
     embedding: Optional[List[Any]] = None
     n_results: int = 5
+    filter: Optional[dict] = None
+
+
+class DistanceMetric(str, Enum):
+    """How a `VectorDB` compares vectors. A higher score always means more similar.
+
+    - `cosine`: The cosine similarity, between -1 and 1.
+    - `dot`: The dot product.
+    - `l2`: The negative euclidean distance.
+    """
+
+    cosine = "cosine"
+    dot = "dot"
+    l2 = "l2"
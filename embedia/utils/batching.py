@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from embedia.utils.typechecking import check_min_val
+
+BatchFunc = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    """Merges concurrent single-item calls into one batched call.
+    Items are collected for up to `window` seconds (or until there are `max_batch_size` of them),
+    sent to the batch function together and the results are handed back to each caller.
+    Calls with different batch functions are batched separately.
+
+    Attributes
+    ----------
+    - `max_batch_size` (int): The max no. of items sent per batched call.
+    - `window` (float): The no. of seconds to wait for more items after the first item of a batch.
+    - `batches` (int): The no. of batched calls made.
+    - `items` (int): The no. of items sent in those calls.
+    """
+
+    def __init__(self, max_batch_size: int = 32, window: float = 0.005) -> None:
+        """Constructor for the `MicroBatcher` class.
+
+        Parameters
+        ----------
+        - `max_batch_size` (int, optional): The max no. of items sent per batched call. Defaults to 32.
+        - `window` (float, optional): The no. of seconds to wait for more items after the first item of a batch. Defaults to 0.005.
+        """
+        check_min_val(max_batch_size, 1, "max_batch_size")
+        check_min_val(window, 0, "window")
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.batches = 0
+        self.items = 0
+        self._pending: Dict[BatchFunc, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[BatchFunc, asyncio.TimerHandle] = {}
+
+    @property
+    def mean_batch_size(self) -> float:
+        """The average no. of items per batched call."""
+        return self.items / self.batches if self.batches else 0.0
+
+    @property
+    def fill_ratio(self) -> float:
+        """The average batch size as a fraction of `max_batch_size`."""
+        return self.mean_batch_size / self.max_batch_size
+
+    def _flush(self, func: BatchFunc) -> None:
+        timer = self._timers.pop(func, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(func, None)
+        if batch:
+            self.batches += 1
+            self.items += len(batch)
+            asyncio.ensure_future(self._dispatch(func, batch))
+
+    async def _dispatch(
+        self, func: BatchFunc, batch: List[Tuple[Any, asyncio.Future]]
+    ) -> None:
+        try:
+            results = await func([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"Batch function returned {len(results)} results for {len(batch)} items"
+                )
+        except BaseException as e:
+            # Callers wait on these futures, so they are resolved even if the dispatch itself is cancelled
+            for _, future in batch:
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def run(self, item: Any, func: BatchFunc) -> Any:
+        """Send `item` to `func` in a batch with the other items submitted around the same time.
+
+        Parameters
+        ----------
+        - `item` (Any): The item to process.
+        - `func` (Callable[[List], Awaitable[List]]): Processes a list of items and returns their results in the same order.
+
+        Returns
+        -------
+        - `result` (Any): The result for `item`.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(func, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch_size:
+            self._flush(func)
+        elif len(batch) == 1:
+            self._timers[func] = loop.call_later(self.window, self._flush, func)
+        return await future
+
+    def __deepcopy__(self, memo: dict) -> "MicroBatcher":
+        return self
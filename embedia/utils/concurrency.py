@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from embedia.schema.pubsub import Event
+from embedia.utils.pubsub import publish_event
+from embedia.utils.typechecking import check_min_val
+
+
+class AdaptiveLimiter:
+    """Limits the no. of concurrent backend calls and adapts the limit with AIMD (additive increase, multiplicative decrease).
+    The limit grows by about one every `limit` healthy calls and is multiplied by `backoff` on an error or a slow call.
+    A call is slow if it takes longer than `latency_target`, or `tolerance` times the median latency if there is no target.
+    With `hedge` enabled, a duplicate call is sent if a call takes longer than the `hedge_percentile` latency,
+    and whichever call returns first is used.
+    Publishes a `LimiterUpdate` event when the limit changes and a `LimiterHedge` event for every duplicate call.
+
+    Attributes
+    ----------
+    - `limit` (float): The current concurrency limit (its integer part is used).
+    - `in_flight` (int): The no. of calls running right now.
+    - `hedges` (int): The no. of duplicate calls sent.
+    - `hedge_wins` (int): The no. of duplicate calls that returned before the original call.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_target: Optional[float] = None,
+        tolerance: float = 2.0,
+        backoff: float = 0.5,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        window: int = 100,
+        min_samples: int = 20,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """Constructor for the `AdaptiveLimiter` class.
+
+        Parameters
+        ----------
+        - `initial_limit` (int, optional): The starting concurrency limit. Defaults to 4.
+        - `min_limit` (int, optional): The lowest the limit can go. Defaults to 1.
+        - `max_limit` (int, optional): The highest the limit can go. Defaults to 64.
+        - `latency_target` (float, optional): The latency (in seconds) above which a call is slow. Defaults to None (use `tolerance`).
+        - `tolerance` (float, optional): Without a `latency_target`, a call is slow if it takes longer than this multiple of the median latency. Defaults to 2.0.
+        - `backoff` (float, optional): The factor the limit is multiplied by after an error or a slow call. Defaults to 0.5.
+        - `hedge` (bool, optional): Whether to send a duplicate of slow calls. Defaults to False.
+        - `hedge_percentile` (float, optional): The latency percentile after which a duplicate is sent. Defaults to 0.95.
+        - `window` (int, optional): The no. of recent latencies used for the median and percentiles. Defaults to 100.
+        - `min_samples` (int, optional): The no. of latencies needed before the median and percentiles are used. Defaults to 20.
+        - `clock` (Callable, optional): Returns the current time in seconds. Defaults to `time.perf_counter`.
+        """
+        check_min_val(min_limit, 1, "min_limit")
+        check_min_val(max_limit, min_limit, "max_limit")
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.clock = clock
+        self.in_flight = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies: deque = deque(maxlen=window)
+        self._decreased_at = float("-inf")
+        self._condition: Optional[asyncio.Condition] = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the `q` percentile (0 to 1) of the recent latencies, None if there are not enough of them.
+
+        Parameters
+        ----------
+        - `q` (float): The percentile between 0 and 1.
+
+        Returns
+        -------
+        - `latency` (float, optional): The latency in seconds.
+        """
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def _is_slow(self, latency: float) -> bool:
+        if self.latency_target is not None:
+            return latency > self.latency_target
+        median = self.percentile(0.5)
+        return median is not None and latency > self.tolerance * median
+
+    def _set_limit(self, limit: float, reason: str, latency: Optional[float]) -> None:
+        limit = min(max(limit, self.min_limit), self.max_limit)
+        old, self.limit = int(self.limit), limit
+        if int(limit) != old:
+            publish_event(
+                Event.LimiterUpdate,
+                id(self),
+                {"limit": int(limit), "reason": reason, "latency": latency},
+            )
+
+    def _on_done(self, started_at: float, latency: float, failed: bool) -> None:
+        if failed or self._is_slow(latency):
+            # Calls that started before the last decrease already saw the overload
+            if started_at > self._decreased_at:
+                self._decreased_at = self.clock()
+                self._set_limit(
+                    self.limit * self.backoff,
+                    "error" if failed else "slow",
+                    latency,
+                )
+        else:
+            self._set_limit(self.limit + 1 / self.limit, "healthy", latency)
+        if not failed:
+            self._latencies.append(latency)
+
+    async def _hedged(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.percentile(self.hedge_percentile)
+        primary = asyncio.ensure_future(func())
+        if delay is None:
+            return await primary
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            self.hedges += 1
+            duplicate = asyncio.ensure_future(func())
+            tasks.add(duplicate)
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded or not tasks:
+                    task = succeeded[0] if succeeded else done.pop()
+                    if task is duplicate:
+                        self.hedge_wins += 1
+                    publish_event(
+                        Event.LimiterHedge,
+                        id(self),
+                        {
+                            "delay": delay,
+                            "winner": "hedge" if task is duplicate else "primary",
+                        },
+                    )
+                    return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _enter(self) -> float:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self.clock()
+
+    async def _exit(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    async def run(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `func()` once there is room under the concurrency limit.
+
+        Parameters
+        ----------
+        - `func` (Callable[[], Awaitable]): Creates the backend call. It is called twice if the call is hedged.
+
+        Returns
+        -------
+        - `result` (Any): The result of the call.
+        """
+        started_at = await self._enter()
+        try:
+            if self.hedge:
+                result = await self._hedged(func)
+            else:
+                result = await func()
+        except Exception:
+            self._on_done(started_at, self.clock() - started_at, failed=True)
+            raise
+        else:
+            self._on_done(started_at, self.clock() - started_at, failed=False)
+            return result
+        finally:
+            await self._exit()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a place under the concurrency limit while the body runs, eg: while a stream is consumed.
+        The time the body takes counts as the latency of the call. Bodies that are cancelled or abandoned
+        (eg: a stream the consumer stopped reading) free their place without counting. They are never hedged.
+        """
+        started_at = await self._enter()
+        try:
+            yield
+        except Exception:
+            self._on_done(started_at, self.clock() - started_at, failed=True)
+            raise
+        else:
+            self._on_done(started_at, self.clock() - started_at, failed=False)
+        finally:
+            await self._exit()
+
+    def __deepcopy__(self, memo: dict) -> "AdaptiveLimiter":
+        return self
+
+
+@contextlib.asynccontextmanager
+async def limiter_slot(limiter: Optional[AdaptiveLimiter]) -> AsyncIterator[None]:
+    """Hold a place on `limiter` while the body runs, see `AdaptiveLimiter.slot`. Does nothing if `limiter` is None.
+
+    Parameters
+    ----------
+    - `limiter` (`AdaptiveLimiter`, optional): The limiter.
+    """
+    if limiter is None:
+        yield
+    else:
+        async with limiter.slot():
+            yield
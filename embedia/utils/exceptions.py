@@ -8,3 +8,7 @@ class DefinitionError(Exception):
 
 class AgentError(Exception):
     pass
+
+
+class ShardError(Exception):
+    pass
@@ -0,0 +1,157 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_RANGE_OPS = ("$gt", "$gte", "$lt", "$lte")
+
+
+def _value_key(value: Any) -> Optional[Tuple[str, Any]]:
+    # Keeps True apart from 1, and 1 together with 1.0
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return ("n", float(value))
+    if isinstance(value, str):
+        return ("s", value)
+    if value is None:
+        return ("z", None)
+    return None
+
+
+class MetadataIndex:
+    """Inverted indexes over the `meta` dicts of the rows of a vector database, used for evaluating filters.
+
+    A filter is a dict in the style of MongoDB queries:
+    - `{"tenant": "acme"}` or `{"tenant": {"$eq": "acme"}}`: equality. `$ne` is the opposite.
+    - `{"segment_number": {"$gte": 2, "$lt": 10}}`: ranges with `$gt`, `$gte`, `$lt` and `$lte` on numbers or strings.
+    - `{"lang": {"$in": ["en", "de"]}}`: any of the values. `$nin` is the opposite.
+    - `{"parent_id": {"$exists": True}}`: whether the field is present.
+    - `{"$and": [...]}`, `{"$or": [...]}`, `{"$not": {...}}`: boolean combinations.
+    Conditions on several fields in one dict must all hold. A list value in `meta` matches if any of its items does.
+    """
+
+    def __init__(self) -> None:
+        """Constructor for the `MetadataIndex` class."""
+        self._size = 0
+        self._postings: Dict[str, Dict[Tuple[str, Any], List[int]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        self._present: Dict[str, List[int]] = defaultdict(list)
+        # Sorted (values, rows) per field and type, rebuilt after new rows are added
+        self._sorted: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, row: int, meta: Optional[dict]) -> None:
+        """Index the `meta` of a row. Rows should be added in order, starting from 0.
+
+        Parameters
+        ----------
+        - `row` (int): The row no.
+        - `meta` (dict, optional): The metadata of the row.
+        """
+        self._size = max(self._size, row + 1)
+        for field, value in (meta or {}).items():
+            self._present[field].append(row)
+            for item in value if isinstance(value, (list, tuple)) else [value]:
+                key = _value_key(item)
+                if key is not None:
+                    self._postings[field][key].append(row)
+        self._sorted.clear()
+
+    def _rows_mask(self, rows: List[int], n: int) -> np.ndarray:
+        mask = np.zeros(n, dtype=bool)
+        if rows:
+            rows = np.asarray(rows, dtype=np.int64)
+            mask[rows[rows < n]] = True
+        return mask
+
+    def _eq(self, field: str, value: Any, n: int) -> np.ndarray:
+        key = _value_key(value)
+        if key is None:
+            raise ValueError(f"Can not filter field: {field} on value: {value!r}")
+        return self._rows_mask(self._postings[field].get(key, []), n)
+
+    def _range(self, field: str, op: str, value: Any, n: int) -> np.ndarray:
+        key = _value_key(value)
+        if key is None or key[0] not in ("n", "s"):
+            raise ValueError(f"{op} needs a number or a string, got: {value!r}")
+        kind = key[0]
+        if (field, kind) not in self._sorted:
+            pairs = [
+                (k[1], row)
+                for k, rows in self._postings[field].items()
+                if k[0] == kind
+                for row in rows
+            ]
+            values = np.array(
+                [v for v, _ in pairs], dtype=float if kind == "n" else object
+            )
+            order = np.argsort(values, kind="stable")
+            rows = np.array([row for _, row in pairs], dtype=np.int64)
+            self._sorted[(field, kind)] = (values[order], rows[order])
+        values, rows = self._sorted[(field, kind)]
+        if op in ("$gt", "$lte"):
+            cut = np.searchsorted(values, key[1], side="right")
+        else:
+            cut = np.searchsorted(values, key[1], side="left")
+        selected = rows[cut:] if op in ("$gt", "$gte") else rows[:cut]
+        return self._rows_mask(selected.tolist(), n)
+
+    def _field(self, field: str, condition: Any, n: int) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(n, dtype=bool)
+        for op, operand in condition.items():
+            if op == "$eq":
+                mask &= self._eq(field, operand, n)
+            elif op == "$ne":
+                mask &= ~self._eq(field, operand, n)
+            elif op in ("$in", "$nin"):
+                matched = np.zeros(n, dtype=bool)
+                for value in operand:
+                    matched |= self._eq(field, value, n)
+                mask &= matched if op == "$in" else ~matched
+            elif op in _RANGE_OPS:
+                mask &= self._range(field, op, operand, n)
+            elif op == "$exists":
+                present = self._rows_mask(self._present.get(field, []), n)
+                mask &= present if operand else ~present
+            else:
+                raise ValueError(f"Unknown filter operator: {op}")
+        return mask
+
+    def evaluate(self, filter: dict, n: Optional[int] = None) -> np.ndarray:
+        """Return a boolean mask of the rows that match a filter.
+
+        Parameters
+        ----------
+        - `filter` (dict): The filter.
+        - `n` (int, optional): The no. of rows in the mask. Defaults to the no. of rows added.
+
+        Returns
+        -------
+        - `mask` (np.ndarray): True for every matching row.
+        """
+        n = self._size if n is None else n
+        if not isinstance(filter, dict):
+            raise ValueError(f"Filter should be a dict, got: {filter!r}")
+        mask = np.ones(n, dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for sub_filter in condition:
+                    mask &= self.evaluate(sub_filter, n)
+            elif key == "$or":
+                matched = np.zeros(n, dtype=bool)
+                for sub_filter in condition:
+                    matched |= self.evaluate(sub_filter, n)
+                mask &= matched
+            elif key == "$not":
+                mask &= ~self.evaluate(condition, n)
+            elif key.startswith("$"):
+                raise ValueError(f"Unknown filter operator: {key}")
+            else:
+                mask &= self._field(key, condition, n)
+        return mask
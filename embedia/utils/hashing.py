@@ -0,0 +1,16 @@
+import hashlib
+
+
+def get_model_id(instance) -> str:
+    """Return the identity of a model instance used in cache and coalescing keys.
+    Uses the `model_id` attribute if the instance has one, else the qualified class name.
+    """
+    model_id = getattr(instance, "model_id", None)
+    if model_id:
+        return str(model_id)
+    return f"{type(instance).__module__}.{type(instance).__qualname__}"
+
+
+def content_hash(*parts: str) -> str:
+    """Return a sha256 hex digest of the given strings joined by a null byte."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
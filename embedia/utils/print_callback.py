@@ -13,7 +13,8 @@ def print_callback(
         msg = f"Prompt ({data['prompt_tokens']} tokens):\n{data['prompt']}"
         color = "cyan"
     elif event_type == Event.LLMEnd:
-        msg = f"Completion ({data['completion_tokens']} tokens):\n{data['completion']}"
+        cached = ", cached" if data.get("cache_hit") else ""
+        msg = f"Completion ({data['completion_tokens']} tokens{cached}):\n{data['completion']}"
         color = "yellow"
     elif event_type == Event.ChatLLMInit:
         msg = f"{data['system_role']} ({data['system_tokens']} tokens):\n{data['system_content']}"
@@ -24,7 +25,8 @@ def print_callback(
         )
         color = "cyan"
     elif event_type == Event.ChatLLMEnd:
-        msg = f"{data['reply_role']} ({data['reply_tokens']} tokens):\n{data['reply_content']}"
+        cached = ", cached" if data.get("cache_hit") else ""
+        msg = f"{data['reply_role']} ({data['reply_tokens']} tokens{cached}):\n{data['reply_content']}"
         color = "yellow"
     elif event_type == Event.ToolStart:
         msg = f"Tool: {data['name']}\nArgs: {data['args']}\nKwargs: {data['kwargs']}"
@@ -0,0 +1,134 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from embedia.schema.scheduler import Priority
+
+
+class RateLimitScheduler:
+    """Schedules requests to a backend within its requests-per-minute and tokens-per-minute limits.
+    Both limits are token buckets that hold up to a minute's worth of budget and refill continuously.
+    Waiting requests are served in the order of their `Priority`, then in the order they arrived.
+    Share one instance between all the `LLM`, `ChatLLM` and `EmbeddingModel` instances that use the same backend.
+
+    Attributes
+    ----------
+    - `requests_per_minute` (float): The max no. of requests per minute. None means there is no limit.
+    - `tokens_per_minute` (float): The max no. of tokens per minute. None means there is no limit.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        """Constructor for the `RateLimitScheduler` class.
+
+        Parameters
+        ----------
+        - `requests_per_minute` (float, optional): The max no. of requests per minute. Defaults to None (no limit).
+        - `tokens_per_minute` (float, optional): The max no. of tokens per minute. Defaults to None (no limit).
+        - `clock` (Callable, optional): Returns the current time in seconds. Defaults to `time.monotonic`.
+        - `sleep` (Callable, optional): Sleeps for the given no. of seconds. Defaults to `asyncio.sleep`.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self._request_budget = requests_per_minute or 0.0
+        self._token_budget = tokens_per_minute or 0.0
+        self._refilled_at = clock()
+        self._queue: List[Tuple[int, int, asyncio.Event]] = []
+        self._counter = itertools.count()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.requests_per_minute is not None:
+            self._request_budget = min(
+                self.requests_per_minute,
+                self._request_budget + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute is not None:
+            self._token_budget = min(
+                self.tokens_per_minute,
+                self._token_budget + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests_per_minute is not None and self._request_budget < 1:
+            delay = (1 - self._request_budget) * 60 / self.requests_per_minute
+        if self.tokens_per_minute is not None and self._token_budget < tokens:
+            delay = max(
+                delay, (tokens - self._token_budget) * 60 / self.tokens_per_minute
+            )
+        return delay
+
+    def _wake_head(self) -> None:
+        if self._queue:
+            self._queue[0][2].set()
+
+    async def acquire(
+        self, tokens: int = 0, priority: Priority = Priority.normal
+    ) -> None:
+        """Wait until the request can be sent and reserve its budget.
+
+        Parameters
+        ----------
+        - `tokens` (int, optional): The no. of tokens to reserve for the request. Defaults to 0.
+        - `priority` (`Priority`, optional): The priority of the request. Defaults to `Priority.normal`.
+
+        Raises
+        ------
+        - `ValueError`: If `tokens` is greater than `tokens_per_minute`.
+        """
+        if self.tokens_per_minute is not None and tokens > self.tokens_per_minute:
+            raise ValueError(
+                f"Request of {tokens} token(s) can never fit in tokens_per_minute: {self.tokens_per_minute}"
+            )
+        entry = (int(priority), next(self._counter), asyncio.Event())
+        heapq.heappush(self._queue, entry)
+        try:
+            while True:
+                if self._queue[0] is not entry:
+                    entry[2].clear()
+                    await entry[2].wait()
+                    continue
+                self._refill()
+                delay = self._delay(tokens)
+                if delay <= 0:
+                    heapq.heappop(self._queue)
+                    self._request_budget -= 1
+                    self._token_budget -= tokens
+                    self._wake_head()
+                    return
+                await self.sleep(delay)
+        except BaseException:
+            if entry in self._queue:
+                was_head = self._queue[0] is entry
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                if was_head:
+                    self._wake_head()
+            raise
+
+    def charge(self, tokens: int) -> None:
+        """Use up tokens that were not known when the request was sent (eg: the completion tokens).
+        The token budget can go below zero, which delays the next requests.
+
+        Parameters
+        ----------
+        - `tokens` (int): The no. of tokens to use up.
+        """
+        if self.tokens_per_minute is not None:
+            self._refill()
+            self._token_budget -= tokens
+
+    def __deepcopy__(self, memo: dict) -> "RateLimitScheduler":
+        return self
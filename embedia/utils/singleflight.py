@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key so that they share one awaited call.
+    Unlike a cache, nothing is kept once the call finishes.
+
+    Attributes
+    ----------
+    - `calls` (int): The no. of calls that were actually made.
+    - `coalesced` (int): The no. of calls that joined a call already in flight.
+    """
+
+    def __init__(self) -> None:
+        """Constructor for the `SingleFlight` class."""
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `func()`, or the call already in flight with the same `key`.
+
+        Parameters
+        ----------
+        - `key` (str): Calls with the same key are coalesced.
+        - `func` (Callable[[], Awaitable]): Creates the call to be made.
+
+        Returns
+        -------
+        - `result` (Any): The result of the shared call.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the call the other callers are waiting on
+        return await asyncio.shield(task)
+
+    def __deepcopy__(self, memo: dict) -> "SingleFlight":
+        return self
@@ -0,0 +1,159 @@
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from embedia.schema.vectordb import DistanceMetric
+
+
+def as_vector(embedding: List[Any]) -> np.ndarray:
+    """Return an embedding as a 1-D float32 array."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    if vector.ndim != 1:
+        raise ValueError(f"Embedding should be 1-D, got shape: {vector.shape}")
+    return vector
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors (1-D or rows of a 2-D array) to unit length. Zero vectors are left as they are."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def scores(
+    vectors: np.ndarray,
+    query: np.ndarray,
+    metric: DistanceMetric,
+    sq_norms: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Score every row of `vectors` against `query`, higher is more similar.
+    For `DistanceMetric.cosine` both are expected to be normalized already.
+    For `DistanceMetric.l2`, passing the squared norms of the rows turns the search into one matrix-vector product.
+    """
+    if metric != DistanceMetric.l2:
+        return vectors @ query
+    if sq_norms is None:
+        return -np.linalg.norm(vectors - query, axis=-1)
+    sq_dists = sq_norms - 2 * (vectors @ query) + query @ query
+    return -np.sqrt(np.maximum(sq_dists, 0))
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the `k` highest scores, highest first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class GrowableArray:
+    """A NumPy array of rows that doubles its capacity when it is full.
+
+    Attributes
+    ----------
+    - `data` (np.ndarray): A view of the rows appended so far.
+    """
+
+    def __init__(self, row_shape: Tuple[int, ...], dtype, capacity: int = 1024) -> None:
+        self._array = np.zeros((max(capacity, 1),) + tuple(row_shape), dtype=dtype)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._array[: self._size]
+
+    def extend(self, rows: np.ndarray) -> None:
+        needed = self._size + len(rows)
+        if needed > len(self._array):
+            capacity = max(needed, 2 * len(self._array))
+            array = np.zeros((capacity,) + self._array.shape[1:], self._array.dtype)
+            array[: self._size] = self._array[: self._size]
+            self._array = array
+        self._array[self._size : needed] = rows
+        self._size = needed
+
+    def append(self, row: Any) -> None:
+        self.extend(np.asarray(row, dtype=self._array.dtype)[None])
+
+
+def kmeans(
+    data: np.ndarray,
+    k: int,
+    n_iter: int = 20,
+    rng: Optional[np.random.Generator] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Cluster the rows of `data` into `k` clusters with Lloyd's algorithm.
+    Empty clusters are restarted from a random row.
+
+    Returns
+    -------
+    - `centroids` (np.ndarray): The (k, dim) float32 centroids.
+    - `labels` (np.ndarray): The cluster of every row.
+    """
+    rng = rng or np.random.default_rng()
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    labels = np.zeros(len(data), dtype=np.int64)
+    for _ in range(n_iter):
+        labels = nearest(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()))]
+    return centroids, nearest(data, centroids)
+
+
+def nearest(
+    data: np.ndarray, centroids: np.ndarray, chunk_size: int = 4096
+) -> np.ndarray:
+    """Return the index of the nearest (euclidean) centroid for every row of `data`."""
+    c_sq_norms = (centroids**2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int64)
+    for i in range(0, len(data), chunk_size):
+        chunk = data[i : i + chunk_size]
+        labels[i : i + chunk_size] = np.argmin(
+            c_sq_norms[None, :] - 2 * chunk @ centroids.T, axis=1
+        )
+    return labels
+
+
+def score_matrix(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    metric: DistanceMetric,
+    sq_norms: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Score every row of `vectors` against every row of `queries` with one matrix-matrix product.
+
+    Returns
+    -------
+    - `scores` (np.ndarray): A (no. of queries, no. of vectors) array, higher is more similar.
+    """
+    products = queries @ vectors.T
+    if metric != DistanceMetric.l2:
+        return products
+    if sq_norms is None:
+        sq_norms = (vectors**2).sum(axis=1)
+    sq_dists = sq_norms[None, :] - 2 * products + (queries**2).sum(axis=1)[:, None]
+    return -np.sqrt(np.maximum(sq_dists, 0))
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the `k` highest scores in every row of a 2-D array, highest first."""
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
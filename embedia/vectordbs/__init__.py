@@ -0,0 +1,5 @@
+from .flat import NumpyVectorDB
+from .hnsw import HNSWVectorDB
+from .ivfpq import IVFPQVectorDB
+from .segments import MmapVectorDB
+from .sharded import ShardedVectorDB
@@ -0,0 +1,281 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.core.vectordb import VectorDB
+from embedia.schema.vectordb import DistanceMetric, VectorDBInsert
+from embedia.utils.filters import MetadataIndex
+from embedia.utils.vectors import as_vector, normalize, scores, top_k
+
+
+async def embed_matrix(
+    embedding_model: Optional[EmbeddingModel],
+    texts: List[Optional[str]],
+    embeddings: List[Optional[List]],
+) -> np.ndarray:
+    """Stack embeddings into a float32 matrix, one row per item.
+    Texts without an embedding are embedded in one `EmbeddingModel.batch` call.
+
+    Parameters
+    ----------
+    - `embedding_model` (`EmbeddingModel`, optional): Used for embedding the texts without an embedding.
+    - `texts` (List[Optional[str]]): The texts.
+    - `embeddings` (List[Optional[List]]): The embeddings, None for the texts to embed.
+
+    Returns
+    -------
+    - `matrix` (np.ndarray): The (no. of items, dim) float32 matrix.
+    """
+    embeddings = list(embeddings)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        if embedding_model is None or any(texts[i] is None for i in missing):
+            raise ValueError(
+                "Provide an embedding, or a text and an embedding_model to embed it with"
+            )
+        new_embeddings = await embedding_model.batch([texts[i] for i in missing])
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = embedding
+    try:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+    except ValueError:
+        matrix = None
+    if matrix is None or matrix.ndim != 2:
+        raise ValueError("Embeddings should be 1-D and have the same no. of dimensions")
+    return matrix
+
+
+class LocalVectorDB(VectorDB):
+    """Base class for the vector databases that keep their vectors in this process.
+    Turns the texts/embeddings of inserts and searches into float32 vectors (normalized for `DistanceMetric.cosine`),
+    and keeps a `MetadataIndex` of the inserted `meta` dicts for the `filter` of `VectorDBGetSimilar`.
+
+    Deleted rows are only marked in a tombstone bitmap, which every search honours.
+    Once more than `compaction_threshold` of the rows are deleted, `compact` is scheduled in the background
+    to rebuild the database without them.
+
+    Attributes
+    ----------
+    - `metric` (`DistanceMetric`): How the vectors are compared.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `dim` (int): The no. of dimensions of the embeddings. Set by the first insert.
+    - `prefilter_threshold` (float): If a filter matches less than this fraction of the rows, only the matching rows are searched (pre-filtering).
+        Otherwise the normal search runs and the rows that do not match are dropped (post-filtering).
+    - `compaction_threshold` (float): The fraction of deleted rows above which the database is compacted.
+    """
+
+    prefilter_threshold: float = 0.2
+    compaction_threshold: float = 0.2
+
+    def __init__(
+        self,
+        metric: DistanceMetric = DistanceMetric.cosine,
+        embedding_model: Optional[EmbeddingModel] = None,
+    ) -> None:
+        """Constructor for the `LocalVectorDB` class.
+
+        Parameters
+        ----------
+        - `metric` (`DistanceMetric`, optional): How the vectors are compared. Defaults to `DistanceMetric.cosine`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        """
+        super().__init__()
+        self.metric = DistanceMetric(metric)
+        self.embedding_model = embedding_model
+        self.dim: Optional[int] = None
+        self._index = MetadataIndex()
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._n_deleted = 0
+        self._compacting: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return self._n_rows - self._n_deleted
+
+    @property
+    def _n_rows(self) -> int:
+        # The no. of rows, including the deleted ones
+        raise NotImplementedError
+
+    def _id_rows(self) -> Dict[str, int]:
+        # The row of every id that is not deleted
+        raise NotImplementedError
+
+    def _row_id(self, row: int) -> str:
+        raise NotImplementedError
+
+    async def _compact(self) -> None:
+        # Rebuild without the deleted rows, then call `_reset_tombstones`
+        raise NotImplementedError
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        dim = vectors.shape[-1]
+        if self.dim is not None and dim != self.dim:
+            raise ValueError(f"Embedding should have {self.dim} dimensions, got: {dim}")
+        if self.metric == DistanceMetric.cosine:
+            vectors = normalize(vectors)
+        return vectors
+
+    async def _to_vector(
+        self, text: Optional[str], embedding: Optional[List]
+    ) -> np.ndarray:
+        if embedding is None:
+            if self.embedding_model is None or text is None:
+                raise ValueError(
+                    "Provide an embedding, or a text and an embedding_model to embed it with"
+                )
+            embedding = await self.embedding_model(text)
+        return self._prepare(as_vector(embedding))
+
+    async def _to_matrix(
+        self, texts: List[Optional[str]], embeddings: List[Optional[List]]
+    ) -> np.ndarray:
+        return self._prepare(
+            await embed_matrix(self.embedding_model, texts, embeddings)
+        )
+
+    def _check_new_ids(self, data: List[VectorDBInsert], known: Dict) -> None:
+        seen = set()
+        for item in data:
+            if item.id in known or item.id in seen:
+                raise ValueError(f"Id: {item.id} already exists in the database")
+            seen.add(item.id)
+
+    def _metadata_index(self) -> MetadataIndex:
+        return self._index
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_vectors(self, ids: List[str]) -> np.ndarray:
+        """Return the stored vectors of some ids, eg: for re-ranking search results without embedding them again.
+        They are normalized for `DistanceMetric.cosine`.
+
+        Parameters
+        ----------
+        - `ids` (List[str]): The ids.
+
+        Returns
+        -------
+        - `vectors` (np.ndarray): A float32 (no. of ids, `dim`) array, in the same order as `ids`.
+        """
+        id_rows = self._id_rows()
+        for id in ids:
+            if id not in id_rows:
+                raise ValueError(f"Id: {id} is not in the database")
+        if not ids:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self._row_vectors(np.array([id_rows[id] for id in ids], dtype=np.int64))
+
+    def _live_mask(self, n: int) -> Optional[np.ndarray]:
+        if not self._n_deleted:
+            return None
+        mask = np.ones(n, dtype=bool)
+        tombstones = self._tombstones[:n]
+        mask[: len(tombstones)] = ~tombstones
+        return mask
+
+    def _filter_mask(self, filter: Optional[dict], n: int) -> Optional[np.ndarray]:
+        # The rows that match the filter and are not deleted. None if that is every row
+        live = self._live_mask(n)
+        if not filter:
+            return live
+        mask = self._metadata_index().evaluate(filter, n)
+        if live is not None:
+            mask &= live
+        return mask
+
+    def _reset_tombstones(self) -> None:
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._n_deleted = 0
+
+    def _remove(self, rows: np.ndarray) -> List[str]:
+        # Mark rows as deleted and forget their ids. Returns the ids
+        if len(self._tombstones) < self._n_rows:
+            tombstones = np.zeros(self._n_rows, dtype=bool)
+            tombstones[: len(self._tombstones)] = self._tombstones
+            self._tombstones = tombstones
+        rows = np.unique(rows)
+        rows = rows[~self._tombstones[rows]]
+        self._tombstones[rows] = True
+        self._n_deleted += len(rows)
+        id_rows = self._id_rows()
+        ids = [self._row_id(int(row)) for row in rows]
+        for id in ids:
+            id_rows.pop(id, None)
+        return ids
+
+    async def _delete(self, ids: Optional[List[str]], filter: Optional[dict]) -> int:
+        if ids is None:
+            rows = np.flatnonzero(self._filter_mask(filter, self._n_rows))
+        else:
+            id_rows = self._id_rows()
+            rows = np.array(
+                [id_rows[id] for id in ids if id in id_rows], dtype=np.int64
+            )
+            if filter:
+                rows = rows[self._metadata_index().evaluate(filter, self._n_rows)[rows]]
+        n_deleted = len(self._remove(rows))
+        if (
+            self._n_deleted > self.compaction_threshold * self._n_rows
+            and self._compacting is None
+        ):
+            self._compacting = asyncio.ensure_future(self._compact_in_background())
+        return n_deleted
+
+    async def _compact_in_background(self) -> None:
+        try:
+            await self._compact()
+        finally:
+            self._compacting = None
+
+    async def compact(self) -> None:
+        """Rebuild the database without the deleted rows, which frees their memory and speeds up searches.
+        Called automatically in the background once more than `compaction_threshold` of the rows are deleted.
+        """
+        if self._compacting is None and self._n_deleted:
+            self._compacting = asyncio.ensure_future(self._compact_in_background())
+        if self._compacting is not None:
+            await self._compacting
+
+    async def _upsert_many(self, data: List[VectorDBInsert]) -> None:
+        # Embed first, so that a failing embedding model leaves the old rows in place
+        vectors = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        data = [
+            VectorDBInsert(
+                id=item.id, text=item.text, meta=item.meta, embedding=vector.tolist()
+            )
+            for item, vector in zip(data, vectors)
+        ]
+        await self._delete([item.id for item in data], None)
+        await self._insert_many(data)
+
+    def _masked_top_k(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        mask: Optional[np.ndarray],
+        sq_norms: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the scores and rows of the best `k` rows of `vectors` allowed by `mask`
+        if mask is None:
+            row_scores = scores(vectors, query, self.metric, sq_norms)
+            rows = top_k(row_scores, k)
+            return row_scores[rows], rows
+        allowed = np.flatnonzero(mask)
+        if len(allowed) < self.prefilter_threshold * len(mask):
+            row_scores = scores(
+                vectors[allowed],
+                query,
+                self.metric,
+                None if sq_norms is None else sq_norms[allowed],
+            )
+            best = top_k(row_scores, k)
+            return row_scores[best], allowed[best]
+        row_scores = scores(vectors, query, self.metric, sq_norms)
+        row_scores[~mask] = -np.inf
+        rows = top_k(row_scores, min(k, len(allowed)))
+        return row_scores[rows], rows
@@ -0,0 +1,183 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.filters import MetadataIndex
+from embedia.utils.vectors import score_matrix, top_k_rows
+from embedia.vectordbs.base import LocalVectorDB
+
+# The max no. of scores computed at once by `get_similar_many`
+_MAX_SCORES = 1 << 24
+
+
+class NumpyVectorDB(LocalVectorDB):
+    """An in-memory vector database that keeps the embeddings in one contiguous float32 NumPy matrix.
+    A search is a single matrix-vector product followed by a partial sort, which is exact and fast for up to a few million vectors.
+    `insert_many` and `get_similar_many` work on whole matrices at once.
+
+    Attributes
+    ----------
+    - `metric` (`DistanceMetric`): How the vectors are compared.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `dim` (int): The no. of dimensions of the embeddings. Set by the first insert.
+    """
+
+    def __init__(
+        self,
+        metric: DistanceMetric = DistanceMetric.cosine,
+        embedding_model: Optional[EmbeddingModel] = None,
+        initial_capacity: int = 1024,
+    ) -> None:
+        """Constructor for the `NumpyVectorDB` class.
+
+        Parameters
+        ----------
+        - `metric` (`DistanceMetric`, optional): How the vectors are compared. Defaults to `DistanceMetric.cosine`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        - `initial_capacity` (int, optional): The no. of rows allocated up front. The matrix doubles in size when it is full. Defaults to 1024.
+        """
+        super().__init__(metric, embedding_model)
+        self._capacity = max(initial_capacity, 1)
+        self._vectors: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metas: List[Optional[dict]] = []
+        self._rows: Dict[str, int] = {}
+
+    @property
+    def _n_rows(self) -> int:
+        return len(self._ids)
+
+    def _id_rows(self) -> Dict[str, int]:
+        return self._rows
+
+    def _row_id(self, row: int) -> str:
+        return self._ids[row]
+
+    def _grow(self, dim: int, n: int = 1) -> None:
+        # Make room for `n` more rows
+        if self._vectors is None:
+            self.dim = dim
+            capacity = max(self._capacity, n)
+            self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+            self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        elif self._n_rows + n > len(self._vectors):
+            n_rows = self._n_rows
+            capacity = max(n_rows + n, 2 * len(self._vectors))
+            vectors = np.zeros((capacity, dim), dtype=np.float32)
+            vectors[:n_rows] = self._vectors[:n_rows]
+            sq_norms = np.zeros(capacity, dtype=np.float32)
+            sq_norms[:n_rows] = self._sq_norms[:n_rows]
+            self._vectors, self._sq_norms = vectors, sq_norms
+
+    def _append(self, data: List[VectorDBInsert], vectors: np.ndarray) -> None:
+        self._grow(vectors.shape[1], len(vectors))
+        start = self._n_rows
+        self._vectors[start : start + len(vectors)] = vectors
+        self._sq_norms[start : start + len(vectors)] = (vectors**2).sum(axis=1)
+        for row, item in enumerate(data, start):
+            self._rows[item.id] = row
+            self._ids.append(item.id)
+            self._texts.append(item.text)
+            self._metas.append(item.meta)
+            self._index.add(row, item.meta)
+
+    async def _insert(self, data: VectorDBInsert) -> None:
+        self._check_new_ids([data], self._rows)
+        vector = await self._to_vector(data.text, data.embedding)
+        self._append([data], vector[None])
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        self._check_new_ids(data, self._rows)
+        vectors = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        self._append(data, vectors)
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors[rows]
+
+    def _compact_rows(self, rows: np.ndarray) -> None:
+        # Keep only `rows`, renumbered in order. Deleted rows among them stay deleted
+        live = self._live_mask(self._n_rows)
+        deleted = np.zeros(len(rows), dtype=bool) if live is None else ~live[rows]
+        self._vectors = self._vectors[rows]
+        self._sq_norms = self._sq_norms[rows]
+        self._ids = [self._ids[row] for row in rows]
+        self._texts = [self._texts[row] for row in rows]
+        self._metas = [self._metas[row] for row in rows]
+        self._rows = {id: row for row, id in enumerate(self._ids) if not deleted[row]}
+        self._index = MetadataIndex()
+        for row, meta in enumerate(self._metas):
+            self._index.add(row, meta)
+        self._reset_tombstones()
+        if deleted.any():
+            self._tombstones = deleted
+            self._n_deleted = int(deleted.sum())
+
+    async def _compact(self) -> None:
+        self._compact_rows(np.flatnonzero(self._live_mask(self._n_rows)))
+
+    def _doc(self, row: int) -> TextDoc:
+        return TextDoc(
+            id=self._ids[row], contents=self._texts[row], meta=self._metas[row]
+        )
+
+    async def _get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        if not len(self):
+            return []
+        query = await self._to_vector(data.text, data.embedding)
+        n = self._n_rows
+        row_scores, rows = self._masked_top_k(
+            self._vectors[:n],
+            query,
+            data.n_results,
+            self._filter_mask(data.filter, n),
+            self._sq_norms[:n],
+        )
+        return [
+            (float(score), self._doc(int(row))) for score, row in zip(row_scores, rows)
+        ]
+
+    async def _get_similar_many(
+        self, data: List[VectorDBGetSimilar]
+    ) -> List[List[Tuple[float, TextDoc]]]:
+        if not len(self):
+            return [[] for _ in data]
+        queries = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        n = self._n_rows
+        k = max(item.n_results for item in data)
+        chunk_size = max(1, _MAX_SCORES // n)
+        results = []
+        for i in range(0, len(data), chunk_size):
+            chunk_scores = score_matrix(
+                self._vectors[:n],
+                queries[i : i + chunk_size],
+                self.metric,
+                self._sq_norms[:n],
+            )
+            n_results = []
+            for row_scores, item in zip(chunk_scores, data[i : i + chunk_size]):
+                mask = self._filter_mask(item.filter, n)
+                if mask is None:
+                    n_results.append(item.n_results)
+                else:
+                    row_scores[~mask] = -np.inf
+                    n_results.append(min(item.n_results, int(mask.sum())))
+            for row_scores, rows, n_result in zip(
+                chunk_scores, top_k_rows(chunk_scores, k), n_results
+            ):
+                results.append(
+                    [
+                        (float(row_scores[row]), self._doc(int(row)))
+                        for row in rows[:n_result]
+                    ]
+                )
+        return results
@@ -0,0 +1,457 @@
+import asyncio
+import heapq
+import json
+from typing import List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.typechecking import check_min_val
+from embedia.vectordbs.flat import NumpyVectorDB
+
+# Everything `_reset_graph` sets up
+_GRAPH_ATTRS = (
+    "_entry",
+    "_max_level",
+    "_levels",
+    "_links0",
+    "_counts0",
+    "_upper_offset",
+    "_upper_links",
+    "_upper_counts",
+    "_upper_rows",
+    "_visited",
+    "_visit_tag",
+)
+
+
+class HNSWVectorDB(NumpyVectorDB):
+    """An in-memory vector database with an HNSW (Hierarchical Navigable Small World) graph index.
+    Searches are approximate: they walk the graph instead of scoring every vector, so they stay fast on large collections.
+    The graph is built incrementally on every insert. The neighbour lists are kept in NumPy arrays, not per-node objects.
+
+    Attributes
+    ----------
+    - `metric` (`DistanceMetric`): How the vectors are compared.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `dim` (int): The no. of dimensions of the embeddings. Set by the first insert.
+    - `M` (int): The max no. of neighbours of a node on the upper layers (twice as many on the bottom layer).
+    - `ef_construction` (int): The no. of candidates considered while linking a new node. Higher builds a better graph, slower.
+    - `ef_search` (int): The no. of candidates considered while searching. Higher gives better recall, slower.
+    """
+
+    def __init__(
+        self,
+        metric: DistanceMetric = DistanceMetric.cosine,
+        embedding_model: Optional[EmbeddingModel] = None,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 50,
+        initial_capacity: int = 1024,
+        seed: Optional[int] = None,
+    ) -> None:
+        """Constructor for the `HNSWVectorDB` class.
+
+        Parameters
+        ----------
+        - `metric` (`DistanceMetric`, optional): How the vectors are compared. Defaults to `DistanceMetric.cosine`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        - `M` (int, optional): The max no. of neighbours of a node on the upper layers. Defaults to 16.
+        - `ef_construction` (int, optional): The no. of candidates considered while linking a new node. Defaults to 200.
+        - `ef_search` (int, optional): The no. of candidates considered while searching (at least `n_results` are used). Defaults to 50.
+        - `initial_capacity` (int, optional): The no. of nodes allocated up front. The arrays double in size when they are full. Defaults to 1024.
+        - `seed` (int, optional): The seed for picking the layer of each node. Defaults to None.
+        """
+        super().__init__(metric, embedding_model, initial_capacity)
+        check_min_val(M, 2, "M")
+        check_min_val(ef_construction, 1, "ef_construction")
+        check_min_val(ef_search, 1, "ef_search")
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._max_m0 = 2 * M
+        self._level_mult = 1 / np.log(M)
+        self._rng = np.random.default_rng(seed)
+        self._reset_graph()
+
+    def _reset_graph(self) -> None:
+        self._entry = -1
+        self._max_level = -1
+        # Bottom layer: one row of neighbours per node
+        self._levels = np.zeros(0, dtype=np.int8)
+        self._links0 = np.zeros((0, self._max_m0), dtype=np.int32)
+        self._counts0 = np.zeros(0, dtype=np.int32)
+        # Upper layers: a node on level L owns L consecutive rows starting at its offset
+        self._upper_offset = np.zeros(0, dtype=np.int64)
+        self._upper_links = np.zeros((0, self.M), dtype=np.int32)
+        self._upper_counts = np.zeros(0, dtype=np.int32)
+        self._upper_rows = 0
+        self._visited = np.zeros(0, dtype=np.uint32)
+        self._visit_tag = 0
+
+    def _grow(self, dim: int, n: int = 1) -> None:
+        super()._grow(dim, n)
+        extra = len(self._vectors) - len(self._levels)
+        if extra > 0:
+            self._levels = np.concatenate([self._levels, np.zeros(extra, np.int8)])
+            self._links0 = np.concatenate(
+                [self._links0, np.zeros((extra, self._max_m0), np.int32)]
+            )
+            self._counts0 = np.concatenate([self._counts0, np.zeros(extra, np.int32)])
+            self._upper_offset = np.concatenate(
+                [self._upper_offset, np.full(extra, -1, np.int64)]
+            )
+            self._visited = np.concatenate([self._visited, np.zeros(extra, np.uint32)])
+
+    def _add_upper_rows(self, node: int, level: int) -> None:
+        needed = self._upper_rows + level
+        if needed > len(self._upper_links):
+            extra = max(needed, 2 * len(self._upper_links)) - len(self._upper_links)
+            self._upper_links = np.concatenate(
+                [self._upper_links, np.zeros((extra, self.M), np.int32)]
+            )
+            self._upper_counts = np.concatenate(
+                [self._upper_counts, np.zeros(extra, np.int32)]
+            )
+        self._upper_offset[node] = self._upper_rows
+        self._upper_rows = needed
+
+    def _neighbors(self, node: int, layer: int) -> np.ndarray:
+        if layer == 0:
+            return self._links0[node, : self._counts0[node]]
+        row = self._upper_offset[node] + layer - 1
+        return self._upper_links[row, : self._upper_counts[row]]
+
+    def _set_neighbors(self, node: int, layer: int, neighbors: List[int]) -> None:
+        if layer == 0:
+            self._links0[node, : len(neighbors)] = neighbors
+            self._counts0[node] = len(neighbors)
+        else:
+            row = self._upper_offset[node] + layer - 1
+            self._upper_links[row, : len(neighbors)] = neighbors
+            self._upper_counts[row] = len(neighbors)
+
+    def _distances(self, query: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        # Lower is closer. For l2 this is the squared distance, which sorts the same way.
+        products = self._vectors[nodes] @ query
+        if self.metric == DistanceMetric.l2:
+            return self._sq_norms[nodes] - 2 * products + query @ query
+        return -products
+
+    def _score(self, distance: float) -> float:
+        if self.metric == DistanceMetric.l2:
+            return -float(np.sqrt(max(distance, 0.0)))
+        return -distance
+
+    def _search_layer(
+        self, query: np.ndarray, entry_points: List[int], ef: int, layer: int
+    ) -> List[Tuple[float, int]]:
+        self._visit_tag += 1
+        if self._visit_tag == np.iinfo(np.uint32).max:
+            self._visited[:] = 0
+            self._visit_tag = 1
+        tag, visited = self._visit_tag, self._visited
+
+        entry_points = np.asarray(entry_points, dtype=np.int64)
+        visited[entry_points] = tag
+        dists = self._distances(query, entry_points).tolist()
+        candidates = list(zip(dists, entry_points.tolist()))
+        heapq.heapify(candidates)
+        # A max-heap of the best `ef` nodes found so far
+        results = [(-dist, node) for dist, node in candidates]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            dist, node = heapq.heappop(candidates)
+            if dist > -results[0][0]:
+                break
+            neighbors = self._neighbors(node, layer)
+            neighbors = neighbors[visited[neighbors] != tag]
+            if not len(neighbors):
+                continue
+            visited[neighbors] = tag
+            worst = -results[0][0]
+            for n_dist, neighbor in zip(
+                self._distances(query, neighbors).tolist(), neighbors.tolist()
+            ):
+                if len(results) < ef or n_dist < worst:
+                    heapq.heappush(candidates, (n_dist, neighbor))
+                    heapq.heappush(results, (-n_dist, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+                    worst = -results[0][0]
+        return sorted((-dist, node) for dist, node in results)
+
+    def _pair_distances(self, nodes: np.ndarray) -> np.ndarray:
+        # The distances between every two of the nodes in one matrix product, lower is closer
+        vectors = self._vectors[nodes]
+        products = vectors @ vectors.T
+        if self.metric == DistanceMetric.l2:
+            sq_norms = self._sq_norms[nodes]
+            return sq_norms[:, None] - 2 * products + sq_norms[None, :]
+        return -products
+
+    def _select_neighbors(
+        self, candidates: List[Tuple[float, int]], m: int
+    ) -> List[int]:
+        # Keep a candidate only if it is closer to the new node than to every neighbour kept so far,
+        # which spreads the links out in different directions
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        dists = np.array([dist for dist, _ in candidates])
+        nodes = np.array([node for _, node in candidates])
+        pair_dists = self._pair_distances(nodes)
+        # A candidate is blocked once a kept neighbour is closer to it than the new node is
+        blocked = np.zeros(len(candidates), dtype=bool)
+        selected: List[int] = []
+        i = 0
+        while len(selected) < m:
+            free = np.flatnonzero(~blocked[i:])
+            if not len(free):
+                break
+            i += int(free[0])
+            selected.append(int(nodes[i]))
+            blocked |= pair_dists[i] < dists
+            i += 1
+        return selected
+
+    def _descend(self, query: np.ndarray, to_layer: int) -> List[int]:
+        entry_points = [self._entry]
+        for layer in range(self._max_level, to_layer, -1):
+            entry_points = [self._search_layer(query, entry_points, 1, layer)[0][1]]
+        return entry_points
+
+    def _link(self, node: int, level: int) -> None:
+        query = self._vectors[node]
+        entry_points = self._descend(query, level)
+        for layer in range(min(level, self._max_level), -1, -1):
+            candidates = self._search_layer(
+                query, entry_points, self.ef_construction, layer
+            )
+            max_m = self._max_m0 if layer == 0 else self.M
+            neighbors = self._select_neighbors(candidates, self.M)
+            self._set_neighbors(node, layer, neighbors)
+            for neighbor in neighbors:
+                current = self._neighbors(neighbor, layer)
+                if len(current) < max_m:
+                    self._set_neighbors(neighbor, layer, current.tolist() + [node])
+                    continue
+                links = np.append(current, node)
+                dists = self._distances(self._vectors[neighbor], links)
+                order = np.argsort(dists)
+                self._set_neighbors(
+                    neighbor,
+                    layer,
+                    self._select_neighbors(
+                        list(zip(dists[order].tolist(), links[order].tolist())), max_m
+                    ),
+                )
+            entry_points = [node for _, node in candidates]
+
+    def _add_node(self, node: int) -> None:
+        level = int(-np.log(1.0 - self._rng.random()) * self._level_mult)
+        self._levels[node] = level
+        if level > 0:
+            self._add_upper_rows(node, level)
+        if self._entry >= 0:
+            self._link(node, level)
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+
+    async def _insert(self, data: VectorDBInsert) -> None:
+        await super()._insert(data)
+        self._add_node(self._n_rows - 1)
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        # The vectors are stored in one go, but the graph is still linked one node at a time
+        start = self._n_rows
+        await super()._insert_many(data)
+        for node in range(start, self._n_rows):
+            self._add_node(node)
+
+    def _build_graph(
+        self, vectors: np.ndarray, sq_norms: np.ndarray, seed: int
+    ) -> "HNSWVectorDB":
+        # Links `vectors` into the graph of a new index, without touching this one. Runs in a thread
+        graph = HNSWVectorDB(
+            self.metric,
+            M=self.M,
+            ef_construction=self.ef_construction,
+            ef_search=self.ef_search,
+            seed=seed,
+        )
+        graph.dim, graph._vectors, graph._sq_norms = self.dim, vectors, sq_norms
+        graph._grow(self.dim, 0)
+        for node in range(len(vectors)):
+            graph._add_node(node)
+        return graph
+
+    async def _compact(self) -> None:
+        # The graph is rebuilt from scratch, since unlinking nodes would leave it poorly connected.
+        # The rebuild runs in a thread over a snapshot of the live rows, while this index keeps serving
+        # searches, inserts and deletes with the old graph
+        n = self._n_rows
+        live = self._live_mask(n)
+        rows = np.arange(n) if live is None else np.flatnonzero(live)
+        graph = None
+        if len(rows):
+            graph = await asyncio.get_running_loop().run_in_executor(
+                None,
+                self._build_graph,
+                self._vectors[rows],
+                self._sq_norms[rows],
+                int(self._rng.integers(1 << 62)),
+            )
+        # No awaits from here on, so the new graph is swapped in before any other coroutine runs.
+        # Rows deleted during the rebuild stay as tombstones, rows inserted during it are linked now
+        self._compact_rows(np.concatenate([rows, np.arange(n, self._n_rows)]))
+        self._reset_graph()
+        if graph is not None:
+            for attr in _GRAPH_ATTRS:
+                setattr(self, attr, getattr(graph, attr))
+        if self._n_rows:
+            self._grow(self.dim, 0)
+            for node in range(len(rows), self._n_rows):
+                self._add_node(node)
+
+    async def _get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        if not len(self):
+            return []
+        query = await self._to_vector(data.text, data.embedding)
+        n = self._n_rows
+        mask = self._filter_mask(data.filter, n)
+        if mask is not None and mask.sum() < self.prefilter_threshold * n:
+            # Few rows match, scoring them exactly is cheaper than walking the graph
+            row_scores, rows = self._masked_top_k(
+                self._vectors[:n], query, data.n_results, mask, self._sq_norms[:n]
+            )
+            return [
+                (float(score), self._doc(int(row)))
+                for score, row in zip(row_scores, rows)
+            ]
+
+        entry_points = self._descend(query, 0)
+        ef = max(self.ef_search, data.n_results)
+        while True:
+            results = self._search_layer(query, entry_points, ef, 0)
+            if mask is not None:
+                results = [(dist, node) for dist, node in results if mask[node]]
+            # Widen the search until enough matching rows are found
+            if len(results) >= data.n_results or ef >= n:
+                break
+            ef *= 2
+        return [
+            (self._score(dist), self._doc(node))
+            for dist, node in results[: data.n_results]
+        ]
+
+    async def _get_similar_many(
+        self, data: List[VectorDBGetSimilar]
+    ) -> List[List[Tuple[float, TextDoc]]]:
+        # Every query walks the graph on its own, only the embedding of texts is batched
+        if not len(self):
+            return [[] for _ in data]
+        queries = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        return [
+            await self._get_similar(
+                VectorDBGetSimilar(
+                    embedding=query, n_results=item.n_results, filter=item.filter
+                )
+            )
+            for query, item in zip(queries.tolist(), data)
+        ]
+
+    def save(self, path: str) -> None:
+        """Save the index and the documents to a `.npz` file.
+
+        Parameters
+        ----------
+        - `path` (str): The path to the file.
+        """
+        n, rows = self._n_rows, self._upper_rows
+        arrays = {}
+        if n:
+            arrays = {
+                "vectors": self._vectors[:n],
+                "sq_norms": self._sq_norms[:n],
+                "levels": self._levels[:n],
+                "links0": self._links0[:n],
+                "counts0": self._counts0[:n],
+                "upper_offset": self._upper_offset[:n],
+                "upper_links": self._upper_links[:rows],
+                "upper_counts": self._upper_counts[:rows],
+                "deleted": np.flatnonzero(self._tombstones),
+            }
+        np.savez(
+            path,
+            params=np.array(
+                [self.M, self.ef_construction, self.ef_search, self._entry]
+                + [self._max_level, rows]
+            ),
+            metric=np.array(self.metric.value),
+            docs=np.array(
+                json.dumps(
+                    {"ids": self._ids, "texts": self._texts, "metas": self._metas}
+                )
+            ),
+            **arrays,
+        )
+
+    @classmethod
+    def load(
+        cls, path: str, embedding_model: Optional[EmbeddingModel] = None
+    ) -> "HNSWVectorDB":
+        """Load an index saved with `save`.
+
+        Parameters
+        ----------
+        - `path` (str): The path to the file.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+
+        Returns
+        -------
+        - `db` (`HNSWVectorDB`): The loaded database.
+        """
+        with np.load(path) as f:
+            M, ef_construction, ef_search, entry, max_level, rows = f["params"].tolist()
+            db = cls(
+                metric=DistanceMetric(str(f["metric"])),
+                embedding_model=embedding_model,
+                M=M,
+                ef_construction=ef_construction,
+                ef_search=ef_search,
+            )
+            docs = json.loads(str(f["docs"]))
+            if docs["ids"]:
+                db._vectors = f["vectors"].copy()
+                db._sq_norms = f["sq_norms"].copy()
+                db.dim = db._vectors.shape[1]
+                db._levels = f["levels"].copy()
+                db._links0 = f["links0"].copy()
+                db._counts0 = f["counts0"].copy()
+                db._upper_offset = f["upper_offset"].copy()
+                db._upper_links = f["upper_links"].copy()
+                db._upper_counts = f["upper_counts"].copy()
+                db._visited = np.zeros(len(db._vectors), dtype=np.uint32)
+                deleted = f["deleted"] if "deleted" in f else []
+        db._entry, db._max_level, db._upper_rows = entry, max_level, rows
+        db._ids, db._texts, db._metas = docs["ids"], docs["texts"], docs["metas"]
+        db._rows = {id: row for row, id in enumerate(db._ids)}
+        for row, meta in enumerate(db._metas):
+            db._index.add(row, meta)
+        if docs["ids"]:
+            # A deleted id can appear again on a later row, so only drop ids that are still on a deleted row
+            db._tombstones = np.zeros(len(db._ids), dtype=bool)
+            db._tombstones[deleted] = True
+            db._n_deleted = int(db._tombstones.sum())
+            for id, row in list(db._rows.items()):
+                if db._tombstones[row]:
+                    del db._rows[id]
+        return db
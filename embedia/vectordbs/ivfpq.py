@@ -0,0 +1,339 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.filters import MetadataIndex
+from embedia.utils.typechecking import check_min_val
+from embedia.utils.vectors import (
+    GrowableArray,
+    as_vector,
+    kmeans,
+    nearest,
+    normalize,
+    scores,
+    top_k,
+)
+from embedia.vectordbs.base import LocalVectorDB
+
+
+class IVFPQVectorDB(LocalVectorDB):
+    """A compressed in-memory vector database using an inverted file (IVF) with product quantization (PQ).
+    The vectors are clustered into `n_lists` lists with k-means. The residual of every vector from its list's
+    centroid is split into `n_subvectors` parts, and each part is stored as the 1-byte id of its nearest codeword.
+    A 1536-dim float32 embedding (6 KB) is stored in `n_subvectors` bytes.
+
+    A search scores the `n_probe` closest lists with lookup tables of query-to-codeword distances.
+    If `rerank` is set, full vectors are kept and the best `rerank` candidates are re-scored exactly.
+
+    The index is trained once `train_size` vectors are inserted, on a random sample of `train_size` of them
+    (or on an explicit `train` call).
+    Until then, the vectors are kept in full and searched exactly.
+
+    Attributes
+    ----------
+    - `metric` (`DistanceMetric`): How the vectors are compared.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `n_lists` (int): The no. of k-means lists.
+    - `n_subvectors` (int): The no. of bytes each vector is compressed to. Must divide the embedding dimension.
+    - `n_probe` (int): The no. of lists scanned per search.
+    - `rerank` (int): The no. of candidates re-scored with the full vectors. 0 means full vectors are not kept.
+    - `train_size` (int): The max no. of inserted vectors the index is trained on.
+    - `is_trained` (bool): Whether the quantizers have been trained.
+    """
+
+    def __init__(
+        self,
+        metric: DistanceMetric = DistanceMetric.cosine,
+        embedding_model: Optional[EmbeddingModel] = None,
+        n_lists: int = 256,
+        n_subvectors: int = 16,
+        n_probe: int = 8,
+        rerank: int = 0,
+        train_size: int = 10000,
+        seed: Optional[int] = None,
+    ) -> None:
+        """Constructor for the `IVFPQVectorDB` class.
+
+        Parameters
+        ----------
+        - `metric` (`DistanceMetric`, optional): How the vectors are compared. Defaults to `DistanceMetric.cosine`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        - `n_lists` (int, optional): The no. of k-means lists. Defaults to 256.
+        - `n_subvectors` (int, optional): The no. of bytes each vector is compressed to. Defaults to 16.
+        - `n_probe` (int, optional): The no. of lists scanned per search. Defaults to 8.
+        - `rerank` (int, optional): The no. of candidates re-scored with the full vectors. Defaults to 0 (no full vectors are kept).
+        - `train_size` (int, optional): The index is trained automatically once this many vectors are inserted. Defaults to 10000.
+        - `seed` (int, optional): The seed for k-means. Defaults to None.
+        """
+        super().__init__(metric, embedding_model)
+        check_min_val(n_lists, 1, "n_lists")
+        check_min_val(n_subvectors, 1, "n_subvectors")
+        check_min_val(n_probe, 1, "n_probe")
+        check_min_val(rerank, 0, "rerank")
+        check_min_val(train_size, 1, "train_size")
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.n_probe = n_probe
+        self.rerank = rerank
+        self.train_size = train_size
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        # (n_subvectors, n_codewords, dim // n_subvectors)
+        self._codebooks: Optional[np.ndarray] = None
+        self._list_codes: List[GrowableArray] = []
+        self._list_rows: List[GrowableArray] = []
+        # Full vectors, kept until training and afterwards only for re-ranking
+        self._full: Optional[GrowableArray] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metas: List[Optional[dict]] = []
+        self._rows: Dict[str, int] = {}
+
+    @property
+    def _n_rows(self) -> int:
+        return len(self._ids)
+
+    def _id_rows(self) -> Dict[str, int]:
+        return self._rows
+
+    def _row_id(self, row: int) -> str:
+        return self._ids[row]
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def _check_dim(self, dim: int) -> None:
+        if dim % self.n_subvectors:
+            raise ValueError(
+                f"n_subvectors: {self.n_subvectors} should divide the embedding dimension: {dim}"
+            )
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        lists = nearest(vectors, self._centroids)
+        residuals = vectors - self._centroids[lists]
+        sub_dim = self.dim // self.n_subvectors
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for i, codebook in enumerate(self._codebooks):
+            codes[:, i] = nearest(
+                residuals[:, i * sub_dim : (i + 1) * sub_dim], codebook
+            )
+        return lists, codes
+
+    def _add_codes(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        lists, codes = self._encode(vectors)
+        for list_id in np.unique(lists):
+            mask = lists == list_id
+            self._list_codes[list_id].extend(codes[mask])
+            self._list_rows[list_id].extend(rows[mask])
+
+    def _decode_all(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Approximate every encoded vector as its list centroid plus the codewords of its residual
+        rows = np.concatenate([list_rows.data for list_rows in self._list_rows])
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        sub_dim = self.dim // self.n_subvectors
+        start = 0
+        for list_id, codes in enumerate(self._list_codes):
+            end = start + len(codes)
+            vectors[start:end] = self._centroids[list_id]
+            for i, codebook in enumerate(self._codebooks):
+                vectors[start:end, i * sub_dim : (i + 1) * sub_dim] += codebook[
+                    codes.data[:, i]
+                ]
+            start = end
+        return rows, vectors
+
+    async def train(self, embeddings: Optional[List[List[float]]] = None) -> None:
+        """Train the coarse quantizer and the product quantizer, then encode the vectors inserted so far.
+        When the index is retrained without the full vectors (`rerank` is 0), the inserted vectors are
+        re-encoded from their decoded codes, which adds to their quantization error.
+
+        Parameters
+        ----------
+        - `embeddings` (List[List[float]], optional): The sample to train on. Defaults to a random sample of at most `train_size` of the vectors inserted so far.
+        """
+        if embeddings is None:
+            if self._full is None:
+                raise ValueError("There is nothing to train on")
+            sample = self._full.data
+            if len(sample) > self.train_size:
+                # Every inserted vector is still encoded below, only k-means runs on the sample
+                sample = sample[
+                    self._rng.choice(len(sample), self.train_size, replace=False)
+                ]
+        else:
+            sample = np.stack([as_vector(embedding) for embedding in embeddings])
+            if self.metric == DistanceMetric.cosine:
+                sample = normalize(sample)
+        dim = sample.shape[1]
+        self._check_dim(dim)
+        if self.dim is not None and dim != self.dim:
+            raise ValueError(f"Embedding should have {self.dim} dimensions, got: {dim}")
+        self.dim = dim
+        existing = None
+        if self._full is not None and len(self._full):
+            existing = np.arange(len(self._full)), self._full.data
+        elif self.is_trained and self._n_rows:
+            existing = self._decode_all()
+
+        self._centroids, labels = kmeans(sample, self.n_lists, rng=self._rng)
+        residuals = sample - self._centroids[labels]
+        sub_dim = dim // self.n_subvectors
+        self._codebooks = np.stack(
+            [
+                kmeans(
+                    residuals[:, i * sub_dim : (i + 1) * sub_dim], 256, rng=self._rng
+                )[0]
+                for i in range(self.n_subvectors)
+            ]
+        )
+        self._list_codes = [
+            GrowableArray((self.n_subvectors,), np.uint8, 16)
+            for _ in range(len(self._centroids))
+        ]
+        self._list_rows = [GrowableArray((), np.int64, 16) for _ in self._centroids]
+        if existing is not None:
+            self._add_codes(*existing)
+        if not self.rerank:
+            self._full = None
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        if self._full is None:
+            raise ValueError(
+                "Only the compressed vectors are kept, set rerank to keep full vectors"
+            )
+        return self._full.data[rows]
+
+    async def _compact(self) -> None:
+        keep = self._live_mask(self._n_rows)
+        rows = np.flatnonzero(keep)
+        # The new no. of every kept row
+        new_rows = np.cumsum(keep) - 1
+        for i, (codes, list_rows) in enumerate(zip(self._list_codes, self._list_rows)):
+            kept = keep[list_rows.data]
+            self._list_codes[i] = GrowableArray((self.n_subvectors,), np.uint8, 16)
+            self._list_codes[i].extend(codes.data[kept])
+            self._list_rows[i] = GrowableArray((), np.int64, 16)
+            self._list_rows[i].extend(new_rows[list_rows.data[kept]])
+        if self._full is not None:
+            full = GrowableArray((self.dim,), np.float32, len(rows))
+            full.extend(self._full.data[rows])
+            self._full = full
+        self._ids = [self._ids[row] for row in rows]
+        self._texts = [self._texts[row] for row in rows]
+        self._metas = [self._metas[row] for row in rows]
+        self._rows = {id: row for row, id in enumerate(self._ids)}
+        self._index = MetadataIndex()
+        for row, meta in enumerate(self._metas):
+            self._index.add(row, meta)
+        self._reset_tombstones()
+
+    async def _insert(self, data: VectorDBInsert) -> None:
+        self._check_new_ids([data], self._rows)
+        vector = await self._to_vector(data.text, data.embedding)
+        await self._append([data], vector[None])
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        self._check_new_ids(data, self._rows)
+        vectors = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        await self._append(data, vectors)
+
+    async def _append(self, data: List[VectorDBInsert], vectors: np.ndarray) -> None:
+        if self.dim is None:
+            # Checked before any state changes, so that a bad first insert leaves the database empty
+            self._check_dim(vectors.shape[1])
+            self.dim = vectors.shape[1]
+        start = self._n_rows
+        for row, item in enumerate(data, start):
+            self._rows[item.id] = row
+            self._ids.append(item.id)
+            self._texts.append(item.text)
+            self._metas.append(item.meta)
+            self._index.add(row, item.meta)
+
+        if not self.is_trained or self.rerank:
+            if self._full is None:
+                self._full = GrowableArray((self.dim,), np.float32)
+            self._full.extend(vectors)
+        if self.is_trained:
+            self._add_codes(np.arange(start, self._n_rows), vectors)
+        elif self._n_rows >= self.train_size:
+            await self.train()
+
+    def _scan(
+        self, query: np.ndarray, n_probe: int, mask: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the approximate scores (higher is closer) and rows of the vectors in the probed lists
+        sub_dim = self.dim // self.n_subvectors
+        subspaces = np.arange(self.n_subvectors)[None, :]
+        if self.metric == DistanceMetric.l2:
+            coarse = -((self._centroids - query) ** 2).sum(axis=1)
+        else:
+            coarse = self._centroids @ query
+            # Inner products with the codewords do not depend on the list
+            table = np.einsum(
+                "msd,md->ms", self._codebooks, query.reshape(self.n_subvectors, sub_dim)
+            )
+
+        all_scores, all_rows = [], []
+        for list_id in top_k(coarse, n_probe):
+            codes = self._list_codes[list_id].data
+            rows = self._list_rows[list_id].data
+            if mask is not None:
+                allowed = mask[rows]
+                codes, rows = codes[allowed], rows[allowed]
+            if not len(codes):
+                continue
+            if self.metric == DistanceMetric.l2:
+                residual = (query - self._centroids[list_id]).reshape(
+                    self.n_subvectors, 1, sub_dim
+                )
+                table = -((self._codebooks - residual) ** 2).sum(axis=2)
+                all_scores.append(table[subspaces, codes].sum(axis=1))
+            else:
+                all_scores.append(coarse[list_id] + table[subspaces, codes].sum(axis=1))
+            all_rows.append(rows)
+        if not all_scores:
+            return np.empty(0, np.float32), np.empty(0, np.int64)
+        return np.concatenate(all_scores), np.concatenate(all_rows)
+
+    async def _get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        if not len(self):
+            return []
+        query = await self._to_vector(data.text, data.embedding)
+        mask = self._filter_mask(data.filter, self._n_rows)
+        if not self.is_trained:
+            row_scores, rows = self._masked_top_k(
+                self._full.data, query, data.n_results, mask
+            )
+        else:
+            n_probe = self.n_probe
+            if mask is not None and mask.sum() < self.prefilter_threshold * len(mask):
+                # The few matching rows can be in any list
+                n_probe = len(self._centroids)
+            row_scores, rows = self._scan(query, n_probe, mask)
+            if self.metric == DistanceMetric.l2:
+                # The tables hold squared distances
+                row_scores = -np.sqrt(np.maximum(-row_scores, 0))
+            if self.rerank:
+                best = top_k(row_scores, max(self.rerank, data.n_results))
+                rows = rows[best]
+                row_scores = scores(self._full.data[rows], query, self.metric)
+
+        return [
+            (
+                float(row_scores[i]),
+                TextDoc(
+                    id=self._ids[rows[i]],
+                    contents=self._texts[rows[i]],
+                    meta=self._metas[rows[i]],
+                ),
+            )
+            for i in top_k(row_scores, data.n_results)
+        ]
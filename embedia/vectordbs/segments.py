@@ -0,0 +1,518 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.filters import MetadataIndex
+from embedia.utils.typechecking import check_min_val
+from embedia.utils.vectors import GrowableArray, score_matrix, top_k_rows
+from embedia.vectordbs.base import LocalVectorDB
+
+MANIFEST = "manifest.json"
+WAL = "wal.jsonl"
+
+
+def _write_file(path: str, chunks) -> None:
+    # Write to a temporary file first so that a crash never leaves a half-written file behind
+    with open(path + ".tmp", "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _write_segment(
+    directory: str, name: str, vectors: np.ndarray, docs: List[dict]
+) -> None:
+    _write_encoded(
+        directory, name, vectors, [json.dumps(doc).encode("utf-8") for doc in docs]
+    )
+
+
+def _write_encoded(
+    directory: str, name: str, vectors: np.ndarray, encoded: List[bytes]
+) -> None:
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(line) for line in encoded])
+    base = os.path.join(directory, name)
+    _write_file(base + ".vec", [np.ascontiguousarray(vectors, np.float32).tobytes()])
+    _write_file(base + ".docs", encoded)
+    _write_file(base + ".offsets", [offsets.tobytes()])
+
+
+def _merge_segments(directory: str, name: str, segments: List["_Segment"]) -> None:
+    base = os.path.join(directory, name)
+    _write_file(base + ".vec", (segment.vectors.tobytes() for segment in segments))
+    _write_file(base + ".docs", (segment.docs.tobytes() for segment in segments))
+    offsets, shift = [np.zeros(1, dtype=np.int64)], 0
+    for segment in segments:
+        offsets.append(segment.offsets[1:] + shift)
+        shift += int(segment.offsets[-1])
+    _write_file(base + ".offsets", [np.concatenate(offsets).tobytes()])
+
+
+def _compact_segment(
+    directory: str, name: str, segment: "_Segment", rows: np.ndarray
+) -> None:
+    encoded = [
+        segment.docs[segment.offsets[row] : segment.offsets[row + 1]].tobytes()
+        for row in rows
+    ]
+    _write_encoded(directory, name, segment.vectors[rows], encoded)
+
+
+class _Segment:
+    """A sealed, read-only segment: the vectors, the documents and the byte offsets of every document."""
+
+    def __init__(self, directory: str, name: str, count: int, dim: int) -> None:
+        base = os.path.join(directory, name)
+        self.name = name
+        self.count = count
+        self.vectors = np.memmap(base + ".vec", np.float32, "r", shape=(count, dim))
+        self.docs = np.memmap(base + ".docs", np.uint8, "r")
+        self.offsets = np.memmap(base + ".offsets", np.int64, "r", shape=(count + 1,))
+
+    def doc(self, row: int) -> dict:
+        return json.loads(
+            self.docs[self.offsets[row] : self.offsets[row + 1]].tobytes()
+        )
+
+    def files(self) -> List[str]:
+        return [self.name + suffix for suffix in (".vec", ".docs", ".offsets")]
+
+
+class MmapVectorDB(LocalVectorDB):
+    """A persistent vector database that memory-maps its data instead of loading it.
+    New vectors are appended to a write-ahead log and kept in memory until `segment_size` of them are collected.
+    They are then written to an immutable segment: a float32 `.vec` file, a `.docs` file with one JSON document per row
+    and an `.offsets` sidecar with the byte offset of every document. A `manifest.json` lists the live segments.
+
+    Opening a database maps the segments with `numpy.memmap` and replays the write-ahead log, so startup time does not
+    grow with the collection and worker processes share the pages through the OS page cache.
+    Small segments are merged in the background once there are more than `max_segments` of them.
+    Deletes are logged by id and a tombstone bitmap of the segment rows is written with every manifest.
+    Compaction rewrites the segments that have deleted rows in a worker thread.
+    Only one process should write to a database at a time.
+
+    Attributes
+    ----------
+    - `path` (str): The directory of the database.
+    - `metric` (`DistanceMetric`): How the vectors are compared.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `segment_size` (int): The no. of vectors collected in memory before they are written to a segment.
+    - `max_segments` (int): The no. of segments above which they are merged.
+    - `sync` (bool): Whether every write-ahead log entry is fsynced.
+    - `dim` (int): The no. of dimensions of the embeddings. Set by the first insert.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        metric: DistanceMetric = DistanceMetric.cosine,
+        embedding_model: Optional[EmbeddingModel] = None,
+        segment_size: int = 10000,
+        max_segments: int = 8,
+        sync: bool = False,
+    ) -> None:
+        """Constructor for the `MmapVectorDB` class. Opens the database at `path`, or creates it.
+
+        Parameters
+        ----------
+        - `path` (str): The directory of the database.
+        - `metric` (`DistanceMetric`, optional): How the vectors are compared. Ignored when an existing database is opened. Defaults to `DistanceMetric.cosine`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        - `segment_size` (int, optional): The no. of vectors collected in memory before they are written to a segment. Defaults to 10000.
+        - `max_segments` (int, optional): The no. of segments above which they are merged. Defaults to 8.
+        - `sync` (bool, optional): Whether every write-ahead log entry is fsynced. Slower, but survives power loss. Defaults to False.
+        """
+        check_min_val(segment_size, 1, "segment_size")
+        check_min_val(max_segments, 1, "max_segments")
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.sync = sync
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self._manifest = json.load(f)
+        else:
+            self._manifest = {
+                "metric": DistanceMetric(metric).value,
+                "dim": None,
+                "segments": [],
+                "next_segment": 0,
+                "flushed_seq": 0,
+            }
+        super().__init__(self._manifest["metric"], embedding_model)
+        self.dim = self._manifest["dim"]
+        self._segments = [
+            _Segment(path, segment["name"], segment["count"], self.dim)
+            for segment in self._manifest["segments"]
+        ]
+        self._seq = self._manifest["flushed_seq"]
+        self._buffer: Optional[GrowableArray] = None
+        self._buffer_docs: List[dict] = []
+        self._ids: Optional[Dict[str, int]] = None
+        self._index: Optional[MetadataIndex] = None
+        self._merging: Optional[asyncio.Future] = None
+        # Whether the write-ahead log has deletes that are not in the manifest's tombstones yet
+        self._logged_deletes = False
+        if self._manifest.get("deleted"):
+            self._tombstones = np.fromfile(
+                os.path.join(path, self._manifest["deleted"]), dtype=bool
+            )
+            self._n_deleted = int(self._tombstones.sum())
+        self._replay_wal()
+        self._wal = open(os.path.join(path, WAL), "a", encoding="utf-8")
+
+    @property
+    def _n_rows(self) -> int:
+        return sum(segment.count for segment in self._segments) + len(self._buffer_docs)
+
+    def _replay_wal(self) -> None:
+        wal_path = os.path.join(self.path, WAL)
+        if not os.path.exists(wal_path):
+            return
+        with open(wal_path, "rb+") as f:
+            for line in iter(f.readline, b""):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write at the end of the log, cut it off so that new entries start on a clean line
+                    f.truncate(f.tell() - len(line))
+                    break
+                if entry["seq"] <= self._manifest["flushed_seq"]:
+                    continue
+                self._seq = entry["seq"]
+                if "delete" in entry:
+                    id_rows = self._id_rows()
+                    super()._remove(
+                        np.array(
+                            [id_rows[id] for id in entry["delete"] if id in id_rows],
+                            dtype=np.int64,
+                        )
+                    )
+                    self._logged_deletes = True
+                    continue
+                self._buffer_row(
+                    np.asarray(entry["embedding"], np.float32), entry["doc"]
+                )
+
+    def _buffer_row(self, vector: np.ndarray, doc: dict) -> None:
+        if self.dim is None:
+            self.dim = len(vector)
+        if self._buffer is None:
+            self._buffer = GrowableArray((self.dim,), np.float32)
+        self._buffer.append(vector)
+        self._buffer_docs.append(doc)
+        if self._ids is not None:
+            self._ids[doc["id"]] = self._n_rows - 1
+        if self._index is not None:
+            self._index.add(self._n_rows - 1, doc["meta"])
+
+    def _save_manifest(self) -> None:
+        self._manifest["dim"] = self.dim
+        self._manifest["segments"] = [
+            {"name": segment.name, "count": segment.count} for segment in self._segments
+        ]
+        old_deleted = self._manifest.get("deleted")
+        self._manifest["deleted"] = None
+        if self._n_deleted:
+            # Only the segment rows, buffered rows get their tombstones back from the write-ahead log
+            n_rows = sum(segment.count for segment in self._segments)
+            self._manifest["deleted"] = f"{self._new_segment_name()}.deleted"
+            _write_file(
+                os.path.join(self.path, self._manifest["deleted"]),
+                [self._tombstones[:n_rows].tobytes()],
+            )
+        _write_file(
+            os.path.join(self.path, MANIFEST), [json.dumps(self._manifest).encode()]
+        )
+        if old_deleted and old_deleted != self._manifest["deleted"]:
+            os.remove(os.path.join(self.path, old_deleted))
+
+    def _new_segment_name(self) -> str:
+        name = f"{self._manifest['next_segment']:08d}"
+        self._manifest["next_segment"] += 1
+        return name
+
+    def _id_rows(self) -> Dict[str, int]:
+        # Built on the first insert or delete only, so that read-only processes start without reading every document
+        if self._ids is None:
+            self._ids = {}
+            live = self._live_mask(self._n_rows)
+            row = 0
+            for segment in self._segments:
+                for i in range(segment.count):
+                    if live is None or live[row]:
+                        self._ids[segment.doc(i)["id"]] = row
+                    row += 1
+            for doc in self._buffer_docs:
+                if live is None or live[row]:
+                    self._ids[doc["id"]] = row
+                row += 1
+        return self._ids
+
+    def _doc_at(self, row: int) -> dict:
+        for segment in self._segments:
+            if row < segment.count:
+                return segment.doc(row)
+            row -= segment.count
+        return self._buffer_docs[row]
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        starts = np.cumsum([0] + [segment.count for segment in self._segments])
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            no = int(np.searchsorted(starts, row, side="right")) - 1
+            if no < len(self._segments):
+                vectors[i] = self._segments[no].vectors[row - starts[no]]
+            else:
+                vectors[i] = self._buffer.data[row - starts[-1]]
+        return vectors
+
+    def _row_id(self, row: int) -> str:
+        return self._doc_at(row)["id"]
+
+    def _remove(self, rows: np.ndarray) -> List[str]:
+        ids = super()._remove(rows)
+        if ids:
+            self._log([{"delete": ids}])
+            self._logged_deletes = True
+        return ids
+
+    def _log(self, entries: List[dict]) -> None:
+        lines = []
+        for entry in entries:
+            self._seq += 1
+            lines.append(json.dumps({"seq": self._seq, **entry}) + "\n")
+        self._wal.write("".join(lines))
+        self._wal.flush()
+        if self.sync:
+            os.fsync(self._wal.fileno())
+
+    def _metadata_index(self) -> MetadataIndex:
+        # Built on the first filtered search only. Rows are numbered across the segments in order, then the buffer
+        if self._index is None:
+            self._index = MetadataIndex()
+            row = 0
+            for segment in self._segments:
+                for i in range(segment.count):
+                    self._index.add(row, segment.doc(i)["meta"])
+                    row += 1
+            for doc in self._buffer_docs:
+                self._index.add(row, doc["meta"])
+                row += 1
+        return self._index
+
+    def _sources(self) -> List[Tuple[np.ndarray, Optional[_Segment], int]]:
+        # The vectors, segment (None for the buffer) and first row no. of every part of the database
+        sources, offset = [], 0
+        for segment in self._segments:
+            sources.append((segment.vectors, segment, offset))
+            offset += segment.count
+        if self._buffer_docs:
+            sources.append((self._buffer.data, None, offset))
+        return sources
+
+    async def _insert(self, data: VectorDBInsert) -> None:
+        self._check_new_ids([data], self._id_rows())
+        vector = await self._to_vector(data.text, data.embedding)
+        await self._append([data], vector[None])
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        self._check_new_ids(data, self._id_rows())
+        vectors = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        await self._append(data, vectors)
+
+    async def _append(self, data: List[VectorDBInsert], vectors: np.ndarray) -> None:
+        docs = [{"id": item.id, "text": item.text, "meta": item.meta} for item in data]
+        self._log(
+            [
+                {"doc": doc, "embedding": vector}
+                for doc, vector in zip(docs, vectors.tolist())
+            ]
+        )
+        for doc, vector in zip(docs, vectors):
+            self._buffer_row(vector, doc)
+        if len(self._buffer_docs) >= self.segment_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write the vectors collected in memory to a new segment, and the tombstones to the manifest, then clear the write-ahead log."""
+        if not self._buffer_docs and not self._logged_deletes:
+            return
+        # A large `insert_many` fills the buffer past `segment_size` at once, it is split into several segments
+        for start in range(0, len(self._buffer_docs), self.segment_size):
+            docs = self._buffer_docs[start : start + self.segment_size]
+            name = self._new_segment_name()
+            _write_segment(
+                self.path, name, self._buffer.data[start : start + len(docs)], docs
+            )
+            self._segments.append(_Segment(self.path, name, len(docs), self.dim))
+        self._manifest["flushed_seq"] = self._seq
+        self._save_manifest()
+        # The manifest now covers every logged row, so the log can start over
+        self._wal.close()
+        self._wal = open(os.path.join(self.path, WAL), "w", encoding="utf-8")
+        self._buffer, self._buffer_docs = None, []
+        self._logged_deletes = False
+        if (
+            len(self._segments) > self.max_segments
+            and self._merging is None
+            and self._compacting is None
+        ):
+            self._merging = asyncio.ensure_future(self.merge())
+
+    async def merge(self) -> None:
+        """Merge the sealed segments into as few segments of up to `max_segments * segment_size` vectors as possible.
+        The new files are written in a worker thread, and searches keep using the old segments until they are swapped in.
+        """
+        try:
+            limit = self.max_segments * self.segment_size
+            groups: List[List[_Segment]] = [[]]
+            for segment in self._segments:
+                if sum(s.count for s in groups[-1]) + segment.count > limit:
+                    groups.append([])
+                groups[-1].append(segment)
+            loop = asyncio.get_running_loop()
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                name = self._new_segment_name()
+                await loop.run_in_executor(
+                    None, _merge_segments, self.path, name, group
+                )
+                merged = _Segment(
+                    self.path, name, sum(segment.count for segment in group), self.dim
+                )
+                start = self._segments.index(group[0])
+                self._segments[start : start + len(group)] = [merged]
+                self._save_manifest()
+                for segment in group:
+                    for file in segment.files():
+                        os.remove(os.path.join(self.path, file))
+        finally:
+            self._merging = None
+
+    async def _compact(self) -> None:
+        # Segments are only appended while this runs, so the ones listed now stay at the front
+        if self._merging is not None:
+            await self._merging
+        await self.flush()
+        segments = list(self._segments)
+        n_rows = sum(segment.count for segment in segments)
+        live = self._live_mask(n_rows)
+        if live is None:
+            return
+        loop = asyncio.get_running_loop()
+        compacted, removed, offset = [], [], 0
+        for segment in segments:
+            keep = live[offset : offset + segment.count]
+            offset += segment.count
+            if keep.all():
+                compacted.append(segment)
+                continue
+            removed.append(segment)
+            if keep.any():
+                name = self._new_segment_name()
+                await loop.run_in_executor(
+                    None,
+                    _compact_segment,
+                    self.path,
+                    name,
+                    segment,
+                    np.flatnonzero(keep),
+                )
+                compacted.append(_Segment(self.path, name, int(keep.sum()), self.dim))
+        # Rows deleted while the files were written keep their tombstones, at their new row no.
+        tombstones = np.zeros(self._n_rows, dtype=bool)
+        tombstones[: len(self._tombstones)] = self._tombstones[: self._n_rows]
+        self._tombstones = np.concatenate(
+            [tombstones[:n_rows][live], tombstones[n_rows:]]
+        )
+        self._n_deleted = int(self._tombstones.sum())
+        self._segments[: len(segments)] = compacted
+        self._save_manifest()
+        # Row no.s have changed, both are rebuilt when needed
+        self._ids, self._index = None, None
+        for segment in removed:
+            for file in segment.files():
+                os.remove(os.path.join(self.path, file))
+
+    def close(self) -> None:
+        """Close the write-ahead log. Rows that were not flushed are recovered from it on the next open."""
+        self._wal.close()
+
+    async def _get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        if not len(self):
+            return []
+        query = await self._to_vector(data.text, data.embedding)
+        mask = self._filter_mask(data.filter, self._n_rows)
+        candidates = []
+        for vectors, segment, offset in self._sources():
+            part = None if mask is None else mask[offset : offset + len(vectors)]
+            if part is not None and not part.any():
+                continue
+            for score, row in zip(
+                *self._masked_top_k(vectors, query, data.n_results, part)
+            ):
+                candidates.append((float(score), segment, int(row)))
+        return self._to_results(candidates, data.n_results)
+
+    def _to_results(
+        self, candidates: List[tuple], n_results: int
+    ) -> List[Tuple[float, TextDoc]]:
+        candidates.sort(key=lambda candidate: -candidate[0])
+        results = []
+        for score, segment, row in candidates[:n_results]:
+            doc = segment.doc(row) if segment else self._buffer_docs[row]
+            results.append(
+                (score, TextDoc(id=doc["id"], contents=doc["text"], meta=doc["meta"]))
+            )
+        return results
+
+    async def _get_similar_many(
+        self, data: List[VectorDBGetSimilar]
+    ) -> List[List[Tuple[float, TextDoc]]]:
+        if not len(self):
+            return [[] for _ in data]
+        queries = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        k = max(item.n_results for item in data)
+        masks = [self._filter_mask(item.filter, self._n_rows) for item in data]
+        candidates: List[list] = [[] for _ in data]
+        for vectors, segment, offset in self._sources():
+            # Bound the size of the score matrix for big segments
+            chunk_size = max(1, (1 << 24) // len(vectors))
+            for i in range(0, len(queries), chunk_size):
+                chunk_scores = score_matrix(
+                    vectors, queries[i : i + chunk_size], self.metric
+                )
+                for row_scores, mask in zip(chunk_scores, masks[i : i + chunk_size]):
+                    if mask is not None:
+                        row_scores[~mask[offset : offset + len(vectors)]] = -np.inf
+                for j, (row_scores, rows) in enumerate(
+                    zip(chunk_scores, top_k_rows(chunk_scores, k)), i
+                ):
+                    candidates[j].extend(
+                        (float(row_scores[row]), segment, int(row))
+                        for row in rows
+                        if row_scores[row] > -np.inf
+                    )
+        return [
+            self._to_results(query_candidates, item.n_results)
+            for query_candidates, item in zip(candidates, data)
+        ]
@@ -0,0 +1,518 @@
+import asyncio
+import heapq
+import multiprocessing as mp
+import os
+import threading
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from embedia.core.embedding import EmbeddingModel
+from embedia.core.vectordb import VectorDB
+from embedia.schema.textdoc import TextDoc
+from embedia.schema.vectordb import VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.exceptions import ShardError
+from embedia.utils.hashing import content_hash
+from embedia.utils.typechecking import check_min_val
+from embedia.vectordbs.base import embed_matrix
+from embedia.vectordbs.flat import NumpyVectorDB
+
+
+def _jump_hash(key: int, n_buckets: int) -> int:
+    # Jump consistent hash: going from n to n + 1 buckets moves only 1 / (n + 1) of the keys
+    bucket, j = -1, 0
+    while j < n_buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_of(id: str, n_shards: int) -> int:
+    """Return the shard an id belongs to, out of `n_shards`.
+
+    Parameters
+    ----------
+    - `id` (str): The id of a vector.
+    - `n_shards` (int): The no. of shards.
+
+    Returns
+    -------
+    - `shard` (int): The shard no., from 0 to `n_shards - 1`.
+    """
+    return _jump_hash(int(content_hash(id)[:16], 16), n_shards)
+
+
+def _to_shared(array: np.ndarray) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+    return block
+
+
+def _free(block: shared_memory.SharedMemory) -> None:
+    block.close()
+    block.unlink()
+
+
+async def _handle(db: VectorDB, command: str, args: tuple) -> Any:
+    # Runs a command in a worker process. Mutating commands return the new size of the shard
+    if command in ("insert", "upsert"):
+        name, shape, docs = args
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            vectors = np.ndarray(shape, np.float32, buffer=block.buf).tolist()
+        finally:
+            block.close()
+        data = [
+            VectorDBInsert(id=id, text=text, meta=meta, embedding=vector)
+            for (id, text, meta), vector in zip(docs, vectors)
+        ]
+        if command == "insert":
+            await db.insert_many(data)
+        else:
+            await db.upsert_many(data)
+        return len(db)
+    if command == "search":
+        name, shape, ks, filters, result_name = args
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            queries = np.ndarray(shape, np.float32, buffer=block.buf).tolist()
+        finally:
+            block.close()
+        results = await db.get_similar_many(
+            [
+                VectorDBGetSimilar(embedding=query, n_results=k, filter=filter)
+                for query, k, filter in zip(queries, ks, filters)
+            ]
+        )
+        # The scores and the positions in `docs` go through shared memory, padded with -inf and -1
+        k_max = max(ks)
+        block = shared_memory.SharedMemory(name=result_name)
+        try:
+            scores = np.ndarray((len(ks), k_max), np.float32, buffer=block.buf)
+            positions = np.ndarray(
+                (len(ks), k_max), np.int32, buffer=block.buf, offset=scores.nbytes
+            )
+            scores[:], positions[:] = -np.inf, -1
+            docs = []
+            for i, result in enumerate(results):
+                for j, (score, doc) in enumerate(result):
+                    scores[i, j], positions[i, j] = score, len(docs)
+                    docs.append((doc.id, doc.contents, doc.meta))
+        finally:
+            block.close()
+        return docs
+    if command == "delete":
+        ids, filter = args
+        return await db.delete(ids, filter), len(db)
+    if command == "export":
+        return _export(db, *args)
+    if command == "len":
+        return len(db)
+    raise ValueError(f"Unknown shard command: {command}")
+
+
+def _export(db: VectorDB, n_shards: int, shard: int) -> Tuple[List[tuple], np.ndarray]:
+    # Return the rows that belong to another shard once there are `n_shards`.
+    # They are only deleted once their new shard has them
+    if not isinstance(db, NumpyVectorDB):
+        raise ValueError("Only NumpyVectorDB and HNSWVectorDB shards can be rebalanced")
+    live = db._live_mask(db._n_rows)
+    rows = [
+        row
+        for row in range(db._n_rows)
+        if (live is None or live[row]) and shard_of(db._ids[row], n_shards) != shard
+    ]
+    docs = [(db._ids[row], db._texts[row], db._metas[row]) for row in rows]
+    vectors = np.zeros((0, db.dim or 0), dtype=np.float32)
+    if rows:
+        vectors = db._vectors[rows].copy()
+    return docs, vectors
+
+
+def _worker(conn, factory: Callable[[], VectorDB]) -> None:
+    db = factory()
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message[0] == "close":
+                break
+            try:
+                conn.send((True, loop.run_until_complete(_handle(db, *message))))
+            except Exception as e:
+                try:
+                    conn.send((False, e))
+                except Exception:
+                    # The exception could not be pickled
+                    conn.send((False, ShardError(f"{type(e).__name__}: {e}")))
+    finally:
+        loop.close()
+        conn.close()
+
+
+class _Shard:
+    """A worker process holding one shard, and the pipe to it."""
+
+    def __init__(self, context, factory: Callable[[], VectorDB], no: int) -> None:
+        self.no = no
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker, args=(child, factory), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+        self.size = 0
+
+    def call(self, timeout: float, command: str, *args) -> Any:
+        # Blocking, run in a thread so that all shards work at once
+        with self.lock:
+            if not self.process.is_alive():
+                raise ShardError(
+                    f"Shard {self.no} is not running (exit code: {self.process.exitcode}),"
+                    " call respawn() to replace it with an empty shard"
+                )
+            try:
+                self.conn.send((command, args))
+                if not self.conn.poll(timeout):
+                    # A late answer would be read as the answer to the next call
+                    self.process.kill()
+                    raise ShardError(f"Shard {self.no} did not answer in {timeout}s")
+                ok, result = self.conn.recv()
+            except (EOFError, OSError) as e:
+                raise ShardError(f"Shard {self.no} stopped: {e}") from e
+        if not ok:
+            raise result
+        return result
+
+    def close(self) -> None:
+        if self.process.is_alive():
+            with self.lock:
+                try:
+                    self.conn.send(("close", ()))
+                except (EOFError, OSError):
+                    pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+        self.conn.close()
+
+
+class ShardedVectorDB(VectorDB):
+    """A vector database split into shards that live in separate worker processes, so that searches use every core.
+    Each vector goes to the shard chosen by a jump consistent hash of its id. A search is sent to all shards at once
+    and their best results are merged with a heap. Query vectors and per-shard scores are passed through shared memory,
+    only the matching documents go through the pipes.
+
+    The shards are created by calling `shard_factory` in each worker, so it has to be picklable:
+    a class like `NumpyVectorDB` or `HNSWVectorDB`, or a `functools.partial` of one. Texts are embedded in this process.
+    With the default 'spawn' start method, scripts need an `if __name__ == "__main__":` guard.
+
+    A shard whose worker stops is reported by `health`, and calls that need it raise `ShardError`
+    before anything is sent to the other shards, until `respawn` replaces it with an empty shard.
+
+    Attributes
+    ----------
+    - `n_shards` (int): The no. of shards.
+    - `shard_factory` (Callable[[], `VectorDB`]): Creates the database of a shard.
+    - `embedding_model` (`EmbeddingModel`): Used for embedding texts that are inserted or searched without an embedding.
+    - `timeout` (float): The no. of seconds to wait for a shard to answer.
+    """
+
+    def __init__(
+        self,
+        n_shards: Optional[int] = None,
+        shard_factory: Callable[[], VectorDB] = NumpyVectorDB,
+        embedding_model: Optional[EmbeddingModel] = None,
+        timeout: float = 60,
+        start_method: str = "spawn",
+    ) -> None:
+        """Constructor for the `ShardedVectorDB` class. Starts the worker processes.
+
+        Parameters
+        ----------
+        - `n_shards` (int, optional): The no. of shards. Defaults to the no. of CPUs.
+        - `shard_factory` (Callable[[], `VectorDB`], optional): Creates the database of a shard. Defaults to `NumpyVectorDB`.
+        - `embedding_model` (`EmbeddingModel`, optional): Used for embedding texts that are inserted or searched without an embedding. Defaults to None.
+        - `timeout` (float, optional): The no. of seconds to wait for a shard to answer. Defaults to 60.
+        - `start_method` (str, optional): The `multiprocessing` start method of the workers. Defaults to 'spawn'.
+        """
+        super().__init__()
+        n_shards = n_shards or os.cpu_count() or 1
+        check_min_val(n_shards, 1, "n_shards")
+        self.n_shards = n_shards
+        self.shard_factory = shard_factory
+        self.embedding_model = embedding_model
+        self.timeout = timeout
+        self._context = mp.get_context(start_method)
+        self._shards = [
+            _Shard(self._context, shard_factory, no) for no in range(n_shards)
+        ]
+
+    def __len__(self) -> int:
+        return sum(shard.size for shard in self._shards)
+
+    async def _call(self, shard: _Shard, command: str, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, shard.call, self.timeout, command, *args
+        )
+
+    async def _to_matrix(
+        self, texts: List[Optional[str]], embeddings: List[Optional[List]]
+    ) -> np.ndarray:
+        return await embed_matrix(self.embedding_model, texts, embeddings)
+
+    def _check_running(self, shards: List[_Shard]) -> None:
+        # Checked before a command is sent, so that a write does not reach only some of its shards
+        stopped = [shard.no for shard in shards if not shard.process.is_alive()]
+        if stopped:
+            raise ShardError(
+                f"Shard(s) {stopped} stopped, call respawn() to replace them with empty shards"
+            )
+
+    async def _send_rows(
+        self, command: str, docs: List[tuple], vectors: np.ndarray, n_shards: int
+    ) -> None:
+        # Route rows to their shards and send every shard its part in one block of shared memory
+        parts: Dict[int, List[int]] = {}
+        for i, (id, _, _) in enumerate(docs):
+            parts.setdefault(shard_of(id, n_shards), []).append(i)
+        self._check_running([self._shards[no] for no in parts])
+        blocks = {no: _to_shared(vectors[rows]) for no, rows in parts.items()}
+        try:
+            sizes = await asyncio.gather(
+                *[
+                    self._call(
+                        self._shards[no],
+                        command,
+                        blocks[no].name,
+                        (len(rows), vectors.shape[1]),
+                        [docs[i] for i in rows],
+                    )
+                    for no, rows in parts.items()
+                ]
+            )
+        finally:
+            for block in blocks.values():
+                _free(block)
+        for no, size in zip(parts, sizes):
+            self._shards[no].size = size
+
+    async def _write(self, command: str, data: List[VectorDBInsert]) -> None:
+        vectors = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        docs = [(item.id, item.text, item.meta) for item in data]
+        await self._send_rows(command, docs, vectors, self.n_shards)
+
+    async def _insert(self, data: VectorDBInsert) -> None:
+        await self._write("insert", [data])
+
+    async def _insert_many(self, data: List[VectorDBInsert]) -> None:
+        await self._write("insert", data)
+
+    async def _upsert_many(self, data: List[VectorDBInsert]) -> None:
+        await self._write("upsert", data)
+
+    async def _delete(self, ids: Optional[List[str]], filter: Optional[dict]) -> int:
+        # Ids are only sent to their own shard, filters to every shard
+        targets: Dict[int, Optional[List[str]]] = {}
+        if ids is None:
+            targets = {shard.no: None for shard in self._shards}
+        else:
+            for id in ids:
+                targets.setdefault(shard_of(id, self.n_shards), []).append(id)
+        self._check_running([self._shards[no] for no in targets])
+        results = await asyncio.gather(
+            *[
+                self._call(self._shards[no], "delete", shard_ids, filter)
+                for no, shard_ids in targets.items()
+            ]
+        )
+        for no, (_, size) in zip(targets, results):
+            self._shards[no].size = size
+        return sum(n_deleted for n_deleted, _ in results)
+
+    async def _get_similar(
+        self, data: VectorDBGetSimilar
+    ) -> List[Tuple[float, TextDoc]]:
+        return (await self._get_similar_many([data]))[0]
+
+    async def _get_similar_many(
+        self, data: List[VectorDBGetSimilar]
+    ) -> List[List[Tuple[float, TextDoc]]]:
+        queries = await self._to_matrix(
+            [item.text for item in data], [item.embedding for item in data]
+        )
+        self._check_running(self._shards)
+        ks = [max(item.n_results, 1) for item in data]
+        filters = [item.filter for item in data]
+        query_block = _to_shared(queries)
+        # Room for a float32 score and an int32 position per result
+        result_blocks = [
+            shared_memory.SharedMemory(create=True, size=len(data) * max(ks) * 8)
+            for _ in self._shards
+        ]
+        try:
+            shard_docs = await asyncio.gather(
+                *[
+                    self._call(
+                        shard,
+                        "search",
+                        query_block.name,
+                        queries.shape,
+                        ks,
+                        filters,
+                        block.name,
+                    )
+                    for shard, block in zip(self._shards, result_blocks)
+                ]
+            )
+            shard_results = []
+            for docs, block in zip(shard_docs, result_blocks):
+                scores = np.ndarray((len(data), max(ks)), np.float32, buffer=block.buf)
+                positions = np.ndarray(
+                    (len(data), max(ks)),
+                    np.int32,
+                    buffer=block.buf,
+                    offset=scores.nbytes,
+                )
+                shard_results.append((scores.tolist(), positions.tolist(), docs))
+        finally:
+            _free(query_block)
+            for block in result_blocks:
+                _free(block)
+
+        results = []
+        for i, item in enumerate(data):
+            # Every shard's results are sorted best first, so a heap merge finds the overall best
+            merged = heapq.merge(
+                *[
+                    [
+                        (score, docs[position])
+                        for score, position in zip(scores[i], positions[i])
+                        if position >= 0
+                    ]
+                    for scores, positions, docs in shard_results
+                ],
+                key=lambda result: -result[0],
+            )
+            results.append(
+                [
+                    (score, TextDoc(id=id, contents=text, meta=meta))
+                    for score, (id, text, meta) in islice(merged, item.n_results)
+                ]
+            )
+        return results
+
+    async def health(self) -> List[bool]:
+        """Check which shards are running and answering.
+
+        Returns
+        -------
+        - `healthy` (List[bool]): Whether every shard answered within `timeout`, in shard order.
+        """
+
+        async def ping(shard: _Shard) -> bool:
+            try:
+                shard.size = await self._call(shard, "len")
+                return True
+            except ShardError:
+                return False
+
+        return list(await asyncio.gather(*[ping(shard) for shard in self._shards]))
+
+    async def resize(self, n_shards: int) -> None:
+        """Change the no. of shards and move the vectors whose shard changed.
+        Thanks to the consistent hash, adding a shard only moves the vectors that go to it.
+        Only `NumpyVectorDB` and `HNSWVectorDB` shards can be resized.
+
+        Parameters
+        ----------
+        - `n_shards` (int): The new no. of shards.
+        """
+        check_min_val(n_shards, 1, "n_shards")
+        if n_shards == self.n_shards:
+            return
+        self._check_running(self._shards)
+        old_n_shards = self.n_shards
+        for no in range(old_n_shards, n_shards):
+            self._shards.append(_Shard(self._context, self.shard_factory, no))
+        sources = self._shards[:old_n_shards]
+        results = await asyncio.gather(
+            *[self._call(shard, "export", n_shards, shard.no) for shard in sources]
+        )
+        docs: List[tuple] = []
+        vectors = []
+        for shard_docs, shard_vectors in results:
+            docs.extend(shard_docs)
+            if len(shard_docs):
+                vectors.append(shard_vectors)
+        # The rows are copied to their new shards before they are deleted from their old ones,
+        # so that a failure leaves every row in its old shard
+        if docs:
+            try:
+                await self._send_rows("insert", docs, np.concatenate(vectors), n_shards)
+            except BaseException:
+                await self._drop_copies(docs, old_n_shards, n_shards)
+                raise
+            await asyncio.gather(
+                *[
+                    self._delete_rows(shard, [id for id, _, _ in shard_docs])
+                    for shard, (shard_docs, _) in zip(sources, results)
+                    if shard_docs and shard.no < n_shards
+                ]
+            )
+        for shard in self._shards[n_shards:]:
+            shard.close()
+        self._shards = self._shards[:n_shards]
+        self.n_shards = n_shards
+
+    async def _delete_rows(self, shard: _Shard, ids: List[str]) -> None:
+        _, shard.size = await self._call(shard, "delete", ids, None)
+
+    async def _drop_copies(
+        self, docs: List[tuple], old_n_shards: int, n_shards: int
+    ) -> None:
+        # Undo a failed resize: new shards are closed, copies in kept shards are deleted
+        for shard in self._shards[old_n_shards:]:
+            shard.close()
+        self._shards = self._shards[:old_n_shards]
+        targets: Dict[int, List[str]] = {}
+        for id, _, _ in docs:
+            no = shard_of(id, n_shards)
+            if no < old_n_shards:
+                targets.setdefault(no, []).append(id)
+        await asyncio.gather(
+            *[self._delete_rows(self._shards[no], ids) for no, ids in targets.items()],
+            return_exceptions=True,
+        )
+
+    async def respawn(self) -> List[int]:
+        """Replace the shards whose worker process stopped with new, empty ones.
+        The vectors of those shards are lost and have to be inserted again.
+
+        Returns
+        -------
+        - `respawned` (List[int]): The nos. of the replaced shards.
+        """
+        respawned = []
+        for shard in self._shards:
+            if not shard.process.is_alive():
+                shard.close()
+                self._shards[shard.no] = _Shard(
+                    self._context, self.shard_factory, shard.no
+                )
+                respawned.append(shard.no)
+        return respawned
+
+    def close(self) -> None:
+        """Stop the worker processes. Their data is lost."""
+        for shard in self._shards:
+            shard.close()
@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import pytest
+from embedia.caches import SQLiteEmbeddingCache
+
+from tests.caches.test_lru import FakeClock
+from tests.core.definitions import BagOfWordsEmbedding
+
+texts = [f"chunk number {i}" for i in range(10)]
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache():
+    shutil.rmtree("temp", ignore_errors=True)
+    os.makedirs("temp")
+    embmodel = BagOfWordsEmbedding(cache=SQLiteEmbeddingCache("temp/emb.db"))
+    embeddings = await embmodel.batch(texts)
+    assert embmodel.num_calls == 10
+
+    # Only the changed chunks are embedded again, even by a new process
+    embmodel = BagOfWordsEmbedding(cache=SQLiteEmbeddingCache("temp/emb.db"))
+    changed = texts[:8] + ["a new chunk", "another new chunk"]
+    new_embeddings = await embmodel.batch(changed)
+    assert embmodel.num_calls == 2
+    assert embmodel.batch_sizes == [2]
+    assert new_embeddings[:8] == embeddings[:8]
+    assert embmodel.cache.hits == 8
+    assert len(embmodel.cache) == 12
+
+    assert await embmodel(texts[0]) == embeddings[0]
+    assert embmodel.num_calls == 2
+    assert await embmodel.cache.get_many("other-model", texts[:1]) == [None]
+    shutil.rmtree("temp")
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_eviction():
+    clock = FakeClock()
+    cache = SQLiteEmbeddingCache(max_size=5, ttl=100, clock=clock)
+    embmodel = BagOfWordsEmbedding(cache=cache)
+    for i, text in enumerate(texts):
+        clock.now = i
+        await embmodel(text)
+    assert len(cache) == 5
+    await embmodel(texts[0])
+    assert embmodel.num_calls == 11
+
+    clock.now = 105
+    assert await cache.evict_expired() == 0
+    clock.now = 108
+    assert await cache.evict_expired() == 2
+    assert len(cache) == 3
+    await embmodel(texts[6])
+    assert embmodel.num_calls == 12
@@ -0,0 +1,95 @@
+import os
+import shutil
+
+import pytest
+from embedia import Event, Persona, subscribe_event
+from embedia.caches import LRUCache
+
+from tests.core.definitions import EchoLLM, EchoStreamChatLLM
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_lru_cache():
+    llm = EchoLLM(cache=LRUCache(max_size=2))
+    assert await llm("The capital of France is") == "echo: The capital of France is"
+    assert await llm("The capital of France is") == "echo: The capital of France is"
+    assert llm.num_calls == 1
+    assert llm.cache.hits == 1
+    assert llm.cache.misses == 1
+
+    await llm("The capital of Spain is")
+    await llm("The capital of Italy is")
+    await llm("The capital of France is")
+    assert llm.num_calls == 4
+
+    clock = FakeClock()
+    llm = EchoLLM(cache=LRUCache(ttl=10, clock=clock))
+    await llm("The capital of France is")
+    clock.now = 5
+    await llm("The capital of France is")
+    assert llm.num_calls == 1
+    clock.now = 20
+    await llm("The capital of France is")
+    assert llm.num_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_sqlite():
+    shutil.rmtree("temp", ignore_errors=True)
+    os.makedirs("temp")
+    llm = EchoLLM(cache=LRUCache(db_path="temp/cache.db", max_db_size=2))
+    await llm("The capital of France is")
+    await llm("The capital of Spain is")
+    await llm("The capital of Italy is")
+
+    llm = EchoLLM(cache=LRUCache(db_path="temp/cache.db"))
+    await llm("The capital of Italy is")
+    await llm("The capital of Spain is")
+    assert llm.num_calls == 0
+    await llm("The capital of France is")
+    assert llm.num_calls == 1
+    shutil.rmtree("temp")
+
+
+@pytest.mark.asyncio
+async def test_lru_cache_chatllm_stream():
+    cache_hits = []
+    subscribe_event(
+        Event.ChatLLMStart, lambda *args: cache_hits.append(args[3]["cache_hit"])
+    )
+    chatllm = EchoStreamChatLLM()
+    chatllm.cache = LRUCache()
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    chunks = [chunk async for chunk in chatllm.stream("Which tool lists the files?")]
+    assert len(chunks) > 1
+    # A completed stream is cached, and both calls and streams reuse it
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    assert await chatllm("Which tool lists the files?") == "".join(chunks)
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    hit = [chunk async for chunk in chatllm.stream("Which tool lists the files?")]
+    assert hit == ["".join(chunks)]
+    assert chatllm.chat_history[-1].content == "".join(chunks)
+    assert cache_hits == [False, True, True]
+
+    # A stream that is not read to the end is not cached
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    stream = chatllm.stream("Which tool reads a file?")
+    await stream.__anext__()
+    await stream.aclose()
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    await chatllm("Which tool reads a file?")
+    assert cache_hits[-2:] == [False, False]
+
+    # The length is checked before the cache
+    chatllm.max_input_tokens = 5
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    with pytest.raises(ValueError):
+        await chatllm("Which tool lists the files?")
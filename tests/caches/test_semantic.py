@@ -0,0 +1,70 @@
+import pytest
+from embedia import Event, Persona, subscribe_event
+from embedia.caches import SemanticCache
+
+from tests.core.definitions import BagOfWordsEmbedding, EchoChatLLM, EchoLLM
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache():
+    events = []
+    subscribe_event(Event.SemanticCacheHit, lambda *args: events.append(args[0]))
+    subscribe_event(Event.SemanticCacheMiss, lambda *args: events.append(args[0]))
+
+    cache = SemanticCache(BagOfWordsEmbedding(), threshold=0.9, max_size=2)
+    llm = EchoLLM(cache=cache)
+    reply = await llm("What is the capital of France?")
+    assert await llm("what is the capital of france") == reply
+    assert llm.num_calls == 1
+    assert events == [Event.SemanticCacheMiss, Event.SemanticCacheHit]
+
+    await llm("How many legs does a spider have?")
+    await llm("Who wrote the Odyssey?")
+    assert llm.num_calls == 3
+    await llm("What is the capital of France?")
+    assert llm.num_calls == 4
+    assert cache.hits == 1
+    assert cache.misses == 4
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_chatllm():
+    cache = SemanticCache(BagOfWordsEmbedding(), threshold=0.9)
+    chatllm = EchoChatLLM()
+    chatllm.cache = cache
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    reply = await chatllm("Which tool lists the files?")
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    assert await chatllm("which tool lists the files") == reply
+    assert cache.hits == 1
+
+    await chatllm.set_system_prompt(Persona.ArgChooser)
+    await chatllm("Which tool lists the files?")
+    assert cache.hits == 1
+
+    other = SemanticCache(cache.embedding_model, threshold=0.9, namespace="tenant")
+    chatllm.cache = other
+    await chatllm.set_system_prompt(Persona.ToolChooser)
+    await chatllm("Which tool lists the files?")
+    assert other.hits == 0
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_max_size_over_namespaces():
+    cache = SemanticCache(BagOfWordsEmbedding(), threshold=0.9, max_size=3)
+    # Like a multi-turn chat, where every history gets its own namespace
+    for turn in range(10):
+        await cache.set(f"history {turn}", "hello there", f"reply {turn}")
+    assert sum(len(entries) for entries in cache._namespaces.values()) == 3
+    assert list(cache._namespaces) == ["history 7", "history 8", "history 9"]
+    assert all(len(entries.vectors) == 1 for entries in cache._namespaces.values())
+
+    # A recently used namespace is kept over older ones
+    assert await cache.get("history 7", "hello there") == "reply 7"
+    await cache.set("history 10", "hello there", "reply 10")
+    assert list(cache._namespaces) == ["history 9", "history 7", "history 10"]
+
+    await cache.set("history 10", "good morning", "reply 11")
+    await cache.set("history 10", "good night", "reply 12")
+    assert list(cache._namespaces) == ["history 10"]
+    assert len(cache._namespaces["history 10"]) == 3
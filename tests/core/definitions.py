@@ -1,6 +1,8 @@
+import asyncio
 import json
 import os
 import time
+import zlib
 from typing import List
 
 import openai
@@ -365,3 +367,114 @@ class PrintToolBroken3(Tool):
         await self.human_confirmation(details={"text": text})
         print(text)
         return "done"
+
+
+class WhitespaceTokenizer(Tokenizer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.num_calls = 0
+
+    async def _tokenize(self, text: str) -> List[str]:
+        self.num_calls += 1
+        return text.split()
+
+
+class EchoLLM(LLM):
+    def __init__(self, cache=None, max_input_tokens=4000):
+        super().__init__(
+            tokenizer=WhitespaceTokenizer(),
+            max_input_tokens=max_input_tokens,
+            cache=cache,
+        )
+        self.num_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _complete(self, prompt: str) -> str:
+        self.num_calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return f"echo: {prompt}"
+
+
+class EchoBatchLLM(EchoLLM):
+    def __init__(self, cache=None, max_input_tokens=4000):
+        super().__init__(cache=cache, max_input_tokens=max_input_tokens)
+        self.batch_sizes = []
+
+    async def _complete_batch(self, prompts: List[str]) -> List[str]:
+        self.batch_sizes.append(len(prompts))
+        return [f"echo: {prompt}" for prompt in prompts]
+
+
+class EchoChatLLM(ChatLLM):
+    def __init__(self, max_input_tokens=4000):
+        super().__init__(
+            tokenizer=WhitespaceTokenizer(), max_input_tokens=max_input_tokens
+        )
+
+    async def _reply(self, prompt: str) -> str:
+        await asyncio.sleep(0.01)
+        return f"echo ({len(self.chat_history)} messages): {prompt}"
+
+
+class EchoStreamLLM(EchoLLM):
+    async def _complete_stream(self, prompt: str):
+        self.num_calls += 1
+        for word in f"echo: {prompt}".split(" "):
+            await asyncio.sleep(0.01)
+            yield word + " "
+
+
+class EchoStreamChatLLM(EchoChatLLM):
+    async def _reply_stream(self, prompt: str):
+        for word in f"echo ({len(self.chat_history)} messages): {prompt}".split(" "):
+            await asyncio.sleep(0.01)
+            yield word + " "
+
+
+class ShortReplyChatLLM(EchoChatLLM):
+    async def _reply(self, prompt: str) -> str:
+        return "short reply"
+
+
+class BagOfWordsEmbedding(EmbeddingModel):
+    def __init__(self, dim=64, singleflight=None, batcher=None, cache=None):
+        super().__init__(
+            tokenizer=WhitespaceTokenizer(),
+            singleflight=singleflight,
+            batcher=batcher,
+            cache=cache,
+        )
+        self.dim = dim
+        self.num_calls = 0
+        self.batch_sizes = []
+
+    async def _embed(self, input: str) -> List[float]:
+        self.num_calls += 1
+        await asyncio.sleep(0.01)
+        embedding = [0.0] * self.dim
+        for word in input.lower().replace("?", "").split():
+            embedding[zlib.crc32(word.encode()) % self.dim] += 1.0
+        return embedding
+
+    async def _embed_batch(self, inputs: List[str]) -> List[List[float]]:
+        self.batch_sizes.append(len(inputs))
+        return await super()._embed_batch(inputs)
+
+
+class FakeLatencyLLM(LLM):
+    def __init__(self, latency, limiter=None):
+        super().__init__(limiter=limiter)
+        self.latency = latency
+        self.num_calls = 0
+
+    async def _complete(self, prompt: str) -> str:
+        self.num_calls += 1
+        latency = self.latency()
+        if latency is None:
+            raise RuntimeError("Backend error")
+        await asyncio.sleep(latency)
+        return f"echo: {prompt}"
@@ -2,17 +2,23 @@ import os
 import shutil
 
 import pytest
-from embedia import Persona
+from embedia import ContextPolicy, Event, Persona, subscribe_event
+from embedia.utils.concurrency import AdaptiveLimiter
 
 from tests.core.definitions import (
     ChatLLM,
+    EchoChatLLM,
+    EchoStreamChatLLM,
+    EchoStreamLLM,
     OpenAIChatLLM,
+    OpenAIChatLLMBroken,
     OpenAIChatLLMOptional1,
     OpenAIChatLLMOptional2,
     OpenAIChatLLMOptional3,
     OpenAIChatLLMOptional4,
-    OpenAIChatLLMBroken,
     OpenAILLM,
+    ShortReplyChatLLM,
+    WhitespaceTokenizer,
 )
 
 
@@ -84,3 +90,116 @@ async def test_chatllm_error():
         "Please call `ChatLLM` init method from your subclass init method to initialize the chat history"
         in str(e)
     )
+
+
+@pytest.mark.asyncio
+async def test_chatllm_batch():
+    chatllm = EchoChatLLM()
+    await chatllm.set_system_prompt(Persona.Summary)
+    results = await chatllm.batch(["First", "Second", "Third"], max_concurrency=2)
+    assert results == [
+        "echo (2 messages): First",
+        "echo (2 messages): Second",
+        "echo (2 messages): Third",
+    ]
+    assert len(chatllm.chat_history) == 1
+
+
+@pytest.mark.asyncio
+async def test_chatllm_stream():
+    chatllm = EchoStreamChatLLM()
+    await chatllm.set_system_prompt(Persona.Summary)
+    chunks = [chunk async for chunk in chatllm.stream("Hello there")]
+    assert "".join(chunks) == "echo (2 messages): Hello there "
+    assert len(chunks) == 5
+    assert chatllm.chat_history[-1].content == "echo (2 messages): Hello there "
+
+    # A stream that is not read to the end still publishes its end event
+    ends = []
+    subscribe_event(Event.ChatLLMEnd, lambda *args: ends.append(args[3]))
+    chatllm.limiter = AdaptiveLimiter()
+    stream = chatllm.stream("Stop early")
+    await stream.__anext__()
+    assert chatllm.limiter.in_flight == 1
+    await stream.aclose()
+    assert chatllm.limiter.in_flight == 0
+    assert ends[-1]["completed"] is False
+    assert ends[-1]["reply_content"] == "echo "
+    assert chatllm.chat_history[-1].content == "Stop early"
+
+    chatllm = ChatLLM.from_llm(EchoStreamLLM())
+    chunks = [chunk async for chunk in chatllm.stream("Hello there")]
+    assert "Hello there" in "".join(chunks)
+    assert len(chatllm.chat_history) == 2
+    assert chatllm.chat_history[-1].content == "".join(chunks)
+
+
+class CharTokenizer(WhitespaceTokenizer):
+    async def _tokenize(self, text):
+        self.num_calls += 1
+        return list(text)
+
+
+@pytest.mark.asyncio
+async def test_chatllm_token_accounting():
+    chatllm = EchoChatLLM()
+    await chatllm.set_system_prompt(Persona.Summary)
+    for i in range(10):
+        await chatllm(f"Message number {i}")
+    assert chatllm.tokenizer.num_calls == 21
+    assert chatllm.chat_history[1].tokens == 3
+    assert await chatllm._calculate_chat_history_tokens() == sum(
+        len(message.content.split()) for message in chatllm.chat_history
+    )
+
+    chatllm.chat_history = chatllm.chat_history[:1] + chatllm.chat_history[-4:]
+    assert await chatllm._calculate_chat_history_tokens() == sum(
+        len(message.content.split()) for message in chatllm.chat_history
+    )
+    assert chatllm.tokenizer.num_calls == 21
+
+    # An edited message is counted again
+    chatllm.chat_history[1].content = "An edited message with more words"
+    assert chatllm.chat_history[1].tokens == 3
+    assert await chatllm._calculate_chat_history_tokens() == sum(
+        len(message.content.split()) for message in chatllm.chat_history
+    )
+    assert chatllm.chat_history[1].tokens == 6
+    assert chatllm.tokenizer.num_calls == 22
+
+    # So is every message once the tokenizer is swapped
+    chatllm.tokenizer = CharTokenizer()
+    assert await chatllm._calculate_chat_history_tokens() == sum(
+        len(message.content) for message in chatllm.chat_history
+    )
+    assert chatllm.tokenizer.num_calls == len(chatllm.chat_history)
+
+
+@pytest.mark.asyncio
+async def test_chatllm_context_policy():
+    chatllm = ShortReplyChatLLM(max_input_tokens=20)
+    await chatllm.set_system_prompt("You are a helpful assistant")
+    with pytest.raises(ValueError):
+        for i in range(10):
+            await chatllm(f"This is message number {i}")
+
+    chatllm = ShortReplyChatLLM(max_input_tokens=20)
+    chatllm.context_policy = ContextPolicy.sliding_window
+    await chatllm.set_system_prompt("You are a helpful assistant")
+    for i in range(10):
+        await chatllm(f"This is message number {i}")
+        assert await chatllm._calculate_chat_history_tokens() <= 22
+    assert chatllm.chat_history[0].content == "You are a helpful assistant"
+    assert chatllm.chat_history[-2].content == "This is message number 9"
+
+    chatllm = ShortReplyChatLLM(max_input_tokens=50)
+    chatllm.context_policy = ContextPolicy.summarize
+    await chatllm.set_system_prompt("You are a helpful assistant")
+    for i in range(20):
+        await chatllm(f"This is message number {i}")
+        assert await chatllm._calculate_chat_history_tokens() <= 52
+    assert chatllm.chat_history[0].content == "You are a helpful assistant"
+    assert chatllm.chat_history[1].content.startswith(
+        "Summary of the earlier conversation"
+    )
+    assert chatllm.chat_history[-2].content == "This is message number 19"
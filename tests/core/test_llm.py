@@ -1,6 +1,13 @@
 import pytest
+from embedia import Event, LLMCache, subscribe_event
+from embedia.caches import LRUCache
+from embedia.utils.concurrency import AdaptiveLimiter
+from embedia.utils.hashing import get_model_id
 
 from tests.core.definitions import (
+    EchoBatchLLM,
+    EchoLLM,
+    EchoStreamLLM,
     OpenAILLM,
     OpenAILLMOptional1,
     OpenAILLMOptional2,
@@ -34,3 +41,78 @@ async def test_llm_error():
     assert "Length of input text: 5 token(s) is longer than max_input_tokens: 2" in str(
         e
     )
+
+
+@pytest.mark.asyncio
+async def test_llm_batch():
+    llm = EchoLLM(max_input_tokens=5)
+    prompts = [f"Prompt number {i}" for i in range(10)]
+    prompts[3] = "This prompt is way too long for the llm"
+    results = await llm.batch(prompts, max_concurrency=3)
+    assert len(results) == 10
+    assert results[0] == "echo: Prompt number 0"
+    assert results[9] == "echo: Prompt number 9"
+    assert isinstance(results[3], ValueError)
+    assert llm.max_in_flight == 3
+
+    llm = EchoBatchLLM(max_input_tokens=5)
+    results = await llm.batch(prompts, batch_size=4)
+    assert results[0] == "echo: Prompt number 0"
+    assert isinstance(results[3], ValueError)
+    assert llm.batch_sizes == [3, 4, 2]
+    assert llm.num_calls == 0
+
+    # Any error from a prompt's checks only fails that prompt
+    class FailingCache(LLMCache):
+        async def _get(self, model_id, prompt):
+            if prompt == prompts[5]:
+                raise RuntimeError("cache is down")
+
+        async def _set(self, model_id, prompt, completion):
+            pass
+
+    llm = EchoBatchLLM(cache=FailingCache())
+    results = await llm.batch(prompts, batch_size=4)
+    assert isinstance(results[5], RuntimeError)
+    assert results[4] == "echo: Prompt number 4"
+    assert results[6] == "echo: Prompt number 6"
+
+
+@pytest.mark.asyncio
+async def test_llm_stream():
+    events = []
+    subscribe_event(Event.LLMChunk, lambda *args: events.append(args))
+    subscribe_event(Event.LLMEnd, lambda *args: events.append(args))
+
+    llm = EchoStreamLLM()
+    chunks = [chunk async for chunk in llm.stream("The capital of France is")]
+    assert chunks == ["echo: ", "The ", "capital ", "of ", "France ", "is "]
+    assert [e[0] for e in events] == [Event.LLMChunk] * 6 + [Event.LLMEnd]
+    end_data = events[-1][3]
+    assert end_data["completion"] == "echo: The capital of France is "
+    assert 0 < end_data["time_to_first_token"] < end_data["duration"]
+    assert end_data["tokens_per_sec"] > 0
+
+    llm = EchoLLM()
+    chunks = [chunk async for chunk in llm.stream("The capital of France is")]
+    assert chunks == ["echo: The capital of France is"]
+
+    # A stream holds a place on the limiter, and one that is not read to the end still ends
+    cache = LRUCache()
+    llm = EchoStreamLLM(cache=cache)
+    llm.limiter = AdaptiveLimiter(initial_limit=2)
+    events.clear()
+    stream = llm.stream("The capital of France is")
+    assert await stream.__anext__() == "echo: "
+    assert llm.limiter.in_flight == 1
+    await stream.aclose()
+    assert llm.limiter.in_flight == 0
+    assert events[-1][0] == Event.LLMEnd
+    assert events[-1][3]["completion"] == "echo: "
+    assert events[-1][3]["completed"] is False
+    assert await cache.get(get_model_id(llm), "The capital of France is") is None
+    chunks = [chunk async for chunk in llm.stream("The capital of France is")]
+    assert events[-1][3]["completed"] is True
+    assert await cache.get(get_model_id(llm), "The capital of France is") == "".join(
+        chunks
+    )
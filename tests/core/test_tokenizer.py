@@ -1,6 +1,8 @@
+import threading
+
 import pytest
 
-from tests.core.definitions import OpenAITokenizer
+from tests.core.definitions import OpenAITokenizer, WhitespaceTokenizer
 
 text = """Lorem ipsum dolor sit amet, consectetur adipiscing elit. Duis eu arcu risus. Proin sed fringilla tellus. Donec scelerisque elit sed sapien bibendum rutrum. Morbi blandit justo in urna semper volutpat. Nunc consectetur ex vitae consequat blandit. Duis sit amet metus quis mi molestie bibendum rutrum et ante. Nam aliquam metus magna, eget porta lacus dictum sit amet. Morbi dictum tellus a semper tristique. Duis ipsum ex, pharetra non rhoncus in, gravida quis magna. Nam pretium enim non lectus efficitur, sit amet sagittis elit finibus. Vivamus varius ligula turpis, sit amet vehicula mi eleifend eget. Cras dignissim mauris eu feugiat euismod. Integer dapibus dolor eu nulla euismod finibus."""
 
@@ -11,3 +13,60 @@ async def test_tokenizer():
     tokens = await tokenizer(text)
     assert len(text.split()) == 107
     assert len(tokens) == 192
+
+
+@pytest.mark.asyncio
+async def test_tokenizer_count_and_batch():
+    tokenizer = WhitespaceTokenizer()
+    assert await tokenizer.count(text) == 107
+    assert await tokenizer.count(text) == 107
+    assert tokenizer.num_calls == 1
+
+    tokenizer.memo_size = 2
+    for word in ["one", "two two", "three three three"]:
+        await tokenizer.count(word)
+    assert len(tokenizer._memo) == 2
+    assert await tokenizer.count("three three three") == 3
+    assert tokenizer.num_calls == 4
+
+    assert await tokenizer.batch(["a b", "", "c d e"]) == [
+        ["a", "b"],
+        [],
+        ["c", "d", "e"],
+    ]
+    assert await tokenizer.batch([]) == []
+
+    tokenizer.memo_size = 0
+    tokenizer._memo.clear()
+    await tokenizer.count(text)
+    await tokenizer.count(text)
+    assert tokenizer.num_calls == 9
+
+
+class ThreadRecordingTokenizer(WhitespaceTokenizer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.threads = set()
+
+    async def _tokenize(self, text):
+        self.threads.add(threading.get_ident())
+        return await super()._tokenize(text)
+
+
+@pytest.mark.asyncio
+async def test_tokenizer_executor():
+    tokenizer = ThreadRecordingTokenizer(executor="thread", inline_threshold=100)
+    assert await tokenizer("short text") == ["short", "text"]
+    assert tokenizer.threads == {threading.get_ident()}
+    assert len(await tokenizer(text)) == 107
+    assert await tokenizer.count(text + " more") == 108
+    assert len(await tokenizer.batch([text, text])) == 2
+    assert len(tokenizer.threads) > 1
+    tokenizer.shutdown()
+
+    tokenizer = WhitespaceTokenizer(executor="process", inline_threshold=0)
+    assert await tokenizer.count(text) == 107
+    assert await tokenizer.batch(["a b", "c"]) == [["a", "b"], ["c"]]
+    # The work happened in the worker processes
+    assert tokenizer.num_calls == 0
+    tokenizer.shutdown()
@@ -0,0 +1,46 @@
+import math
+
+import pytest
+from embedia import TextDoc
+from embedia.retrievers import BM25Retriever
+
+
+def test_bm25():
+    docs = [
+        TextDoc(id="0", contents="the connection was reset", meta={"lang": "en"}),
+        TextDoc(id="1", contents="ERR_CONN_RESET raised by get_similar", meta={}),
+        TextDoc(id="2", contents="the the the cat sat on the mat", meta={}),
+        TextDoc(id="3", contents="a cat and a dog", meta={"lang": "en"}),
+    ]
+    bm25 = BM25Retriever(buffer_size=3)
+    bm25.add(docs[:2])
+    bm25.add(docs[2:])
+    assert len(bm25) == 4
+    with pytest.raises(ValueError):
+        bm25.add([docs[0]])
+
+    # Identifiers stay whole and are case insensitive
+    assert [doc.id for _, doc in bm25.get_similar("err_conn_reset")] == ["1"]
+    assert [doc.id for _, doc in bm25.get_similar("get_similar()")] == ["1"]
+    assert bm25.get_similar("missing words") == []
+
+    # Shorter documents win for the same term frequency
+    results = bm25.get_similar("cat")
+    assert [doc.id for _, doc in results] == ["3", "2"]
+    assert bm25.get_similar("cat", filter={"lang": "en"})[0][1].id == "3"
+    assert len(bm25.get_similar("cat", filter={"lang": "de"})) == 0
+
+    # Matches the textbook formula
+    n, df, avg_length = 4, 2, (4 + 4 + 8 + 5) / 4
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    norm = 1.2 * (1 - 0.75 + 0.75 * 5 / avg_length)
+    assert results[0][0] == pytest.approx(idf * 2.2 / (1 + norm), rel=1e-5)
+
+    # The merged and the buffered postings give the same scores
+    merged = BM25Retriever(buffer_size=1000)
+    merged.add(docs)
+    merged._merge()
+    for query in ["the cat", "reset", "a dog the mat"]:
+        assert bm25.scores(query).tolist() == pytest.approx(
+            merged.scores(query).tolist()
+        )
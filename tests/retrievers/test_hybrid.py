@@ -0,0 +1,58 @@
+import pytest
+from embedia import FusionMethod, TextDoc
+from embedia.retrievers import HybridRetriever, reciprocal_rank_fusion, weighted_fusion
+from embedia.vectordbs import NumpyVectorDB
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+def test_fusion():
+    a, b, c = (TextDoc(id=i, contents=i) for i in "abc")
+    lexical = [(9.0, a), (5.0, b)]
+    vector = [(0.9, b), (0.1, c)]
+    fused = reciprocal_rank_fusion([lexical, vector], k=60)
+    assert [doc.id for _, doc in fused] == ["b", "a", "c"]
+    assert fused[0][0] == pytest.approx(1 / 62 + 1 / 61)
+    fused = weighted_fusion([lexical, vector], [0.3, 0.7])
+    assert [(score, doc.id) for score, doc in fused] == [
+        (pytest.approx(0.7), "b"),
+        (pytest.approx(0.3), "a"),
+        (0.0, "c"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_hybrid_retriever():
+    docs = [
+        TextDoc(id="0", contents="how to reset a forgotten password", meta={"n": 0}),
+        TextDoc(id="1", contents="error E1234 when saving the file", meta={"n": 1}),
+        TextDoc(id="2", contents="saving files to the cloud", meta={"n": 2}),
+        TextDoc(id="3", contents="password reset emails are not sent", meta={"n": 3}),
+    ]
+    for fusion in FusionMethod:
+        retriever = HybridRetriever(
+            NumpyVectorDB(embedding_model=BagOfWordsEmbedding()), fusion=fusion
+        )
+        await retriever.add(docs)
+        assert len(retriever.bm25) == 4 and len(retriever.vectordb) == 4
+        results = await retriever.get_similar("E1234", n_results=2)
+        assert results[0][1].id == "1"
+        results = await retriever.get_similar("reset password", n_results=2)
+        assert {doc.id for _, doc in results} == {"0", "3"}
+        results = await retriever.get_similar(
+            "reset password", n_results=2, filter={"n": {"$gt": 0}}
+        )
+        assert results[0][1].id == "3"
+        assert all(doc.meta["n"] > 0 for _, doc in results)
+        results = await retriever.get_similar("E1234", n_results=3, n_vector=0)
+        assert [doc.id for _, doc in results] == ["1"]
+
+    # Vector databases that do not embed texts themselves
+    retriever = HybridRetriever(
+        NumpyVectorDB(), embedding_model=BagOfWordsEmbedding(), vector_weight=1.0
+    )
+    await retriever.add(docs)
+    results = await retriever.get_similar("saving files to the cloud", n_lexical=0)
+    assert results[0][1].id == "2"
+    with pytest.raises(ValueError):
+        HybridRetriever(NumpyVectorDB(), vector_weight=2)
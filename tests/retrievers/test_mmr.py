@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from embedia import VectorDBGetSimilar, VectorDBInsert
+from embedia.retrievers import MMRRetriever, maximal_marginal_relevance
+from embedia.vectordbs import IVFPQVectorDB, MmapVectorDB, NumpyVectorDB
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+def test_maximal_marginal_relevance():
+    query = np.array([1.0, 0.0, 0.0])
+    vectors = np.array(
+        [
+            [1.0, 0.1, 0.0],
+            [1.0, 0.12, 0.0],  # near-duplicate of 0
+            [0.8, 0.0, 0.6],
+            [0.0, 1.0, 0.0],
+        ]
+    )
+    assert maximal_marginal_relevance(query, vectors, 3, lambda_mult=1) == [0, 1, 2]
+    assert maximal_marginal_relevance(query, vectors, 3, lambda_mult=0.5) == [0, 2, 1]
+    assert maximal_marginal_relevance(query, vectors, 10) == [0, 2, 1, 3]
+    groups = ["a", "a", "a", "b"]
+    assert maximal_marginal_relevance(
+        query, vectors, 3, lambda_mult=1, groups=groups, max_per_group=1
+    ) == [0, 3]
+    assert maximal_marginal_relevance(query, np.empty((0, 3)), 3) == []
+    with pytest.raises(ValueError):
+        maximal_marginal_relevance(query, vectors, 3, lambda_mult=2)
+
+
+@pytest.mark.asyncio
+async def test_mmr_retriever(tmp_path):
+    texts = [
+        "the cat sat on the mat",
+        "the cat sat on the mat",
+        "the cat sat on a mat",
+        "a cat chased the dog",
+        "stock prices fell sharply",
+    ]
+    data = [
+        VectorDBInsert(id=str(i), text=text, meta={"parent_id": "p" + str(min(i, 3))})
+        for i, text in enumerate(texts)
+    ]
+    query = VectorDBGetSimilar(text="the cat sat on the mat", n_results=3)
+    for db in [
+        NumpyVectorDB(embedding_model=BagOfWordsEmbedding()),
+        MmapVectorDB(str(tmp_path / "db"), embedding_model=BagOfWordsEmbedding()),
+        IVFPQVectorDB(
+            embedding_model=BagOfWordsEmbedding(),
+            n_lists=2,
+            n_subvectors=4,
+            n_probe=2,
+            train_size=5,
+            seed=0,
+        ),
+    ]:
+        await db.insert_many(data)
+        results = await MMRRetriever(db, lambda_mult=1).get_similar(query)
+        assert [doc.id for _, doc in results][:2] in (["0", "1"], ["1", "0"])
+        results = await MMRRetriever(db, lambda_mult=0.3).get_similar(query)
+        ids = [doc.id for _, doc in results]
+        assert ids[0] in ("0", "1") and not {"0", "1"} <= set(ids)
+        results = await MMRRetriever(db, max_per_parent=1).get_similar(query)
+        parents = [doc.meta["parent_id"] for _, doc in results]
+        assert len(parents) == len(set(parents)) == 3
+        assert all(isinstance(score, float) for score, _ in results)
+        results = await MMRRetriever(db, lambda_mult=1).get_similar(
+            VectorDBGetSimilar(text="the cat", n_results=3, filter={"parent_id": "p3"})
+        )
+        assert {doc.id for _, doc in results} == {"3", "4"}
+
+
+@pytest.mark.asyncio
+async def test_get_vectors(tmp_path):
+    embedding_model = BagOfWordsEmbedding()
+    db = MmapVectorDB(str(tmp_path / "db"), segment_size=2)
+    vectors = np.random.default_rng(0).normal(size=(5, 8)).astype(np.float32)
+    await db.insert_many(
+        [
+            VectorDBInsert(id=str(i), text=str(i), embedding=vector)
+            for i, vector in enumerate(vectors.tolist())
+        ]
+    )
+    # Cosine databases keep normalized vectors
+    expected = vectors[[4, 0, 3]] / np.linalg.norm(
+        vectors[[4, 0, 3]], axis=1, keepdims=True
+    )
+    assert np.allclose(db.get_vectors(["4", "0", "3"]), expected)
+    assert db.get_vectors([]).shape == (0, 8)
+    with pytest.raises(ValueError):
+        db.get_vectors(["missing"])
+    await db.delete(["0"])
+    with pytest.raises(ValueError):
+        db.get_vectors(["0"])
+
+    # Without full vectors the candidates are embedded again
+    db = IVFPQVectorDB(
+        embedding_model=embedding_model, n_lists=1, n_subvectors=2, train_size=2
+    )
+    await db.insert_many([VectorDBInsert(id=str(i), text=f"doc {i}") for i in range(3)])
+    with pytest.raises(ValueError):
+        db.get_vectors(["0"])
+    calls = embedding_model.num_calls
+    await MMRRetriever(db).get_similar(VectorDBGetSimilar(text="doc 1", n_results=2))
+    assert embedding_model.num_calls > calls
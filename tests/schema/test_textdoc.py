@@ -1,3 +1,5 @@
+import tracemalloc
+
 import pytest
 from embedia import TextDoc
 
@@ -19,3 +21,67 @@ async def test_textdoc():
     for codeblock in codeblocks:
         assert codeblock.meta["parent_id"] == parent_id
         assert codeblock.id != parent_id
+
+
+def test_textdoc_iter_file(tmp_path):
+    path = tmp_path / "doc.txt"
+    text = "first line\n\n  café ünïcode  \nsecond\n\n\n\nthird paragraph\nend"
+    path.write_bytes(text.encode("utf-8"))
+    data = path.read_bytes()
+    expected = TextDoc(contents=text, meta={}).split_on_separator("\n", True)
+    # Tiny blocks put separators and multi-byte characters across block boundaries
+    for block_size in [1, 2, 3, 7, 1 << 20]:
+        docs = list(
+            TextDoc.iter_file(
+                str(path),
+                meta={"source": "doc.txt"},
+                strip_after_split=True,
+                block_size=block_size,
+            )
+        )
+        assert [doc.contents for doc in docs] == [doc.contents for doc in expected]
+        assert [doc.meta["segment_number"] for doc in docs] == [
+            doc.meta["segment_number"] for doc in expected
+        ]
+        assert len({doc.meta["parent_id"] for doc in docs}) == 1
+        for doc in docs:
+            assert doc.meta["source"] == "doc.txt"
+            start, end = doc.meta["start_byte"], doc.meta["end_byte"]
+            assert data[start:end].decode("utf-8") == doc.contents
+
+        paragraphs = list(
+            TextDoc.iter_file(str(path), pattern=r"\n\s*\n", block_size=block_size)
+        )
+        assert [doc.contents for doc in paragraphs] == [
+            "first line",
+            "  café ünïcode  \nsecond",
+            "third paragraph\nend",
+        ]
+        separated = list(
+            TextDoc.iter_file(str(path), separator="\n\n", block_size=block_size)
+        )
+        assert [doc.contents for doc in separated] == [
+            part for part in text.split("\n\n") if part.strip()
+        ]
+
+    path.write_bytes(b"")
+    assert list(TextDoc.iter_file(str(path))) == []
+    with pytest.raises(ValueError):
+        next(TextDoc.iter_file(str(path), separator=""))
+
+
+def test_textdoc_iter_file_memory(tmp_path):
+    path = tmp_path / "big.txt"
+    line = "log line with some words in it\n" * 1000
+    with open(path, "w") as f:
+        for _ in range(50):
+            f.write(line)
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in TextDoc.iter_file(str(path), block_size=1 << 14))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 50000
+    # The file is about 1.5 MB, only a few blocks should be held at a time
+    assert peak < (1 << 19)
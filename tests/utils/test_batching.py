@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+from embedia.utils.batching import MicroBatcher
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+@pytest.mark.asyncio
+async def test_microbatcher():
+    batcher = MicroBatcher(max_batch_size=8, window=0.01)
+    embmodel = BagOfWordsEmbedding(batcher=batcher)
+    texts = [f"text number {i}" for i in range(20)]
+    embeddings = await asyncio.gather(*[embmodel(text) for text in texts])
+    assert embmodel.batch_sizes == [8, 8, 4]
+    assert embeddings == [await BagOfWordsEmbedding()(text) for text in texts]
+    assert batcher.batches == 3
+    assert batcher.mean_batch_size == 20 / 3
+    assert batcher.fill_ratio == 20 / 24
+
+    # A lone call goes out once the window closes
+    await embmodel("one more")
+    assert embmodel.batch_sizes[-1] == 1
+
+    async def fail(items):
+        raise RuntimeError("Backend error")
+
+    results = await asyncio.gather(
+        batcher.run("a", fail), batcher.run("b", fail), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    # Callers do not hang when the dispatch is cancelled
+    async def cancelled(items):
+        raise asyncio.CancelledError
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            batcher.run("a", cancelled),
+            batcher.run("b", cancelled),
+            return_exceptions=True,
+        ),
+        timeout=1,
+    )
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_embedding_batch():
+    embmodel = BagOfWordsEmbedding()
+    texts = [f"text number {i}" for i in range(25)]
+    embeddings = await embmodel.batch(texts, batch_size=10)
+    assert embmodel.batch_sizes == [10, 10, 5]
+    assert embeddings[3] == await embmodel(texts[3])
+    assert await embmodel.batch([]) == []
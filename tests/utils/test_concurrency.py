@@ -0,0 +1,72 @@
+import asyncio
+import itertools
+import time
+
+import pytest
+from embedia import Event, subscribe_event
+from embedia.utils.concurrency import AdaptiveLimiter
+
+from tests.core.definitions import FakeLatencyLLM
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter():
+    events = []
+    subscribe_event(Event.LimiterUpdate, lambda *args: events.append(args[3]))
+
+    limiter = AdaptiveLimiter(initial_limit=2, latency_target=0.05)
+    latency = 0.001
+    llm = FakeLatencyLLM(lambda: latency, limiter=limiter)
+    await llm.batch([f"Prompt {i}" for i in range(40)], max_concurrency=20)
+    assert limiter.limit > 4
+    assert events[-1]["reason"] == "healthy"
+
+    limit = limiter.limit
+    latency = 0.1
+    await llm("Prompt")
+    assert limiter.limit <= limit / 2
+    assert events[-1]["reason"] == "slow"
+
+    limit = limiter.limit
+    latency = None
+    results = await llm.batch(["Prompt"] * 5, max_concurrency=20)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert limiter.limit <= limit / 2
+    assert events[-1]["reason"] == "error"
+
+    # A slot counts like a call, unless it is cancelled
+    limiter = AdaptiveLimiter(initial_limit=8)
+    limit = limiter.limit
+    with pytest.raises(RuntimeError):
+        async with limiter.slot():
+            assert limiter.in_flight == 1
+            raise RuntimeError("Stream broke")
+    assert limiter.in_flight == 0
+    assert limiter.limit < limit
+    limit = limiter.limit
+    with pytest.raises(asyncio.CancelledError):
+        async with limiter.slot():
+            raise asyncio.CancelledError
+    assert limiter.in_flight == 0
+    assert limiter.limit == limit
+
+
+@pytest.mark.asyncio
+async def test_hedged_requests():
+    events = []
+    subscribe_event(Event.LimiterHedge, lambda *args: events.append(args[3]))
+
+    latencies = itertools.chain([0.005] * 20, [1.0], itertools.repeat(0.005))
+    limiter = AdaptiveLimiter(hedge=True, min_samples=20)
+    llm = FakeLatencyLLM(lambda: next(latencies), limiter=limiter)
+    for i in range(20):
+        await llm(f"Prompt {i}")
+    assert limiter.hedges == 0
+
+    start = time.perf_counter()
+    assert await llm("Slow prompt") == "echo: Slow prompt"
+    assert time.perf_counter() - start < 0.5
+    assert llm.num_calls == 22
+    assert limiter.hedges == 1
+    assert limiter.hedge_wins == 1
+    assert events == [{"delay": limiter.percentile(0.95), "winner": "hedge"}]
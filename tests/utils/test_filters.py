@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from embedia.utils.filters import MetadataIndex
+
+
+def test_metadata_index():
+    metas = [
+        {"tenant": "acme", "year": 2019, "tags": ["a", "b"]},
+        {"tenant": "acme", "year": 2021, "flag": True},
+        {"tenant": "initech", "year": 2020.0, "flag": 1},
+        None,
+        {"tenant": "initech", "year": 2023, "tags": ["b"]},
+    ]
+    index = MetadataIndex()
+    for row, meta in enumerate(metas):
+        index.add(row, meta)
+    assert len(index) == 5
+
+    def rows(filter):
+        return np.flatnonzero(index.evaluate(filter)).tolist()
+
+    assert rows({"tenant": "acme"}) == [0, 1]
+    assert rows({"tenant": {"$ne": "acme"}}) == [2, 3, 4]
+    assert rows({"year": {"$gte": 2020, "$lt": 2023}}) == [1, 2]
+    assert rows({"year": {"$gt": 2020}}) == [1, 4]
+    assert rows({"year": {"$lte": 2020}}) == [0, 2]
+    assert rows({"tenant": {"$gt": "b"}}) == [2, 4]
+    assert rows({"tags": "b"}) == [0, 4]
+    assert rows({"tags": {"$in": ["a", "c"]}}) == [0]
+    assert rows({"tenant": {"$nin": ["acme"]}}) == [2, 3, 4]
+    assert rows({"flag": True}) == [1]
+    assert rows({"flag": 1}) == [2]
+    assert rows({"flag": {"$exists": True}}) == [1, 2]
+    assert rows({"$or": [{"tenant": "acme"}, {"year": 2023}]}) == [0, 1, 4]
+    assert rows({"$and": [{"tenant": "initech"}, {"year": {"$gt": 2020}}]}) == [4]
+    assert rows({"$not": {"tenant": "acme"}}) == [2, 3, 4]
+    assert rows({"tenant": "acme", "year": 2021}) == [1]
+
+    # The range index is rebuilt after new rows are added
+    index.add(5, {"year": 2022})
+    assert rows({"year": {"$gt": 2021}}) == [4, 5]
+    assert index.evaluate({"tenant": "acme"}, 3).tolist() == [True, True, False]
+
+    with pytest.raises(ValueError):
+        index.evaluate({"year": {"$regex": "20"}})
+    with pytest.raises(ValueError):
+        index.evaluate({"$xor": []})
+    with pytest.raises(ValueError):
+        index.evaluate({"year": {"$gt": [2020]}})
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from embedia import Priority
+from embedia.utils.scheduler import RateLimitScheduler
+
+from tests.core.definitions import BagOfWordsEmbedding, EchoChatLLM, EchoLLM
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler():
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(
+        requests_per_minute=60, tokens_per_minute=100, clock=clock, sleep=clock.sleep
+    )
+    await scheduler.acquire(60)
+    assert clock.now == 0
+    await scheduler.acquire(60)
+    assert clock.now == pytest.approx(12)
+
+    scheduler.charge(40)
+    served = []
+
+    async def request(name, priority):
+        await scheduler.acquire(50, priority)
+        served.append(name)
+
+    await asyncio.gather(
+        request("batch", Priority.batch), request("interactive", Priority.interactive)
+    )
+    assert served == ["interactive", "batch"]
+
+    with pytest.raises(ValueError):
+        await scheduler.acquire(101)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_models():
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(
+        requests_per_minute=2, clock=clock, sleep=clock.sleep
+    )
+    llm = EchoLLM()
+    llm.scheduler = scheduler
+    chatllm = EchoChatLLM()
+    chatllm.scheduler = scheduler
+    embmodel = BagOfWordsEmbedding()
+    embmodel.scheduler = scheduler
+    await llm("The capital of France is")
+    await chatllm("The capital of France is")
+    assert clock.now == 0
+    await embmodel("The capital of France is")
+    assert clock.now == pytest.approx(30)
+
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(tokens_per_minute=60, clock=clock, sleep=clock.sleep)
+    llm.scheduler = scheduler
+    prompt = " ".join(["word"] * 40)
+    await llm(prompt)
+    await llm(prompt)
+    assert clock.now == pytest.approx(61)
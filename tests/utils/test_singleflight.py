@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from embedia import EmbeddingModel, Tokenizer
+from embedia.utils.singleflight import SingleFlight
+
+from tests.core.definitions import BagOfWordsEmbedding, EchoLLM
+
+
+@pytest.mark.asyncio
+async def test_singleflight():
+    singleflight = SingleFlight()
+    llm1 = EchoLLM()
+    llm2 = EchoLLM()
+    llm1.singleflight = singleflight
+    llm2.singleflight = singleflight
+    results = await asyncio.gather(
+        *[llm1("The capital of France is") for _ in range(5)],
+        *[llm2("The capital of France is") for _ in range(5)],
+        llm1("The capital of Spain is"),
+    )
+    assert results[:10] == ["echo: The capital of France is"] * 10
+    assert results[10] == "echo: The capital of Spain is"
+    assert llm1.num_calls + llm2.num_calls == 2
+    assert singleflight.calls == 2
+    assert singleflight.coalesced == 9
+
+    await llm1("The capital of France is")
+    assert singleflight.calls == 3
+
+    embmodel = BagOfWordsEmbedding(singleflight=SingleFlight())
+    embs = await asyncio.gather(*[embmodel("Hello world") for _ in range(5)])
+    assert embmodel.num_calls == 1
+    assert all(emb == embs[0] for emb in embs)
+
+
+class NoInitEmbedding(EmbeddingModel):
+    # Does not call super().__init__(), which used to take no arguments
+    def __init__(self):
+        pass
+
+    async def _embed(self, input):
+        return [float(len(input))]
+
+
+class NoInitTokenizer(Tokenizer):
+    def __init__(self):
+        pass
+
+    async def _tokenize(self, text):
+        return text.split()
+
+
+@pytest.mark.asyncio
+async def test_subclass_without_super_init():
+    embmodel = NoInitEmbedding()
+    assert await embmodel("Hello world") == [11.0]
+    assert await embmodel.batch(["a", "abc"]) == [[1.0], [3.0]]
+
+    tokenizer = NoInitTokenizer()
+    assert await tokenizer("Hello world") == ["Hello", "world"]
+    assert await tokenizer.count("Hello world") == 2
+    assert await tokenizer.batch(["a b", "c"]) == [["a", "b"], ["c"]]
+    assert not NoInitTokenizer._memo
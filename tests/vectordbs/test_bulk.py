@@ -0,0 +1,57 @@
+import shutil
+
+import numpy as np
+import pytest
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import HNSWVectorDB, IVFPQVectorDB, MmapVectorDB, NumpyVectorDB
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+@pytest.mark.asyncio
+async def test_insert_many_get_similar_many():
+    shutil.rmtree("temp", ignore_errors=True)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    data = [
+        VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+    queries = [
+        VectorDBGetSimilar(embedding=query.tolist(), n_results=k)
+        for k, query in zip([1, 5, 10] * 10, rng.normal(size=(30, 16)))
+    ]
+    for metric in DistanceMetric:
+        dbs = [
+            NumpyVectorDB(metric=metric, initial_capacity=8),
+            HNSWVectorDB(metric=metric, seed=0),
+            IVFPQVectorDB(metric=metric, n_lists=4, n_subvectors=4, train_size=100),
+            MmapVectorDB(f"temp/{metric.value}", metric=metric, segment_size=64),
+        ]
+        for db in dbs:
+            await db.insert_many(data[:150])
+            await db.insert_many(data[150:])
+            assert len(db) == 300
+            with pytest.raises(ValueError):
+                await db.insert_many([data[0]])
+
+            results = await db.get_similar_many(queries)
+            assert [len(result) for result in results] == [q.n_results for q in queries]
+            for query, result in zip(queries, results):
+                single = await db.get_similar(query)
+                assert [doc.id for _, doc in result] == [doc.id for _, doc in single]
+                assert [s for s, _ in result] == pytest.approx(
+                    [s for s, _ in single], rel=1e-4
+                )
+
+    assert await NumpyVectorDB().get_similar_many(queries[:2]) == [[], []]
+    assert await NumpyVectorDB().get_similar_many([]) == []
+
+    db = NumpyVectorDB(embedding_model=BagOfWordsEmbedding())
+    await db.insert_many(
+        [VectorDBInsert(id=str(i), text=f"chunk number {i}") for i in range(20)]
+    )
+    assert db.embedding_model.batch_sizes == [20]
+    results = await db.get_similar_many([VectorDBGetSimilar(text="chunk number 3")])
+    assert results[0][0][1].id == "3"
+    shutil.rmtree("temp")
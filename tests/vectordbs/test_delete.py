@@ -0,0 +1,174 @@
+import asyncio
+import shutil
+
+import numpy as np
+import pytest
+from embedia import VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import HNSWVectorDB, IVFPQVectorDB, MmapVectorDB, NumpyVectorDB
+
+
+def brute_force(vectors, live, query, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = sorted(live)
+    scores = vectors[rows] @ (query / np.linalg.norm(query))
+    return [str(rows[i]) for i in np.argsort(-scores)[:k]]
+
+
+async def check_search(db, vectors, live, queries):
+    searches = [
+        VectorDBGetSimilar(embedding=query.tolist(), n_results=10) for query in queries
+    ]
+    for query, result in zip(queries, await db.get_similar_many(searches)):
+        assert [doc.id for _, doc in result] == brute_force(vectors, live, query, 10)
+    assert len(db) == len(live)
+
+
+@pytest.mark.asyncio
+async def test_delete_upsert_compact():
+    shutil.rmtree("temp", ignore_errors=True)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    data = [
+        VectorDBInsert(
+            id=str(i), text=f"doc {i}", embedding=vector.tolist(), meta={"n": i}
+        )
+        for i, vector in enumerate(vectors)
+    ]
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    dbs = [
+        NumpyVectorDB(),
+        HNSWVectorDB(seed=0),
+        IVFPQVectorDB(n_lists=4, n_subvectors=4, train_size=200, rerank=400),
+        MmapVectorDB("temp/delete", segment_size=64),
+    ]
+    for db in dbs:
+        db.compaction_threshold = 0.3
+        await db.insert_many(data)
+        live = set(range(400))
+        with pytest.raises(ValueError):
+            await db.delete()
+        assert await db.delete(ids=[]) == 0
+
+        assert await db.delete(ids=["0", "1", "1", "missing"]) == 2
+        assert await db.delete(ids=["0"]) == 0
+        assert await db.delete(filter={"n": {"$lt": 50}}) == 48
+        assert await db.delete(ids=["60", "70"], filter={"n": 60}) == 1
+        live -= set(range(50)) | {60}
+        await check_search(db, vectors, live, queries)
+        assert db._compacting is None
+
+        # An upsert replaces the vector and the metadata
+        await db.upsert(
+            VectorDBInsert(
+                id="100", text="moved", embedding=queries[0].tolist(), meta={"n": -1}
+            )
+        )
+        result = await db.get_similar(
+            VectorDBGetSimilar(embedding=queries[0].tolist(), n_results=1)
+        )
+        assert result[0][1].id == "100" and result[0][1].meta == {"n": -1}
+        assert len(db) == len(live)
+        assert not await db.get_similar(
+            VectorDBGetSimilar(embedding=queries[0].tolist(), filter={"n": 100})
+        )
+        await db.upsert_many([data[100], data[5], data[5]])
+        live.add(5)
+        await check_search(db, vectors, live, queries)
+
+        # Passing the threshold compacts in the background
+        assert await db.delete(filter={"n": {"$gte": 300}}) == 100
+        live -= set(range(300, 400))
+        assert db._compacting is not None
+        await db.compact()
+        assert db._compacting is None
+        assert db._n_rows == len(db) == len(live)
+        await check_search(db, vectors, live, queries)
+        await db.insert(data[399])
+        live.add(399)
+        await check_search(db, vectors, live, queries)
+        with pytest.raises(ValueError):
+            await db.insert(data[5])
+
+    shutil.rmtree("temp")
+
+
+@pytest.mark.asyncio
+async def test_delete_persistence(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(100, 8)).astype(np.float32)
+    data = [
+        VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+    queries = rng.normal(size=(3, 8)).astype(np.float32)
+    path = str(tmp_path / "db")
+
+    db = MmapVectorDB(path, segment_size=32)
+    await db.insert_many(data)
+    # Segment rows and buffered rows, then a deleted id that is inserted again
+    await db.delete(ids=["3", "98"])
+    await db.upsert(data[4])
+    live = set(range(100)) - {3, 98}
+    db.close()
+
+    # Replayed from the write-ahead log
+    db = MmapVectorDB(path, segment_size=32)
+    await check_search(db, vectors, live, queries)
+    await db.flush()
+    db.close()
+
+    # Read from the manifest's tombstones
+    db = MmapVectorDB(path, segment_size=32)
+    await check_search(db, vectors, live, queries)
+    await db.delete(ids=["10"])
+    live.remove(10)
+    await db.compact()
+    db.close()
+    db = MmapVectorDB(path, segment_size=32)
+    assert db._n_rows == 97
+    await check_search(db, vectors, live, queries)
+    db.close()
+
+    db = HNSWVectorDB(seed=0)
+    await db.insert_many(data)
+    await db.delete(ids=["3", "4"])
+    await db.upsert(data[4])
+    db.save(str(tmp_path / "hnsw.npz"))
+    db = HNSWVectorDB.load(str(tmp_path / "hnsw.npz"))
+    live = set(range(100)) - {3}
+    await check_search(db, vectors, live, queries)
+    with pytest.raises(ValueError):
+        await db.insert(data[4])
+    await db.insert(data[3])
+
+
+@pytest.mark.asyncio
+async def test_hnsw_compaction_runs_beside_other_calls():
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(1500, 16)).astype(np.float32)
+    data = [
+        VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    db = HNSWVectorDB(seed=0)
+    await db.insert_many(data[:1400])
+    live = set(range(1400))
+    await db.delete(ids=[str(i) for i in range(500)])
+    live -= set(range(500))
+    assert db._compacting is not None
+
+    # The event loop keeps running while the graph is rebuilt in a thread
+    await asyncio.sleep(0)
+    await db.get_similar(VectorDBGetSimilar(embedding=queries[0].tolist()))
+    await db.delete(ids=["600", "601"])
+    await db.insert_many(data[1400:])
+    live = (live - {600, 601}) | set(range(1400, 1500))
+    assert db._compacting is not None
+    await db.compact()
+    assert db._n_rows == 1000 and len(db) == len(live) == 998
+    await check_search(db, vectors, live, queries)
+    await db.compact()
+    assert db._n_rows == len(db) == 998
+    await check_search(db, vectors, live, queries)
@@ -0,0 +1,86 @@
+import shutil
+
+import numpy as np
+import pytest
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import HNSWVectorDB, IVFPQVectorDB, MmapVectorDB, NumpyVectorDB
+
+
+def brute_force(vectors, metas, query, filter_func, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    rows = [i for i, meta in enumerate(metas) if filter_func(meta)]
+    scores = vectors[rows] @ (query / np.linalg.norm(query))
+    return [str(rows[i]) for i in np.argsort(-scores)[:k]]
+
+
+@pytest.mark.asyncio
+async def test_filtered_get_similar():
+    shutil.rmtree("temp", ignore_errors=True)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(400, 16)).astype(np.float32)
+    metas = [{"tenant": f"t{i % 20}", "n": i} for i in range(400)]
+    data = [
+        VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist(), meta=meta)
+        for i, (vector, meta) in enumerate(zip(vectors, metas))
+    ]
+    filters = [
+        # Selective, so pre-filtered
+        ({"tenant": "t3"}, lambda meta: meta["tenant"] == "t3"),
+        # Broad, so post-filtered
+        ({"n": {"$gte": 100}}, lambda meta: meta["n"] >= 100),
+        (
+            {"$or": [{"tenant": "t1"}, {"n": {"$lt": 5}}]},
+            lambda meta: meta["tenant"] == "t1" or meta["n"] < 5,
+        ),
+        ({"tenant": "missing"}, lambda meta: False),
+    ]
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    dbs = [
+        NumpyVectorDB(),
+        HNSWVectorDB(seed=0),
+        IVFPQVectorDB(n_lists=4, n_subvectors=4, train_size=200, rerank=400),
+        MmapVectorDB("temp/filters", segment_size=64),
+    ]
+    for db in dbs:
+        await db.insert_many(data)
+        for filter, filter_func in filters:
+            searches = [
+                VectorDBGetSimilar(
+                    embedding=query.tolist(), n_results=10, filter=filter
+                )
+                for query in queries
+            ]
+            results = await db.get_similar_many(searches)
+            for query, search, result in zip(queries, searches, results):
+                expected = brute_force(vectors, metas, query, filter_func, 10)
+                assert [doc.id for _, doc in result] == expected
+                assert all(filter_func(doc.meta) for _, doc in result)
+                single = await db.get_similar(search)
+                assert [doc.id for _, doc in single] == expected
+
+    # The index of a reopened database is rebuilt from its segments and write-ahead log
+    dbs[-1].close()
+    db = MmapVectorDB("temp/filters", segment_size=64)
+    result = await db.get_similar(
+        VectorDBGetSimilar(embedding=vectors[3].tolist(), filter={"tenant": "t3"})
+    )
+    assert result[0][1].id == "3"
+    assert all(doc.meta["tenant"] == "t3" for _, doc in result)
+    await db.insert(
+        VectorDBInsert(
+            id="new", text="new", embedding=vectors[3].tolist(), meta={"tenant": "t3"}
+        )
+    )
+    result = await db.get_similar(
+        VectorDBGetSimilar(embedding=vectors[3].tolist(), filter={"tenant": "t3"})
+    )
+    assert {doc.id for _, doc in result[:2]} == {"3", "new"}
+
+    db = NumpyVectorDB(metric=DistanceMetric.l2)
+    await db.insert_many(data)
+    with pytest.raises(ValueError):
+        await db.get_similar(
+            VectorDBGetSimilar(embedding=vectors[0].tolist(), filter={"n": {"$re": 1}})
+        )
+    shutil.rmtree("temp")
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from embedia import DistanceMetric, TextDoc, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import NumpyVectorDB
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+@pytest.mark.asyncio
+async def test_numpy_vectordb():
+    embmodel = BagOfWordsEmbedding()
+    db = NumpyVectorDB(embedding_model=embmodel, initial_capacity=2)
+    doc = TextDoc.from_file(
+        "./README.md", meta={"description": "Readme file of Embedia"}
+    )
+    lines = {
+        line.contents: line
+        for line in doc.split_on_separator()
+        if line.contents.strip()
+    }
+    linedocs = list(lines.values())
+    for line in linedocs[:30]:
+        await db.insert(VectorDBInsert(id=line.id, text=line.contents, meta=line.meta))
+    assert len(db) == 30
+
+    query = linedocs[7].contents
+    results = await db.get_similar(VectorDBGetSimilar(text=query, n_results=5))
+    assert len(results) == 5
+    assert results[0][1].id == linedocs[7].id
+    assert results[0][0] == pytest.approx(1.0)
+    assert [r[0] for r in results] == sorted([r[0] for r in results], reverse=True)
+
+    with pytest.raises(ValueError):
+        await db.insert(VectorDBInsert(id=linedocs[0].id, text="duplicate"))
+    with pytest.raises(ValueError):
+        await db.get_similar(VectorDBGetSimilar(embedding=[1.0, 2.0]))
+
+
+@pytest.mark.asyncio
+async def test_numpy_vectordb_metrics():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    query = rng.normal(size=16).astype(np.float32)
+    expected = {
+        DistanceMetric.cosine: (vectors / np.linalg.norm(vectors, axis=1)[:, None])
+        @ (query / np.linalg.norm(query)),
+        DistanceMetric.dot: vectors @ query,
+        DistanceMetric.l2: -np.linalg.norm(vectors - query, axis=1),
+    }
+    for metric, brute_force in expected.items():
+        db = NumpyVectorDB(metric=metric)
+        for i, vector in enumerate(vectors):
+            await db.insert(
+                VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+            )
+        results = await db.get_similar(
+            VectorDBGetSimilar(embedding=query.tolist(), n_results=10)
+        )
+        assert [int(r[1].id) for r in results] == list(np.argsort(-brute_force)[:10])
+        assert results[0][0] == pytest.approx(brute_force.max(), rel=1e-4)
+
+    assert await NumpyVectorDB().get_similar(VectorDBGetSimilar(embedding=[1.0])) == []
@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import HNSWVectorDB, NumpyVectorDB
+
+
+async def recall(db, exact, queries, k=10):
+    found = 0
+    for query in queries:
+        data = VectorDBGetSimilar(embedding=query.tolist(), n_results=k)
+        approx = {doc.id for _, doc in await db.get_similar(data)}
+        found += len(approx & {doc.id for _, doc in await exact.get_similar(data)})
+    return found / (k * len(queries))
+
+
+@pytest.mark.asyncio
+async def test_hnsw_vectordb():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(1000, 32)).astype(np.float32)
+    queries = rng.normal(size=(20, 32)).astype(np.float32)
+    for metric in DistanceMetric:
+        db = HNSWVectorDB(metric=metric, M=8, ef_construction=64, seed=0)
+        exact = NumpyVectorDB(metric=metric)
+        for i, vector in enumerate(vectors):
+            data = VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+            await db.insert(data)
+            await exact.insert(data)
+        assert await recall(db, exact, queries) > 0.9
+
+        results = await db.get_similar(
+            VectorDBGetSimilar(embedding=vectors[3].tolist(), n_results=3)
+        )
+        assert results[0][1].id == "3"
+        assert [r[0] for r in results] == sorted([r[0] for r in results], reverse=True)
+
+    shutil.rmtree("temp", ignore_errors=True)
+    os.makedirs("temp")
+    db.save("temp/index.npz")
+    loaded = HNSWVectorDB.load("temp/index.npz")
+    assert loaded.metric == DistanceMetric.l2
+    assert await recall(loaded, exact, queries) == await recall(db, exact, queries)
+    await loaded.insert(VectorDBInsert(id="new", text="new doc", embedding=[0.0] * 32))
+    results = await loaded.get_similar(
+        VectorDBGetSimilar(embedding=[0.0] * 32, n_results=1)
+    )
+    assert results[0][1].id == "new"
+
+    HNSWVectorDB().save("temp/empty.npz")
+    assert len(HNSWVectorDB.load("temp/empty.npz")) == 0
+    shutil.rmtree("temp")
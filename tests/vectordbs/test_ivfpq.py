@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from embedia import DistanceMetric, VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import IVFPQVectorDB, NumpyVectorDB, ivfpq
+
+from tests.vectordbs.test_hnsw import recall
+
+
+@pytest.mark.asyncio
+async def test_ivfpq_vectordb():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32)) * 4
+    vectors = (
+        centers[rng.integers(20, size=2000)] + rng.normal(size=(2000, 32))
+    ).astype(np.float32)
+    queries = vectors[rng.choice(2000, 20)] + 0.1
+    for metric in DistanceMetric:
+        db = IVFPQVectorDB(
+            metric=metric,
+            n_lists=16,
+            n_subvectors=8,
+            n_probe=4,
+            rerank=50,
+            train_size=1000,
+            seed=0,
+        )
+        exact = NumpyVectorDB(metric=metric)
+        for i, vector in enumerate(vectors):
+            data = VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+            await db.insert(data)
+            await exact.insert(data)
+            if i == 10:
+                # Searched exactly before training
+                assert not db.is_trained
+                assert await recall(db, exact, queries) == 1.0
+        assert db.is_trained
+        assert await recall(db, exact, queries) > 0.8
+
+    db.rerank, db._full = 0, None
+    assert await recall(db, exact, queries) > 0.5
+    results = await db.get_similar(
+        VectorDBGetSimilar(embedding=vectors[5].tolist(), n_results=3)
+    )
+    assert [r[0] for r in results] == sorted([r[0] for r in results], reverse=True)
+
+    with pytest.raises(ValueError):
+        await IVFPQVectorDB(n_subvectors=5).train([[1.0] * 32] * 10)
+
+    # A dimension that n_subvectors does not divide is rejected before anything is inserted
+    db = IVFPQVectorDB(n_lists=2, n_subvectors=16, train_size=20)
+    with pytest.raises(ValueError):
+        await db.insert(VectorDBInsert(id="0", text="0", embedding=[1.0] * 10))
+    assert len(db) == 0 and db.dim is None
+    await db.insert(VectorDBInsert(id="0", text="0", embedding=[1.0] * 32))
+    assert len(db) == 1
+
+
+@pytest.mark.asyncio
+async def test_ivfpq_retrain_without_full_vectors(monkeypatch):
+    sample_sizes = []
+    original_kmeans = ivfpq.kmeans
+
+    def kmeans(vectors, *args, **kwargs):
+        sample_sizes.append(len(vectors))
+        return original_kmeans(vectors, *args, **kwargs)
+
+    monkeypatch.setattr(ivfpq, "kmeans", kmeans)
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    db = IVFPQVectorDB(n_lists=4, n_subvectors=4, n_probe=4, train_size=100, seed=0)
+    await db.insert_many(
+        [
+            VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector)
+            for i, vector in enumerate(vectors.tolist())
+        ]
+    )
+    assert db.is_trained and db._full is None
+    # k-means runs on a sample of train_size vectors, but all 300 are encoded
+    assert set(sample_sizes) == {100}
+    assert sum(len(rows) for rows in db._list_rows) == 300
+    await db.train(vectors[:200].tolist())
+    assert len(db) == 300
+    assert sum(len(rows) for rows in db._list_rows) == 300
+    hits = 0
+    for i in range(0, 300, 30):
+        results = await db.get_similar(
+            VectorDBGetSimilar(embedding=vectors[i].tolist(), n_results=5)
+        )
+        assert len(results) == 5
+        hits += str(i) in {doc.id for _, doc in results}
+    assert hits >= 8
@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+from embedia import VectorDBGetSimilar, VectorDBInsert
+from embedia.vectordbs import MmapVectorDB, NumpyVectorDB
+
+from tests.vectordbs.test_hnsw import recall
+
+
+@pytest.mark.asyncio
+async def test_mmap_vectordb():
+    shutil.rmtree("temp", ignore_errors=True)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(250, 16)).astype(np.float32)
+    queries = rng.normal(size=(10, 16)).astype(np.float32)
+    exact = NumpyVectorDB()
+    db = MmapVectorDB("temp/db", segment_size=40, max_segments=3)
+    for i, vector in enumerate(vectors):
+        data = VectorDBInsert(
+            id=str(i), text=f"doc {i}", meta={"n": i}, embedding=vector.tolist()
+        )
+        await db.insert(data)
+        await exact.insert(data)
+    assert len(db) == 250
+    assert await recall(db, exact, queries) == 1.0
+    with pytest.raises(ValueError):
+        await db.insert(VectorDBInsert(id="3", text="dup", embedding=[1.0] * 16))
+
+    # The last 10 rows were never flushed and come back from the write-ahead log
+    db.close()
+    if db._merging:
+        await db._merging
+    db = MmapVectorDB("temp/db")
+    assert db.segment_size == 10000
+    assert len(db) == 250
+    assert len(db._buffer_docs) == 10
+    assert await recall(db, exact, queries) == 1.0
+    results = await db.get_similar(
+        VectorDBGetSimilar(embedding=vectors[7].tolist(), n_results=1)
+    )
+    assert results[0][1].id == "7"
+    assert results[0][1].meta == {"n": 7}
+
+    # A torn write at the end of the log is ignored
+    db.close()
+    with open("temp/db/wal.jsonl", "a") as f:
+        f.write('{"seq": 999, "doc": {"id"')
+    db = MmapVectorDB("temp/db")
+    assert len(db) == 250
+    data = VectorDBInsert(id="new", text="new doc", embedding=[1.0] * 16)
+    await db.insert(data)
+    await exact.insert(data)
+    db.close()
+    db = MmapVectorDB("temp/db")
+    assert len(db) == 251
+
+    await db.flush()
+    await db.merge()
+    assert len(db._segments) == 1
+    assert len(os.listdir("temp/db")) == 5
+    assert await recall(db, exact, queries) == 1.0
+    db.close()
+    shutil.rmtree("temp")
+
+
+@pytest.mark.asyncio
+async def test_mmap_large_batch(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(35, 8)).astype(np.float32)
+    data = [
+        VectorDBInsert(id=str(i), text=f"doc {i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+    path = str(tmp_path / "db")
+    db = MmapVectorDB(path, segment_size=10, max_segments=8)
+    await db.insert_many(data)
+    # One batch is still split into segments of at most `segment_size` rows
+    assert [segment.count for segment in db._segments] == [10, 10, 10, 5]
+    db.close()
+
+    db = MmapVectorDB(path, segment_size=10, max_segments=8)
+    assert len(db) == 35
+    for i in (0, 17, 34):
+        result = await db.get_similar(
+            VectorDBGetSimilar(embedding=vectors[i].tolist(), n_results=1)
+        )
+        assert result[0][1].id == str(i)
+    db.close()
@@ -0,0 +1,135 @@
+import functools
+
+import numpy as np
+import pytest
+from embedia import VectorDBGetSimilar, VectorDBInsert
+from embedia.utils.exceptions import ShardError
+from embedia.vectordbs import HNSWVectorDB, NumpyVectorDB, ShardedVectorDB
+from embedia.vectordbs.sharded import shard_of
+
+from tests.core.definitions import BagOfWordsEmbedding
+
+
+async def check_search(db, exact, queries, filter=None):
+    searches = [
+        VectorDBGetSimilar(embedding=query.tolist(), n_results=k, filter=filter)
+        for k, query in zip([1, 5, 10], queries)
+    ]
+    results = await db.get_similar_many(searches)
+    for _search, result, expected in zip(
+        searches, results, await exact.get_similar_many(searches)
+    ):
+        assert [doc.id for _, doc in result] == [doc.id for _, doc in expected]
+        assert [s for s, _ in result] == pytest.approx([s for s, _ in expected])
+        assert [doc.meta for _, doc in result] == [doc.meta for _, doc in expected]
+    assert len(db) == len(exact)
+
+
+def test_shard_of():
+    ids = [str(i) for i in range(2000)]
+    before = [shard_of(id, 4) for id in ids]
+    after = [shard_of(id, 5) for id in ids]
+    assert set(before) == {0, 1, 2, 3}
+    # Only the ids that go to the new shard move
+    assert all(a == b or a == 4 for a, b in zip(after, before))
+    assert 300 < after.count(4) < 500
+
+
+@pytest.mark.asyncio
+async def test_sharded_vectordb(monkeypatch):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16)).astype(np.float32)
+    data = [
+        VectorDBInsert(
+            id=str(i), text=f"doc {i}", embedding=vector.tolist(), meta={"n": i % 10}
+        )
+        for i, vector in enumerate(vectors)
+    ]
+    queries = rng.normal(size=(3, 16)).astype(np.float32)
+
+    db = ShardedVectorDB(n_shards=3)
+    exact = NumpyVectorDB()
+    try:
+        await db.insert_many(data[:400])
+        await db.insert(data[400])
+        await db.insert_many(data[401:])
+        await exact.insert_many(data)
+        assert [shard.size for shard in db._shards] == [
+            sum(shard_of(item.id, 3) == no for item in data) for no in range(3)
+        ]
+        await check_search(db, exact, queries)
+        await check_search(db, exact, queries, filter={"n": 3})
+        with pytest.raises(ValueError):
+            await db.insert(data[0])
+
+        assert await db.delete(ids=["1", "2", "missing"]) == 2
+        assert await db.delete(filter={"n": 9}) == 50
+        await exact.delete(ids=["1", "2"])
+        await exact.delete(filter={"n": 9})
+        await db.upsert(data[1])
+        await exact.upsert(data[1])
+        await check_search(db, exact, queries)
+
+        await db.resize(5)
+        await check_search(db, exact, queries)
+        assert len(db._shards) == 5 and sum(s.size for s in db._shards) == len(exact)
+        # A resize that fails while copying leaves every row in its old shard
+        send_rows = db._send_rows
+
+        async def failing_send_rows(*args):
+            await send_rows(*args)
+            raise ShardError("copy failed")
+
+        monkeypatch.setattr(db, "_send_rows", failing_send_rows)
+        with pytest.raises(ShardError, match="copy failed"):
+            await db.resize(2)
+        monkeypatch.undo()
+        assert db.n_shards == 5 and len(db._shards) == 5
+        await check_search(db, exact, queries)
+        await db.resize(2)
+        assert len(db._shards) == 2
+        await check_search(db, exact, queries)
+        assert await db.health() == [True, True]
+
+        db._shards[1].process.kill()
+        db._shards[1].process.join()
+        assert await db.health() == [True, False]
+        with pytest.raises(ShardError):
+            await db.get_similar(VectorDBGetSimilar(embedding=queries[0].tolist()))
+        # Writes that need the stopped shard fail before reaching the others
+        size = db._shards[0].size
+        with pytest.raises(ShardError, match="respawn"):
+            await db.insert_many(
+                [
+                    VectorDBInsert(
+                        id=f"new {i}", text="", embedding=vectors[i].tolist()
+                    )
+                    for i in (1, 2)
+                ]
+            )
+        assert db._shards[0].size == size
+        assert await db.respawn() == [1]
+        assert await db.health() == [True, True]
+        assert db._shards[1].size == 0
+        result = await db.get_similar(
+            VectorDBGetSimilar(embedding=vectors[5].tolist(), n_results=1)
+        )
+        assert len(result) == 1
+    finally:
+        db.close()
+
+    # Texts are embedded in the parent, the shards can be any picklable factory
+    db = ShardedVectorDB(
+        n_shards=2,
+        shard_factory=functools.partial(HNSWVectorDB, seed=0),
+        embedding_model=BagOfWordsEmbedding(),
+    )
+    try:
+        await db.insert_many(
+            [VectorDBInsert(id=str(i), text=f"chunk number {i}") for i in range(20)]
+        )
+        result = await db.get_similar(VectorDBGetSimilar(text="chunk number 3"))
+        assert result[0][1].id == "3"
+        assert len(result) == 5
+    finally:
+        db.close()